@@ -31,7 +31,8 @@ from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 
 from channel import channel_factory
-from common import const
+from common import const, runtime_stats
+from common.session_store import flush_session_stores
 from config import load_config, conf
 from plugins import PluginManager, instance as plugin_instance
 from common.tmp_dir import TmpDir
@@ -213,6 +214,22 @@ def check_dify_api_status():
         return {"success": False, "message": f"检查失败: {str(e)}"}
 
 # ================ 微信服务管理相关 ================
+_gewechat_client = None
+_gewechat_client_lock = threading.Lock()
+
+
+def get_gewechat_client(base_url, token):
+    """获取共用的gewechat客户端，复用连接池，base_url或token变化时重新创建"""
+    global _gewechat_client
+    from lib.gewechat.client import GewechatClient
+    with _gewechat_client_lock:
+        client = _gewechat_client
+        if client is None or client.base_url != base_url or client.token != token:
+            client = GewechatClient(base_url, token)
+            _gewechat_client = client
+        return client
+
+
 def check_gewechat_online():
     """检查gewechat用户是否在线
     Returns:
@@ -228,8 +245,7 @@ def check_gewechat_online():
         if not all([base_url, token, app_id]):
             return False, "gewechat配置不完整"
 
-        from lib.gewechat.client import GewechatClient
-        client = GewechatClient(base_url, token)
+        client = get_gewechat_client(base_url, token)
         online_status = client.check_online(app_id)
         
         if not online_status:
@@ -253,12 +269,11 @@ def get_gewechat_profile():
             logger.info(f"Gewechat状态检查: {error_msg}")
             return None, None
             
-        from lib.gewechat.client import GewechatClient
         base_url = conf().get("gewechat_base_url")
         token = conf().get("gewechat_token")
         app_id = conf().get("gewechat_app_id")
         
-        client = GewechatClient(base_url, token)
+        client = get_gewechat_client(base_url, token)
         profile = client.get_profile(app_id)
         
         if not profile or 'data' not in profile:
@@ -323,11 +338,20 @@ def start_channel(channel_name: str):
         _plugin_manager.load_plugins()
     channel.startup()
 
+def handle_stop_signal(signum, frame):
+    """bot进程被停止或重启时，先写入未保存的会话再退出"""
+    flush_session_stores()
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
 def run_bot():
     """运行机器人服务"""
     try:
         # 加载配置
         load_config()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, handle_stop_signal)
+        runtime_stats.start()
         # 创建通道
         channel_name = conf().get("channel_type", "wx")
         
@@ -448,14 +472,13 @@ def logout_gewechat():
             return False, "非gewechat或不在线，无需退出登录"
 
         # 调用 gewechat 退出接口
-        from lib.gewechat.client import GewechatClient
         base_url = conf().get("gewechat_base_url")
         token = conf().get("gewechat_token")
         app_id = conf().get("gewechat_app_id")
         if not all([base_url, token, app_id]):
             return False, "gewechat配置不完整，无法退出登录"
         
-        client = GewechatClient(base_url, token)
+        client = get_gewechat_client(base_url, token)
         result = client.logout(app_id)
         
         if not result or result.get('ret') != 200:
@@ -685,7 +708,6 @@ def update_friend_list():
             logger.warning("当前渠道不支持此功能")
             return False
         
-        from lib.gewechat.client import GewechatClient
         
         try:
             base_url = conf().get("gewechat_base_url")
@@ -697,7 +719,7 @@ def update_friend_list():
                 return False
             
             logger.info(f"开始更新好友列表: base_url={base_url}, app_id={app_id}")
-            client = GewechatClient(base_url, token)
+            client = get_gewechat_client(base_url, token)
             
             # 获取好友列表
             logger.info("获取联系人列表...")
@@ -801,7 +823,6 @@ def update_group_list():
             logger.warning("当前渠道不支持此功能")
             return False
         
-        from lib.gewechat.client import GewechatClient
         
         try:
             base_url = conf().get("gewechat_base_url")
@@ -813,7 +834,7 @@ def update_group_list():
                 return False
             
             logger.info(f"开始更新群组列表: base_url={base_url}, app_id={app_id}")
-            client = GewechatClient(base_url, token)
+            client = get_gewechat_client(base_url, token)
             
             # 获取群聊列表
             logger.info("获取联系人列表...")
@@ -942,7 +963,6 @@ def send_message(receiver_name, group_name, message):
         if conf().get("channel_type") != "gewechat":
             return False, "非gewechat，不支持发送消息"
         
-        from lib.gewechat.client import GewechatClient
         base_url = conf().get("gewechat_base_url")
         token = conf().get("gewechat_token")
         app_id = conf().get("gewechat_app_id")
@@ -950,7 +970,7 @@ def send_message(receiver_name, group_name, message):
         if not all([base_url, token, app_id]):
             return False, "gewechat配置不完整"
         
-        client = GewechatClient(base_url, token)
+        client = get_gewechat_client(base_url, token)
         
         # 读取缓存的通讯录文件
         tmp_dir = TmpDir().path()
@@ -1295,7 +1315,11 @@ def get_status():
         "nickname": nickname,
         "avatar_path": avatar_path,
         "qrcode_path": get_qrcode_image() if not is_online else None,
-        "channel_type": conf().get("channel_type")
+        "channel_type": conf().get("channel_type"),
+        # bot进程定期写入的后端熔断状态
+        "circuit_breakers": runtime_stats.load().get("circuit_breakers", []) if is_running else [],
+        # 会话内存占用和淘汰次数
+        "session_memory": runtime_stats.load().get("session_memory", {}) if is_running else {}
     }
     
     return jsonify(status_data)
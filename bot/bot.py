@@ -15,3 +15,19 @@ class Bot(object):
         :return: reply content
         """
         raise NotImplementedError
+
+    def prefetch_image(self, context: Context):
+        """
+        收到图片消息后调用，支持图片识别的bot可在后台提前下载并上传图片，
+        图片保存在memory.USER_IMAGE_CACHE中，默认不做处理
+        :param context: 图片消息的context
+        """
+        pass
+
+    def get_reply_cache_scope(self, context: Context):
+        """
+        回复缓存的作用域，如应用标识，相同作用域内相同的问题共用缓存的回复
+        只有无状态的请求可以缓存，默认返回None表示不缓存
+        :param context: 文字消息的context
+        """
+        return None
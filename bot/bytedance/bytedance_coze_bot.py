@@ -12,7 +12,9 @@ from bridge.reply import Reply, ReplyType
 from common.log import logger
 from config import conf
 from common import memory
-from common.utils import parse_markdown_text
+from common.bulkhead import Bulkhead
+from common.upload_cache import UploadCache
+from common.utils import compress_image_file, parse_markdown_text
 from common.tmp_dir import TmpDir
 from cozepy import MessageType,Message
 
@@ -32,6 +34,10 @@ class ByteDanceCozeBot(Bot):
             logger.error("[COZE] coze_bot_id is not set")
             raise Exception("coze_bot_id is not set")
         self.coze_bot_id = coze_bot_id
+        # 按内容哈希缓存上传过的图片，相同的图片不重复上传
+        self.upload_cache = UploadCache("coze_upload", conf().get("coze_upload_cache_ttl", 86400))
+        # 收到图片后在后台下载并上传的线程池
+        self.upload_pool = Bulkhead("coze_upload", conf().get("image_prefetch_workers", 2))
 
     def reply(self, query, context: Context = None):
         # acquire reply content
@@ -170,10 +176,17 @@ class ByteDanceCozeBot(Bot):
         if not img_cache or not conf().get("image_recognition"):
             return None
         coze_client = CozeClient(self.coze_api_key, self.coze_api_base)
-        msg = img_cache.get("msg")
-        path = img_cache.get("path")
-        msg.prepare()
-        file = coze_client.file_upload(path)
+        file = None
+        future = img_cache.get("upload_future")
+        if future is not None:
+            # 收到图片时已开始后台上传，等待结果即可
+            try:
+                file = future.result(timeout=conf().get("image_prefetch_timeout", 60))
+            except Exception as e:
+                logger.warning(f"[COZE] prefetch image upload failed: {e}")
+        if file is None:
+            # 未预上传或预上传失败，同步上传
+            file = self._prepare_and_upload(img_cache.get("msg"), img_cache.get("path"))
         # 清理图片缓存
         memory.USER_IMAGE_CACHE[session_id] = None
 
@@ -181,6 +194,20 @@ class ByteDanceCozeBot(Bot):
         additional_messages.append(coze_client.create_message(file))
         return additional_messages
 
+    def prefetch_image(self, context: Context):
+        """收到图片后立即在后台下载、压缩并上传到coze，用户随后提问时只需等待已经开始的上传结果"""
+        img_cache = memory.USER_IMAGE_CACHE.get(context["session_id"])
+        if not img_cache or not conf().get("image_recognition"):
+            return
+        img_cache["upload_future"] = self.upload_pool.submit(self._prepare_and_upload, img_cache["msg"], img_cache["path"])
+
+    def _prepare_and_upload(self, msg, path):
+        msg.prepare()
+        path = compress_image_file(path, conf().get("image_upload_max_size", 0))
+        coze_client = CozeClient(self.coze_api_key, self.coze_api_base)
+        # coze上传的文件归属于api_key对应的账号，按(api_base, api_key)缓存
+        return self.upload_cache.get_or_upload(path, (self.coze_api_base, self.coze_api_key), coze_client.file_upload)
+
     def _fill_file_base_url(self, url: str):
         if url.startswith("https://") or url.startswith("http://"):
             return url
@@ -1,4 +1,4 @@
-from common.expired_dict import ExpiredDict
+from common.session_store import build_session_dict
 from config import conf
 from common.log import logger
 
@@ -65,11 +65,7 @@ class CozeSession(object):
 
 class CozeSessionManager(object):
     def __init__(self, sessioncls, **session_args):
-        if conf().get("expires_in_seconds"):
-            sessions = ExpiredDict(conf().get("expires_in_seconds"))
-        else:
-            sessions = dict()
-        self.sessions = sessions
+        self.sessions = build_session_dict(sessioncls.__name__)
         self.sessioncls = sessioncls
         self.session_args = session_args
 
@@ -14,8 +14,10 @@ from bot.openai.open_ai_vision import OpenAIVision
 from bot.session_manager import SessionManager
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
+from common.circuit_breaker import report_failure
+from common.concurrency_limiter import report_overload
 from common.log import logger
-from common.token_bucket import TokenBucket
+from common.token_bucket import build_token_bucket
 from common import memory, utils, const
 from config import conf, load_config
 from bot.baidu.baidu_wenxin_session import BaiduWenxinSession
@@ -32,7 +34,7 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
         if proxy:
             openai.proxy = proxy
         if conf().get("rate_limit_chatgpt"):
-            self.tb4chatgpt = TokenBucket(conf().get("rate_limit_chatgpt", 20))
+            self.tb4chatgpt = build_token_bucket("chatgpt", conf().get("rate_limit_chatgpt", 20))
         conf_model = conf().get("model") or "gpt-3.5-turbo"
         self.sessions = SessionManager(ChatGPTSession, model=conf().get("model") or "gpt-3.5-turbo")
         # o1相关模型不支持system prompt，暂时用文心模型的session
@@ -189,22 +191,29 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
             result = {"completion_tokens": 0, "content": "我现在有点累了，等会再来吧"}
             if isinstance(e, openai.error.RateLimitError):
                 logger.warn("[CHATGPT] RateLimitError: {}".format(e))
+                report_overload()
                 result["content"] = "提问太快啦，请休息一下再问我吧"
                 if need_retry:
                     time.sleep(20)
             elif isinstance(e, openai.error.Timeout):
                 logger.warn("[CHATGPT] Timeout: {}".format(e))
+                report_overload()
                 result["content"] = "我没有收到你的消息"
+                # 后端已熔断时不再等待重试，立即释放处理线程
+                need_retry = not report_failure() and need_retry
                 if need_retry:
                     time.sleep(5)
             elif isinstance(e, openai.error.APIError):
                 logger.warn("[CHATGPT] Bad Gateway: {}".format(e))
+                report_overload()
                 result["content"] = "请再问我一次"
+                need_retry = not report_failure() and need_retry
                 if need_retry:
                     time.sleep(10)
             elif isinstance(e, openai.error.APIConnectionError):
                 logger.warn("[CHATGPT] APIConnectionError: {}".format(e))
                 result["content"] = "我连接不到你的网络"
+                need_retry = not report_failure() and need_retry
                 if need_retry:
                     time.sleep(5)
             else:
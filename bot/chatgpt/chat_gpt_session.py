@@ -1,6 +1,10 @@
+import functools
+import math
+
 from bot.session_manager import Session
 from common.log import logger
 from common import const
+from config import conf
 
 """
     e.g.  [
@@ -16,12 +20,18 @@ class ChatGPTSession(Session):
     def __init__(self, session_id, system_prompt=None, model="gpt-3.5-turbo"):
         super().__init__(session_id, system_prompt)
         self.model = model
+        # 与messages一一对应的[消息, 估算token数, 精确token数]，每条消息只估算/编码一次
+        # estimated_sum、exact_sum为累计值，exact_missing为尚未精确计算的消息数
+        self.token_counts = []
+        self.estimated_sum = 0
+        self.exact_sum = 0
+        self.exact_missing = 0
         self.reset()
 
     def discard_exceeding(self, max_tokens, cur_tokens=None):
         precise = True
         try:
-            cur_tokens = self.calc_tokens()
+            cur_tokens = self.count_tokens(max_tokens)
         except Exception as e:
             precise = False
             if cur_tokens is None:
@@ -29,11 +39,11 @@ class ChatGPTSession(Session):
             logger.debug("Exception when counting tokens precisely for query: {}".format(e))
         while cur_tokens > max_tokens:
             if len(self.messages) > 2:
-                self.messages.pop(1)
+                discarded = self._pop_message(1)
             elif len(self.messages) == 2 and self.messages[1]["role"] == "assistant":
-                self.messages.pop(1)
+                discarded = self._pop_message(1)
                 if precise:
-                    cur_tokens = self.calc_tokens()
+                    cur_tokens -= discarded
                 else:
                     cur_tokens = cur_tokens - max_tokens
                 break
@@ -44,56 +54,174 @@ class ChatGPTSession(Session):
                 logger.debug("max_tokens={}, total_tokens={}, len(messages)={}".format(max_tokens, cur_tokens, len(self.messages)))
                 break
             if precise:
-                cur_tokens = self.calc_tokens()
+                cur_tokens -= discarded
             else:
                 cur_tokens = cur_tokens - max_tokens
         return cur_tokens
 
+    def count_tokens(self, max_tokens):
+        """
+        估算值与max_tokens相差超过token_estimate_margin时直接返回估算值，
+        接近上限时才用tiktoken精确计算，没有tiktoken时使用估算值
+        """
+        estimated = self.estimate_tokens()
+        if estimated < max_tokens * (1 - conf().get("token_estimate_margin", 0.2)):
+            return estimated
+        try:
+            return self.calc_tokens()
+        except Exception as e:
+            logger.debug("Exception when counting tokens precisely, use estimated tokens: {}".format(e))
+            return estimated
+
+    def estimate_tokens(self):
+        self._sync_token_counts()
+        return self.estimated_sum + _message_overhead(self.model)[2]
+
     def calc_tokens(self):
-        return num_tokens_from_messages(self.messages, self.model)
+        if get_token_encoding(self.model) is None:
+            return self.estimate_tokens()  # 没有tiktoken编码的模型只能估算
+        self._sync_token_counts()
+        if self.exact_missing:
+            for entry in self.token_counts:
+                if entry[2] is None:
+                    entry[2] = num_tokens_from_message(entry[0], self.model)
+                    self.exact_sum += entry[2]
+                    self.exact_missing -= 1
+        return self.exact_sum + _message_overhead(self.model)[2]
 
+    def _sync_token_counts(self):
+        """只为新增的消息估算token数，messages被外部修改时按消息对象重新对齐"""
+        counts = self.token_counts
+        n = len(counts)
+        if n > len(self.messages) or (n and (self.messages[0] is not counts[0][0] or self.messages[n - 1] is not counts[-1][0])):
+            # 如reset、删除system消息等，已计算过的消息复用原有结果
+            known = {id(entry[0]): entry for entry in counts}
+            self.token_counts = []
+            self.estimated_sum = self.exact_sum = self.exact_missing = 0
+            for message in self.messages:
+                entry = known.get(id(message))
+                self._append_count(entry if entry is not None else [message, estimate_message_tokens(message, self.model), None])
+            return
+        for message in self.messages[n:]:
+            self._append_count([message, estimate_message_tokens(message, self.model), None])
 
-# refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
-def num_tokens_from_messages(messages, model):
-    """Returns the number of tokens used by a list of messages."""
+    def _append_count(self, entry):
+        self.token_counts.append(entry)
+        self.estimated_sum += entry[1]
+        if entry[2] is None:
+            self.exact_missing += 1
+        else:
+            self.exact_sum += entry[2]
 
+    def _pop_message(self, index):
+        """删除一条消息，返回其token数(已精确计算时返回精确值)；尚未计算时返回0"""
+        message = self.messages.pop(index)
+        if index < len(self.token_counts) and self.token_counts[index][0] is message:
+            _, estimated, exact = self.token_counts.pop(index)
+            self.estimated_sum -= estimated
+            if exact is None:
+                self.exact_missing -= 1
+                return estimated
+            self.exact_sum -= exact
+            return exact
+        return 0
+
+
+def _token_model(model):
     if model in ["wenxin", "xunfei"] or model.startswith(const.GEMINI):
-        return num_tokens_by_character(messages)
+        return None
+    if model in ["gpt-4", "gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0613", "gpt-3.5-turbo-0613",
+                 "gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613", "gpt-35-turbo-16k", "gpt-4-turbo-preview",
+                 "gpt-4-1106-preview", const.GPT4_TURBO_PREVIEW, const.GPT4_VISION_PREVIEW, const.GPT4_TURBO_01_25,
+                 const.GPT_4o, const.GPT_4O_0806, const.GPT_4o_MINI, const.LINKAI_4o, const.LINKAI_4_TURBO]:
+        return "gpt-4"
+    # claude-3、moonshot及其他未适配的模型都按gpt-3.5-turbo计算
+    return "gpt-3.5-turbo"
+
+
+def _message_overhead(model):
+    """返回(每条消息的额外token数, name字段的额外token数, 回复的额外token数)，没有tiktoken编码的模型只计算内容"""
+    token_model = _token_model(model)
+    if token_model is None:
+        return 0, 0, 0
+    # every message follows <|start|>{role/name}\n{content}<|end|>\n; if there's a name, the role is omitted
+    # every reply is primed with <|start|>assistant<|message|>
+    if token_model == "gpt-3.5-turbo":
+        return 4, -1, 3
+    return 3, 1, 3
 
+
+@functools.lru_cache(maxsize=None)
+def get_token_encoding(model):
+    """
+    返回模型对应的(tiktoken编码器, 每条消息的额外token数, name字段的额外token数)
+    没有tiktoken编码的模型返回None，每个模型只解析一次编码器
+    """
+    token_model = _token_model(model)
+    if token_model is None:
+        return None
     import tiktoken
 
-    if model in ["gpt-3.5-turbo-0301", "gpt-35-turbo", "gpt-3.5-turbo-1106", "moonshot", const.LINKAI_35]:
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
-    elif model in ["gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0613", "gpt-3.5-turbo-0613",
-                   "gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613", "gpt-35-turbo-16k", "gpt-4-turbo-preview",
-                   "gpt-4-1106-preview", const.GPT4_TURBO_PREVIEW, const.GPT4_VISION_PREVIEW, const.GPT4_TURBO_01_25,
-                   const.GPT_4o, const.GPT_4O_0806, const.GPT_4o_MINI, const.LINKAI_4o, const.LINKAI_4_TURBO]:
-        return num_tokens_from_messages(messages, model="gpt-4")
-    elif model.startswith("claude-3"):
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        logger.debug("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    if model == "gpt-3.5-turbo":
-        tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
-        tokens_per_name = -1  # if there's a name, the role is omitted
-    elif model == "gpt-4":
-        tokens_per_message = 3
-        tokens_per_name = 1
-    else:
-        logger.debug(f"num_tokens_from_messages() is not implemented for model {model}. Returning num tokens assuming gpt-3.5-turbo.")
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
+    tokens_per_message, tokens_per_name, _ = _message_overhead(model)
+    return tiktoken.encoding_for_model(token_model), tokens_per_message, tokens_per_name
+
+
+# 按字符类别估算token数的系数(每个非ASCII字符如汉字, 每个ASCII字符)，
+# 用tests/benchmarks/bench_token_estimate.py中的中英文群聊语料对照cl100k_base拟合，
+# 没有tiktoken编码的模型(文心、讯飞、gemini)暂时也使用该系数
+TOKEN_ESTIMATE_RATIOS = (1.15, 0.22)
+
+
+def estimate_text_tokens(text):
+    """按非ASCII字符(汉字等)和ASCII字符的数量估算token数，不需要tiktoken，结果向上取整"""
+    if not isinstance(text, str):
+        text = str(text)
+    non_ascii_ratio, ascii_ratio = TOKEN_ESTIMATE_RATIOS
+    chars = len(text)
+    if text.isascii():
+        return math.ceil(chars * ascii_ratio)
+    # 汉字在UTF-8中占3个字节，由编码后的长度得到非ASCII字符数，比逐字符判断快得多
+    non_ascii = (len(text.encode("utf-8")) - chars) / 2
+    return math.ceil(non_ascii * non_ascii_ratio + (chars - non_ascii) * ascii_ratio)
+
+
+def estimate_message_tokens(message, model):
+    tokens_per_message, tokens_per_name, _ = _message_overhead(model)
+    if _token_model(model) is None:
+        return estimate_text_tokens(message["content"])
+    num_tokens = tokens_per_message
+    for key, value in message.items():
+        num_tokens += estimate_text_tokens(value)
+        if key == "name":
+            num_tokens += tokens_per_name
+    return num_tokens
+
+
+def num_tokens_from_message(message, model):
+    """Returns the number of tokens used by a single message."""
+    counter = get_token_encoding(model)
+    if counter is None:
+        return estimate_message_tokens(message, model)
+    encoding, tokens_per_message, tokens_per_name = counter
+    num_tokens = tokens_per_message
+    for key, value in message.items():
+        num_tokens += len(encoding.encode(value))
+        if key == "name":
+            num_tokens += tokens_per_name
+    return num_tokens
+
+
+def num_tokens_for_reply(model):
+    return _message_overhead(model)[2]
+
+
+# refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
+def num_tokens_from_messages(messages, model):
+    """Returns the number of tokens used by a list of messages."""
     num_tokens = 0
     for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += tokens_per_name
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-    return num_tokens
+        num_tokens += num_tokens_from_message(message, model)
+    return num_tokens + num_tokens_for_reply(model)
 
 
 def num_tokens_by_character(messages):
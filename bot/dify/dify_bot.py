@@ -3,29 +3,73 @@ import io
 import os
 import mimetypes
 import threading
+import time
 import json
 
 
 import requests
 from urllib.parse import urlparse, unquote
+from urllib3.exceptions import NewConnectionError
 
 from bot.bot import Bot
-from lib.dify.dify_client import DifyClient, ChatClient
+from lib.dify.dify_client import ClientRegistry
+from lib.dify.endpoint_pool import Endpoint, EndpointPool
 from bot.dify.dify_session import DifySession, DifySessionManager
 from bridge.context import ContextType, Context
 from bridge.reply import Reply, ReplyType
 from common.log import logger
 from common import const, memory
-from common.utils import parse_markdown_text, print_red
+from common.bulkhead import Bulkhead
+from common.circuit_breaker import is_transport_error, report_failure
+from common.concurrency_limiter import report_overload
+from common.stream_segmenter import StreamSegmenter
+from common.upload_cache import UploadCache
+from common.utils import compress_image_file, parse_markdown_text, print_red
 from common.tmp_dir import TmpDir
 from config import conf
 
 UNKNOWN_ERROR_MSG = "我暂时遇到了一些问题，请您稍后重试~"
+# dify尚未处理请求就返回的状态码，可以换一个节点重试
+RETRYABLE_STATUS_CODES = (429, 502, 503)
+
+_client_registry = None
+_client_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> ClientRegistry:
+    """进程内所有DifyBot共用的客户端注册表，按应用复用连接池"""
+    global _client_registry
+    with _client_registry_lock:
+        if _client_registry is None:
+            connect_timeout = conf().get("dify_connect_timeout", 10)
+            read_timeout = conf().get("dify_read_timeout", 0) or None
+            _client_registry = ClientRegistry(
+                pool_size=conf().get("dify_http_pool_size", 10),
+                timeout=(connect_timeout, read_timeout),
+                keep_alive=conf().get("dify_http_keep_alive", True),
+            )
+        return _client_registry
+
 
 class DifyBot(Bot):
     def __init__(self):
         super().__init__()
         self.sessions = DifySessionManager(DifySession, model=conf().get("model", const.DIFY))
+        self.clients = get_client_registry()
+        self.endpoint_pools = {}  # 节点配置 -> EndpointPool
+        self.endpoint_pools_lock = threading.Lock()
+        # 按内容哈希缓存上传过的图片，相同的图片不重复上传
+        self.upload_cache = UploadCache("dify_upload", conf().get("dify_upload_cache_ttl", 86400))
+        # 下载回答中图片和文件的线程池
+        self.media_pool = Bulkhead("dify_media", conf().get("dify_media_download_workers", 4))
+        # 收到图片后在后台下载并上传的线程池
+        self.upload_pool = Bulkhead("dify_upload", conf().get("image_prefetch_workers", 2))
+
+    def get_client_stats(self):
+        return self.clients.stats()
+
+    def get_endpoint_stats(self):
+        return [stats for pool in list(self.endpoint_pools.values()) for stats in pool.stats()]
 
     def reply(self, query, context: Context=None):
         # acquire reply content
@@ -34,32 +78,15 @@ class DifyBot(Bot):
                 query = conf().get('image_create_prefix', ['画'])[0] + query
             logger.info("[DIFY] query={}".format(query))
             session_id = context["session_id"]
-            # TODO: 适配除微信以外的其他channel
             channel_type = conf().get("channel_type", "wx")
-            user = None
-            if channel_type in ["wx", "wework", "gewechat"]:
-                user = context["msg"].other_user_nickname if context.get("msg") else "default"
-            elif channel_type in ["wechatcom_app", "wechatmp", "wechatmp_service", "wechatcom_service", "web"]:
-                user = context["msg"].other_user_id if context.get("msg") else "default"
-            else:
+            user = self._get_user(context)
+            if user is None:
                 return Reply(ReplyType.ERROR, f"unsupported channel type: {channel_type}, now dify only support wx, wechatcom_app, wechatmp, wechatmp_service channel")
             logger.debug(f"[DIFY] dify_user={user}")
-            user = user if user else "default" # 防止用户名为None，当被邀请进的群未设置群名称时用户名为None
             session = self.sessions.get_session(session_id, user)
-            if context.get("isgroup", False):
-                # 群聊：根据是否是共享会话群来决定是否设置用户信息
-                if not context.get("is_shared_session_group", False):
-                    # 非共享会话群：设置发送者信息
-                    session.set_user_info(context["msg"].actual_user_id, context["msg"].actual_user_nickname)
-                else:
-                    # 共享会话群：不设置用户信息
-                    session.set_user_info('', '')
-                # 设置群聊信息
-                session.set_room_info(context["msg"].other_user_id, context["msg"].other_user_nickname)
-            else:
-                # 私聊：使用发送者信息作为用户信息，房间信息留空
-                session.set_user_info(context["msg"].other_user_id, context["msg"].other_user_nickname)
-                session.set_room_info('', '')
+            user_id, user_name, room_id, room_name = self._get_user_room_info(context)
+            session.set_user_info(user_id, user_name)
+            session.set_room_info(room_id, room_name)
 
             # 打印设置的session信息
             logger.debug(f"[DIFY] Session user and room info - user_id: {session.get_user_id()}, user_name: {session.get_user_name()}, room_id: {session.get_room_id()}, room_name: {session.get_room_name()}")
@@ -67,6 +94,8 @@ class DifyBot(Bot):
 
             reply, err = self._reply(query, session, context)
             if err != None:
+                # 错误提示不进入回复缓存
+                context["reply_cache_bypass"] = True
                 dify_error_reply = conf().get("dify_error_reply", None)
                 error_msg = dify_error_reply if dify_error_reply else err
                 reply = Reply(ReplyType.TEXT, error_msg)
@@ -75,16 +104,80 @@ class DifyBot(Bot):
             reply = Reply(ReplyType.ERROR, "Bot不支持处理{}类型的消息".format(context.type))
             return reply
 
+    def get_reply_cache_scope(self, context: Context):
+        """
+        工作流是无状态的，可以缓存；其他类型的应用只有会话还没有conversation_id时才能缓存
+        非工作流应用的inputs带有用户和群聊信息，作用域中包含这些信息，不同用户或群聊不共用缓存
+        """
+        dify_app_type = self._get_dify_conf(context, "dify_app_type", 'chatbot')
+        if dify_app_type == 'workflow':
+            return self._get_endpoint_pool(context).key, dify_app_type
+        if context.get("msg") is None:
+            return None
+        session = self.sessions.sessions.get(context["session_id"])
+        if session and (session.get_conversation_id() or session.get_rollover_context()):
+            return None
+        return self._get_endpoint_pool(context).key, dify_app_type, self._get_user_room_info(context)
+
+    def _get_user_room_info(self, context: Context):
+        """返回作为inputs发送给dify的(user_id, user_name, room_id, room_name)"""
+        msg = context["msg"]
+        if context.get("isgroup", False):
+            # 群聊：非共享会话群设置发送者信息，共享会话群不设置用户信息
+            if not context.get("is_shared_session_group", False):
+                return msg.actual_user_id, msg.actual_user_nickname, msg.other_user_id, msg.other_user_nickname
+            return '', '', msg.other_user_id, msg.other_user_nickname
+        # 私聊：使用发送者信息作为用户信息，房间信息留空
+        return msg.other_user_id, msg.other_user_nickname, '', ''
+
+    def _get_user(self, context: Context):
+        """dify的终端用户标识，channel不支持时返回None"""
+        # TODO: 适配除微信以外的其他channel
+        channel_type = conf().get("channel_type", "wx")
+        user = None
+        if channel_type in ["wx", "wework", "gewechat"]:
+            user = context["msg"].other_user_nickname if context.get("msg") else "default"
+        elif channel_type in ["wechatcom_app", "wechatmp", "wechatmp_service", "wechatcom_service", "web"]:
+            user = context["msg"].other_user_id if context.get("msg") else "default"
+        else:
+            return None
+        return user if user else "default" # 防止用户名为None，当被邀请进的群未设置群名称时用户名为None
+
+    def prefetch_image(self, context: Context):
+        """收到图片后立即在后台下载、压缩并上传到dify，用户随后提问时只需等待已经开始的上传结果"""
+        img_cache = memory.USER_IMAGE_CACHE.get(context["session_id"])
+        if not img_cache or not self._get_dify_conf(context, "image_recognition", False):
+            return
+        user = self._get_user(context)
+        if user is None:
+            return
+        # 使用会话创建时的用户和会话固定的节点，与_get_upload_files中的上传目标保持一致
+        session = self.sessions.get_session(context["session_id"], user)
+        endpoint = self._select_endpoint(session, context)
+        target = (endpoint.api_base, endpoint.api_key, session.get_user())
+        img_cache["upload_target"] = target
+        img_cache["upload_future"] = self.upload_pool.submit(
+            self._prepare_and_upload, img_cache["msg"], img_cache["path"], target, self.clients.get(endpoint.api_key, endpoint.api_base))
+
     # TODO: delete this function
     def _get_payload(self, query, session: DifySession, response_mode):
         # 输入的变量参考 wechat-assistant-pro：https://github.com/leochen-g/wechat-assistant-pro/issues/76
+        inputs = {
+            'user_id': session.get_user_id(),
+            'user_name': session.get_user_name(),
+            'room_id': session.get_room_id(),
+            'room_name': session.get_room_name()
+        }
+        rollover_context = session.get_rollover_context()
+        if rollover_context and not session.get_conversation_id():
+            # 滚动开启的新会话，通过指定的输入变量或在问题前附上最近几轮问答
+            input_name = conf().get("dify_conversation_rollover_input", "")
+            if input_name:
+                inputs[input_name] = rollover_context
+            else:
+                query = f"以下是我们之前对话的最近几轮：\n{rollover_context}\n\n请结合上文回答：{query}"
         return {
-            'inputs': {
-                'user_id': session.get_user_id(),
-                'user_name': session.get_user_name(),
-                'room_id': session.get_room_id(),
-                'room_name': session.get_room_name()
-            },
+            'inputs': inputs,
             "query": query,
             "response_mode": response_mode,
             "conversation_id": session.get_conversation_id(),
@@ -94,9 +187,76 @@ class DifyBot(Bot):
     def _get_dify_conf(self, context: Context, key, default=None):
         return context.get(key, conf().get(key, default))
 
+    def _get_endpoint_pool(self, context: Context) -> EndpointPool:
+        """dify_endpoints为空时，由dify_api_base和dify_api_key组成只有一个节点的池"""
+        endpoints = self._get_dify_conf(context, "dify_endpoints", []) or [{
+            "api_base": self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1"),
+            "api_key": self._get_dify_conf(context, "dify_api_key", ''),
+        }]
+        key = tuple((e["api_base"], e["api_key"], e.get("weight", 1)) for e in endpoints)
+        pool = self.endpoint_pools.get(key)
+        if pool is None:
+            with self.endpoint_pools_lock:
+                pool = self.endpoint_pools.get(key)
+                if pool is None:
+                    pool = EndpointPool(
+                        endpoints,
+                        strategy=conf().get("dify_lb_strategy", "least_requests"),
+                        max_failures=conf().get("dify_lb_max_failures", 3),
+                        eject_seconds=conf().get("dify_lb_eject_seconds", 30),
+                    )
+                    self.endpoint_pools[key] = pool
+        return pool
+
+    def _select_endpoint(self, session: DifySession, context: Context, exclude=()) -> Endpoint:
+        """选择节点并记录在会话中，会话已有节点且节点可用时继续使用，保证同一个会话固定在同一个节点"""
+        endpoint = self._get_endpoint_pool(context).select(preferred=session.get_endpoint(), exclude=exclude)
+        if session.get_endpoint() != endpoint.key:
+            if session.get_endpoint():
+                logger.info(f"[DIFY] session {session.get_session_id()} moved to endpoint {endpoint.api_base}")
+            session.set_endpoint(endpoint.key)
+        return endpoint
+
+    def _send_with_failover(self, session: DifySession, context: Context, send):
+        """
+        在会话固定的节点上发送请求，连接失败或返回429/502/503时换一个节点重试，
+        这些情况下dify还没有处理请求，重试不会重复执行；同一个池中的节点属于同一个应用，conversation_id在新节点上仍然有效
+        :param send: send(client)，发送请求并返回response
+        """
+        pool = self._get_endpoint_pool(context)
+        max_attempts = min(len(pool), conf().get("dify_lb_retries", 1) + 1)
+        tried = []
+        while True:
+            endpoint = self._select_endpoint(session, context, exclude=tried)
+            tried.append(endpoint.key)
+            start = pool.begin(endpoint)
+            try:
+                response = send(self.clients.get(endpoint.api_key, endpoint.api_base))
+            except requests.RequestException as e:
+                pool.end(endpoint, start, ok=False)
+                if not self._is_connect_error(e) or len(tried) >= max_attempts:
+                    raise
+                logger.warning(f"[DIFY] connect to {endpoint.api_base} failed, retry on another endpoint: {e}")
+                continue
+            pool.end(endpoint, start, ok=response.status_code < 500 and response.status_code not in RETRYABLE_STATUS_CODES)
+            if response.status_code in RETRYABLE_STATUS_CODES and len(tried) < max_attempts:
+                logger.warning(f"[DIFY] {endpoint.api_base} returned {response.status_code}, retry on another endpoint")
+                response.close()
+                continue
+            return response
+
+    @staticmethod
+    def _is_connect_error(e):
+        """连接没有建立，请求没有发出"""
+        if isinstance(e, requests.ConnectTimeout):
+            return True
+        reason = getattr(e.args[0], "reason", None) if isinstance(e, requests.ConnectionError) and e.args else None
+        return isinstance(reason, NewConnectionError)
+
     def _reply(self, query: str, session: DifySession, context: Context):
         try:
             session.count_user_message() # 限制一个conversation中消息数，防止conversation过长
+            session.record_message("user", query)
             dify_app_type = self._get_dify_conf(context, "dify_app_type", 'chatbot')
             if dify_app_type == 'chatbot' or dify_app_type == 'chatflow':
                 return self._handle_chatbot(query, session, context)
@@ -111,23 +271,24 @@ class DifyBot(Bot):
         except Exception as e:
             error_info = f"[DIFY] Exception: {e}"
             logger.exception(error_info)
+            if is_transport_error(e):
+                report_failure()
             return None, UNKNOWN_ERROR_MSG
 
     def _handle_chatbot(self, query: str, session: DifySession, context: Context):
-        api_key = self._get_dify_conf(context, "dify_api_key", '')
-        api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
-        chat_client = ChatClient(api_key, api_base)
-        response_mode = 'blocking'
+        # 开启流式回复时，边接收边按段落/句子发送，channel为空时无法逐条发送，仍使用blocking模式
+        streaming = self._get_dify_conf(context, "dify_stream_reply", False) and context.get("channel") is not None
+        response_mode = 'streaming' if streaming else 'blocking'
         payload = self._get_payload(query, session, response_mode)
         files = self._get_upload_files(session, context)
-        response = chat_client.create_chat_message(
+        response = self._send_with_failover(session, context, lambda chat_client: chat_client.create_chat_message(
             inputs=payload['inputs'],
             query=payload['query'],
             user=payload['user'],
             response_mode=payload['response_mode'],
             conversation_id=payload['conversation_id'],
             files=files
-        )
+        ))
 
         if response.status_code != 200:
             error_info = f"[DIFY] payload={payload} response text={response.text} status_code={response.status_code}"
@@ -135,6 +296,9 @@ class DifyBot(Bot):
             friendly_error_msg = self._handle_error_response(response.text, response.status_code)
             return None, friendly_error_msg
 
+        if streaming:
+            return self._handle_chatbot_stream(response, session, context)
+
         # response:
         # {
         #     "event": "message",
@@ -153,72 +317,137 @@ class DifyBot(Bot):
         logger.debug("[DIFY] usage {}".format(rsp_data.get('metadata', {}).get('usage', 0)))
 
         answer = rsp_data['answer']
+        session.record_message("assistant", answer)
         parsed_content = parse_markdown_text(answer)
 
         # {"answer": "![image](/files/tools/dbf9cd7c-2110-4383-9ba8-50d9fd1a4815.png?timestamp=1713970391&nonce=0d5badf2e39466042113a4ba9fd9bf83&sign=OVmdCxCEuEYwc9add3YNFFdUpn4VdFKgl84Cg54iLnU=)"}
+        # parsed_content 没有数据时，直接不回复
+        if not parsed_content:
+            return None, None
+        final_reply = self._send_parsed_content(parsed_content, context, self._get_file_base_url(session, context))
+
+        # 设置dify conversation_id, 依靠dify管理上下文
+        if session.get_conversation_id() == '':
+            session.set_conversation_id(rsp_data['conversation_id'])
+
+        return final_reply, None
+
+    def _handle_chatbot_stream(self, response: requests.Response, session: DifySession, context: Context):
+        # response:
+        # data: {"event": "message", "message_id": "...", "conversation_id": "...", "answer": "Hi", "created_at": 1705398420}
+        # data: {"event": "message_end", "message_id": "...", "conversation_id": "...", "metadata": {"usage": {...}}}
+        segmenter = StreamSegmenter(self._get_dify_conf(context, "dify_stream_segment_length", 80))
+        return self._deliver_sse_messages(response, session, context, segmenter, parse_markdown=True)
+
+    def _deliver_sse_messages(self, response: requests.Response, session: DifySession, context: Context,
+                              segmenter: StreamSegmenter = None, parse_markdown=False):
+        return self._deliver_messages(self._iter_sse_messages(response, segmenter), session, context, parse_markdown)
+
+    def _deliver_messages(self, messages, session: DifySession, context: Context, parse_markdown=False):
+        """
+        边解析边发送SSE响应中的消息，每条消息在下一条消息完整时发出，
+        最后一条消息作为回复返回，经过正常的回复装饰流程；进度提示不参与排队，立即发送
+        """
+        pending = None
+        conversation_id = None
+        answer = []
+        file_base = self._get_file_base_url(session, context)
+        for msg in messages:
+            if msg['type'] == 'progress':
+                if context.get("channel"):
+                    context["channel"].send(Reply(ReplyType.TEXT, msg['content']), context)
+                continue
+            conversation_id = conversation_id or msg.get('conversation_id')
+            if msg['type'] == 'agent_message':
+                answer.append(msg.get('answer', msg['content']))
+            if parse_markdown and msg['type'] == 'agent_message':
+                # 消息完整后立即开始下载其中的图片和文件，不必等到轮到它发送
+                msg['parsed'] = self._prefetch_media(parse_markdown_text(msg['content']), file_base)
+            if pending:
+                self._deliver_sse_message(pending, context, parse_markdown, file_base, final=False)
+            pending = msg
+        session.record_message("assistant", "".join(answer))
+        # 设置dify conversation_id, 依靠dify管理上下文
+        if conversation_id and session.get_conversation_id() == '':
+            session.set_conversation_id(conversation_id)
+        if pending is None:
+            return None, None
+        return self._deliver_sse_message(pending, context, parse_markdown, file_base, final=True), None
+
+    def _deliver_sse_message(self, msg, context: Context, parse_markdown, file_base, final):
+        """非最后一条消息直接通过channel发送，最后一条消息转换为Reply返回；file_base用于补全相对路径的文件链接"""
+        channel = context.get("channel")
+        if msg['type'] == 'message_file' and msg['content'].get('type', 'image') != 'image':
+            reply = self._parsed_item_to_reply({'type': 'file', 'content': msg['content']['url']}, file_base)
+        elif msg['type'] == 'message_file':
+            reply = Reply(ReplyType.IMAGE_URL, self._fill_file_base_url(msg['content']['url'], file_base))
+        elif parse_markdown:
+            parsed_content = msg.get('parsed') or parse_markdown_text(msg['content'])
+            return self._send_parsed_content(parsed_content, context, file_base, send_last=not final)
+        else:
+            content = msg['content']
+            if not final and context.get("isgroup", False):
+                content = "@" + context["msg"].actual_user_nickname + "\n" + content
+            reply = Reply(ReplyType.TEXT, content)
+        if final:
+            return reply
+        if channel:
+            channel.send(reply, context)
+        return None
+
+    def _send_parsed_content(self, parsed_content, context: Context, file_base=None, send_last=False):
+        """
+        按顺序发送parse_markdown_text解析出的文本、图片和文件，
+        默认最后一项不发送，转换为Reply返回，由channel统一装饰和发送
+        file_base为会话所在节点的文件base url，用于补全相对路径的链接
+        """
         at_prefix = ""
         channel = context.get("channel")
-        is_group = context.get("isgroup", False)
-        if is_group:
+        if context.get("isgroup", False):
             at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
-        for item in parsed_content[:-1]:
-            reply = None
-            if item['type'] == 'text':
-                content = at_prefix + item['content']
-                reply = Reply(ReplyType.TEXT, content)
-            elif item['type'] == 'image':
-                image_url = self._fill_file_base_url(item['content'])
-                image = self._download_image(image_url)
-                if image:
-                    reply = Reply(ReplyType.IMAGE, image)
-                else:
-                    reply = Reply(ReplyType.TEXT, f"图片链接：{image_url}")
-            elif item['type'] == 'file':
-                file_url = self._fill_file_base_url(item['content'])
-                file_path = self._download_file(file_url)
-                if file_path:
-                    reply = Reply(ReplyType.FILE, file_path)
-                else:
-                    reply = Reply(ReplyType.TEXT, f"文件链接：{file_url}")
+        self._prefetch_media(parsed_content, file_base)
+        items = parsed_content if send_last else parsed_content[:-1]
+        for item in items:
+            reply = self._parsed_item_to_reply(item, file_base)
+            if reply and reply.type == ReplyType.TEXT:
+                reply.content = at_prefix + reply.content
             logger.debug(f"[DIFY] reply={reply}")
             if reply and channel:
                 channel.send(reply, context)
-        # parsed_content 没有数据时，直接不回复
-        if not parsed_content:
-            return None, None
-        final_item = parsed_content[-1]
-        final_reply = None
-        if final_item['type'] == 'text':
-            content = final_item['content']
-            if is_group:
-                at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
-                content = at_prefix + content
-            final_reply = Reply(ReplyType.TEXT, final_item['content'])
-        elif final_item['type'] == 'image':
-            image_url = self._fill_file_base_url(final_item['content'])
-            image = self._download_image(image_url)
+        if send_last or not parsed_content:
+            return None
+        return self._parsed_item_to_reply(parsed_content[-1], file_base)
+
+    def _parsed_item_to_reply(self, item, file_base=None):
+        reply = None
+        if item['type'] == 'text':
+            reply = Reply(ReplyType.TEXT, item['content'])
+        elif item['type'] == 'image':
+            image_url = self._fill_file_base_url(item['content'], file_base)
+            image = item['future'].result() if 'future' in item else self._download_image(image_url)
             if image:
-                final_reply = Reply(ReplyType.IMAGE, image)
+                reply = Reply(ReplyType.IMAGE, image)
             else:
-                final_reply = Reply(ReplyType.TEXT, f"图片链接：{image_url}")
-        elif final_item['type'] == 'file':
-            file_url = self._fill_file_base_url(final_item['content'])
-            file_path = self._download_file(file_url)
+                reply = Reply(ReplyType.TEXT, f"图片链接：{image_url}")
+        elif item['type'] == 'file':
+            file_url = self._fill_file_base_url(item['content'], file_base)
+            file_path = item['future'].result() if 'future' in item else self._download_file(file_url)
             if file_path:
-                final_reply = Reply(ReplyType.FILE, file_path)
+                reply = Reply(ReplyType.FILE, file_path)
             else:
-                final_reply = Reply(ReplyType.TEXT, f"文件链接：{file_url}")
+                reply = Reply(ReplyType.TEXT, f"文件链接：{file_url}")
+        return reply
 
-        # 设置dify conversation_id, 依靠dify管理上下文
-        if session.get_conversation_id() == '':
-            session.set_conversation_id(rsp_data['conversation_id'])
-
-        return final_reply, None
+    def _iter_sse_events(self, response: requests.Response):
+        """逐个产出SSE事件，收到一个事件就立即处理，不必等待整个响应结束"""
+        for line in response.iter_lines():
+            if line:
+                event = self._parse_sse_event(line.decode('utf-8'))
+                if event:
+                    yield event
 
     def _download_file(self, url):
         try:
-            response = requests.get(url)
-            response.raise_for_status()
             parsed_url = urlparse(url)
             logger.debug(f"Downloading file from {url}")
             url_path = unquote(parsed_url.path)
@@ -227,7 +456,7 @@ class DifyBot(Bot):
             logger.debug(f"Saving file as {file_name}")
             file_path = os.path.join(TmpDir().path(), file_name)
             with open(file_path, 'wb') as file:
-                file.write(response.content)
+                self._download_to(url, file)
             return file_path
         except Exception as e:
             logger.error(f"Error downloading {url}: {e}")
@@ -235,35 +464,49 @@ class DifyBot(Bot):
 
     def _download_image(self, url):
         try:
-            pic_res = requests.get(url, stream=True)
-            pic_res.raise_for_status()
-            image_storage = io.BytesIO()
-            size = 0
-            for block in pic_res.iter_content(1024):
-                size += len(block)
-                image_storage.write(block)
+            image = io.BytesIO()
+            size = self._download_to(url, image)
             logger.debug(f"[WX] download image success, size={size}, img_url={url}")
-            image_storage.seek(0)
-            return image_storage
+            image.seek(0)
+            return image
         except Exception as e:
             logger.error(f"Error downloading {url}: {e}")
         return None
 
+    def _download_to(self, url, file):
+        """边下载边写入file(二进制文件对象)，返回下载的字节数"""
+        size = 0
+        with requests.get(url, stream=True, timeout=(10, 300)) as response:
+            response.raise_for_status()
+            for block in response.iter_content(64 * 1024):
+                size += len(block)
+                file.write(block)
+        return size
+
+    def _prefetch_media(self, parsed_content, file_base=None):
+        """
+        回答解析完成后立即在线程池中并发下载其中所有的图片和文件，
+        发送时按文档顺序等待各自的下载结果，总耗时约等于最慢的一个下载
+        """
+        for item in parsed_content:
+            if item['type'] == 'image' and 'future' not in item:
+                item['future'] = self.media_pool.submit(self._download_image, self._fill_file_base_url(item['content'], file_base))
+            elif item['type'] == 'file' and 'future' not in item:
+                item['future'] = self.media_pool.submit(self._download_file, self._fill_file_base_url(item['content'], file_base))
+        return parsed_content
+
     def _handle_agent(self, query: str, session: DifySession, context: Context):
-        api_key = self._get_dify_conf(context, "dify_api_key", '')
-        api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
-        chat_client = ChatClient(api_key, api_base)
         response_mode = 'streaming'
         payload = self._get_payload(query, session, response_mode)
         files = self._get_upload_files(session, context)
-        response = chat_client.create_chat_message(
+        response = self._send_with_failover(session, context, lambda chat_client: chat_client.create_chat_message(
             inputs=payload['inputs'],
             query=payload['query'],
             user= payload['user'],
             response_mode=payload['response_mode'],
             conversation_id=payload['conversation_id'],
             files=files
-        )
+        ))
 
         if response.status_code != 200:
             error_info = f"[DIFY] payload={payload} response text={response.text} status_code={response.status_code}"
@@ -275,49 +518,32 @@ class DifyBot(Bot):
         # data: {"event": "agent_thought", "id": "8dcf3648-fbad-407a-85dd-73a6f43aeb9f", "task_id": "9cf1ddd7-f94b-459b-b942-b77b26c59e9b", "message_id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "position": 1, "thought": "", "observation": "", "tool": "dalle3", "tool_input": "{\"dalle3\": {\"prompt\": \"cute Japanese anime girl with white hair, blue eyes, bunny girl suit\"}}", "created_at": 1705639511, "message_files": [], "conversation_id": "c216c595-2d89-438c-b33c-aae5ddddd142"}
         # data: {"event": "agent_message", "id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "task_id": "9cf1ddd7-f94b-459b-b942-b77b26c59e9b", "message_id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "answer": "I have created an image of a cute Japanese", "created_at": 1705639511, "conversation_id": "c216c595-2d89-438c-b33c-aae5ddddd142"}
         # data: {"event": "message_end", "task_id": "9cf1ddd7-f94b-459b-b942-b77b26c59e9b", "id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "message_id": "1fb10045-55fd-4040-99e6-d048d07cbad3", "conversation_id": "c216c595-2d89-438c-b33c-aae5ddddd142", "metadata": {"usage": {"prompt_tokens": 305, "prompt_unit_price": "0.001", "prompt_price_unit": "0.001", "prompt_price": "0.0003050", "completion_tokens": 97, "completion_unit_price": "0.002", "completion_price_unit": "0.001", "completion_price": "0.0001940", "total_tokens": 184, "total_price": "0.0002290", "currency": "USD", "latency": 1.771092874929309}}}
-        msgs, conversation_id = self._handle_sse_response(response)
-        channel = context.get("channel")
-        # TODO: 适配除微信以外的其他channel
-        is_group = context.get("isgroup", False)
-        for msg in msgs[:-1]:
-            if msg['type'] == 'agent_message':
-                if is_group:
-                    at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
-                    msg['content'] = at_prefix + msg['content']
-                reply = Reply(ReplyType.TEXT, msg['content'])
-                channel.send(reply, context)
-            elif msg['type'] == 'message_file':
-                url = self._fill_file_base_url(msg['content']['url'])
-                reply = Reply(ReplyType.IMAGE_URL, url)
-                thread = threading.Thread(target=channel.send, args=(reply, context))
-                thread.start()
-        # 检查msgs是否为空
-        if not msgs:
+        segmenter = None
+        if self._get_dify_conf(context, "dify_stream_reply", False):
+            segmenter = StreamSegmenter(self._get_dify_conf(context, "dify_stream_segment_length", 80))
+        reply, err = self._deliver_sse_messages(response, session, context, segmenter)
+        if reply is None and err is None:
             return None, "No messages received from agent."
-        final_msg = msgs[-1]
-        reply = None
-        if final_msg['type'] == 'agent_message':
-            reply = Reply(ReplyType.TEXT, final_msg['content'])
-        elif final_msg['type'] == 'message_file':
-            url = self._fill_file_base_url(final_msg['content']['url'])
-            reply = Reply(ReplyType.IMAGE_URL, url)
-        # 设置dify conversation_id, 依靠dify管理上下文
-        if session.get_conversation_id() == '':
-            session.set_conversation_id(conversation_id)
-        return reply, None
+        return reply, err
 
     def _handle_workflow(self, query: str, session: DifySession, context: Context):
-        payload = self._get_workflow_payload(query, session)
-        api_key = self._get_dify_conf(context, "dify_api_key", '')
-        api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
-        dify_client = DifyClient(api_key, api_base)
-        response = dify_client._send_request("POST", "/workflows/run", json=payload)
+        # 开启流式回复时，边执行边发送工作流输出的文本，channel为空时无法逐条发送，仍使用blocking模式
+        streaming = self._get_dify_conf(context, "dify_stream_reply", False) and context.get("channel") is not None
+        payload = self._get_workflow_payload(query, session, 'streaming' if streaming else 'blocking')
+        response = self._send_with_failover(
+            session, context, lambda dify_client: dify_client._send_request("POST", "/workflows/run", json=payload, stream=streaming))
         if response.status_code != 200:
             error_info = f"[DIFY] payload={payload} response text={response.text} status_code={response.status_code}"
             logger.warning(error_info)
             friendly_error_msg = self._handle_error_response(response.text, response.status_code)
             return None, friendly_error_msg
 
+        if streaming:
+            segmenter = StreamSegmenter(self._get_dify_conf(context, "dify_stream_segment_length", 80))
+            progress_interval = self._get_dify_conf(context, "dify_workflow_progress_interval", 0)
+            messages = self._iter_workflow_messages(response, segmenter, progress_interval)
+            return self._deliver_messages(messages, session, context, parse_markdown=True)
+
         #  {
         #      "log_id": "djflajgkldjgd",
         #      "task_id": "9da23599-e713-473b-982c-4328d4f5c78a",
@@ -351,25 +577,50 @@ class DifyBot(Bot):
             return None
         # 清理图片缓存
         memory.USER_IMAGE_CACHE[session_id] = None
-        api_key = self._get_dify_conf(context, "dify_api_key", '')
-        api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
-        dify_client = DifyClient(api_key, api_base)
-        msg = img_cache.get("msg")
-        path = img_cache.get("path")
+        endpoint = self._select_endpoint(session, context)
+        dify_client = self.clients.get(endpoint.api_key, endpoint.api_base)
+        # dify的终端用户按应用区分，同一张图片需要按(api_base, api_key, user)分别上传
+        target = (endpoint.api_base, endpoint.api_key, session.get_user())
+        upload_file_id = None
+        future = img_cache.get("upload_future")
+        if future is not None and img_cache.get("upload_target") == target:
+            # 收到图片时已开始后台上传到同一个应用，等待结果即可
+            try:
+                upload_file_id = future.result(timeout=conf().get("image_prefetch_timeout", 60))
+            except Exception as e:
+                logger.warning(f"[DIFY] prefetch image upload failed: {e}")
+        if not upload_file_id:
+            # 未预上传、预上传失败，或提问时插件选择了其他应用，同步上传
+            upload_file_id = self._prepare_and_upload(img_cache.get("msg"), img_cache.get("path"), target, dify_client)
+        if not upload_file_id:
+            return None
+        return [
+            {
+                "type": "image",
+                "transfer_method": "local_file",
+                "upload_file_id": upload_file_id
+            }
+        ]
+
+    def _prepare_and_upload(self, msg, path, target, dify_client):
         msg.prepare()
+        path = compress_image_file(path, conf().get("image_upload_max_size", 0))
+        user = target[2]
+        return self.upload_cache.get_or_upload(path, target, lambda file_path: self._upload_file(dify_client, file_path, user))
 
+    def _upload_file(self, dify_client, path, user):
         with open(path, 'rb') as file:
             file_name = os.path.basename(path)
             file_type, _ = mimetypes.guess_type(file_name)
             files = {
                 'file': (file_name, file, file_type)
             }
-            response = dify_client.file_upload(user=session.get_user(), files=files)
+            response = dify_client.file_upload(user=user, files=files)
 
         if response.status_code != 200 and response.status_code != 201:
             error_info = f"[DIFY] response text={response.text} status_code={response.status_code} when upload file"
             logger.warning(error_info)
-            return None, error_info
+            return None
         # {
         #     'id': 'f508165a-10dc-4256-a7be-480301e630e6',
         #     'name': '0.png',
@@ -381,30 +632,31 @@ class DifyBot(Bot):
         # }
         file_upload_data = response.json()
         logger.debug("[DIFY] upload file {}".format(file_upload_data))
-        return [
-            {
-                "type": "image",
-                "transfer_method": "local_file",
-                "upload_file_id": file_upload_data['id']
-            }
-        ]
+        return file_upload_data['id']
 
-    def _fill_file_base_url(self, url: str):
+    def _fill_file_base_url(self, url: str, file_base=None):
         if url.startswith("https://") or url.startswith("http://"):
             return url
         # 补全文件base url, 默认使用去掉"/v1"的dify api base url
-        return self._get_file_base_url() + url
-
-    def _get_file_base_url(self) -> str:
-        api_base = conf().get("dify_api_base", "https://api.dify.ai/v1")
+        return (file_base or self._get_file_base_url()) + url
+
+    def _get_file_base_url(self, session: DifySession = None, context: Context = None) -> str:
+        """相对路径的文件由会话所在的节点生成，使用该节点的api_base；会话还没有选择节点时使用当前应用的dify_api_base"""
+        endpoint = session.get_endpoint() if session else None
+        if endpoint:
+            api_base = endpoint[0]
+        elif context is not None:
+            api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
+        else:
+            api_base = conf().get("dify_api_base", "https://api.dify.ai/v1")
         return api_base.replace("/v1", "")
 
-    def _get_workflow_payload(self, query, session: DifySession):
+    def _get_workflow_payload(self, query, session: DifySession, response_mode='blocking'):
         return {
             'inputs': {
                 "query": query
             },
-            "response_mode": "blocking",
+            "response_mode": response_mode,
             "user": session.get_user()
         }
 
@@ -429,70 +681,137 @@ class DifyBot(Bot):
             logger.warning("Received an empty SSE event.")
             return None
 
-    # TODO: 异步返回events
-    def _handle_sse_response(self, response: requests.Response):
-        events = []
-        for line in response.iter_lines():
-            if line:
-                decoded_line = line.decode('utf-8')
-                event = self._parse_sse_event(decoded_line)
-                if event:
-                    events.append(event)
-
-        merged_message = []
-        accumulated_agent_message = ''
+    def _iter_sse_messages(self, response: requests.Response, segmenter: StreamSegmenter = None):
+        """
+        增量解析SSE响应，每当一条消息完整时立即产出，不必等待message_end
+        产出 {'type': 'agent_message', 'content': 文本, 'answer': 原始文本, 'conversation_id': ...}
+        或 {'type': 'message_file', 'content': message_file事件, 'conversation_id': ...}
+        文本在遇到agent_thought、message_file、message_end时结束；传入segmenter时，长文本按段落/句子提前产出，
+        分段时会去掉段落间的空白，所有answer依次拼接起来才是原始的回答文本
+        """
+        accumulated_message = ''
+        raw_answer = ''
         conversation_id = None
-        for event in events:
-            event_name = event['event']
+
+        def flush():
+            nonlocal accumulated_message, raw_answer
+            text = segmenter.flush() if segmenter else accumulated_message
+            if text:
+                yield {'type': 'agent_message', 'content': text, 'answer': raw_answer, 'conversation_id': conversation_id}
+            accumulated_message = ''
+            raw_answer = ''
+
+        for event in self._iter_sse_events(response):
+            event_name = event.get('event')
             if event_name == 'agent_message' or event_name == 'message':
-                accumulated_agent_message += event['answer']
-                logger.debug("[DIFY] accumulated_agent_message: {}".format(accumulated_agent_message))
                 # 保存conversation_id
                 if not conversation_id:
-                    conversation_id = event['conversation_id']
+                    conversation_id = event.get('conversation_id')
+                answer = event.get('answer', '')
+                raw_answer += answer
+                if segmenter:
+                    for segment in segmenter.feed(answer):
+                        yield {'type': 'agent_message', 'content': segment, 'answer': raw_answer, 'conversation_id': conversation_id}
+                        raw_answer = ''
+                else:
+                    accumulated_message += answer
             elif event_name == 'agent_thought':
-                self._append_agent_message(accumulated_agent_message, merged_message)
-                accumulated_agent_message = ''
+                yield from flush()
                 logger.debug("[DIFY] agent_thought: {}".format(event))
             elif event_name == 'message_file':
-                self._append_agent_message(accumulated_agent_message, merged_message)
-                accumulated_agent_message = ''
-                self._append_message_file(event, merged_message)
+                yield from flush()
+                if event.get('type') != 'image':
+                    logger.warning("[DIFY] unsupported message file type: {}".format(event))
+                conversation_id = conversation_id or event.get('conversation_id')
+                yield {'type': 'message_file', 'content': event, 'conversation_id': conversation_id}
             elif event_name == 'message_replace':
-                # TODO: handle message_replace
-                pass
+                # 内容审查替换了回答，还没有发出的部分以替换后的内容为准
+                logger.warning("[DIFY] message_replace: {}".format(event))
+                raw_answer = event.get('answer', '')
+                if segmenter:
+                    segmenter.buffer = event.get('answer', '')
+                else:
+                    accumulated_message = event.get('answer', '')
             elif event_name == 'error':
                 logger.error("[DIFY] error: {}".format(event))
                 raise Exception(event)
             elif event_name == 'message_end':
-                self._append_agent_message(accumulated_agent_message, merged_message)
-                logger.debug("[DIFY] message_end usage: {}".format(event['metadata']['usage']))
+                logger.debug("[DIFY] message_end usage: {}".format(event.get('metadata', {}).get('usage')))
                 break
             else:
-                logger.warning("[DIFY] unknown event: {}".format(event))
+                # chatflow会返回workflow_started、node_finished等事件，这里不需要处理
+                logger.debug("[DIFY] ignore event: {}".format(event_name))
+        yield from flush()
 
         if not conversation_id:
             raise Exception("conversation_id not found")
 
-        return merged_message, conversation_id
-
-    def _append_agent_message(self, accumulated_agent_message,  merged_message):
-        if accumulated_agent_message:
-            merged_message.append({
-                'type': 'agent_message',
-                'content': accumulated_agent_message,
-            })
-
-    def _append_message_file(self, event: dict, merged_message: list):
-        if event.get('type') != 'image':
-            logger.warning("[DIFY] unsupported message file type: {}".format(event))
-        merged_message.append({
-            'type': 'message_file',
-            'content': event,
-        })
+    def _iter_workflow_messages(self, response: requests.Response, segmenter: StreamSegmenter, progress_interval=0):
+        """
+        增量解析工作流的SSE响应，产出格式与_iter_sse_messages相同
+        text_chunk中的文本按段落/句子产出；workflow_finished时产出剩余文本和输出中的图片/文件；
+        progress_interval大于0时，节点开始执行时产出进度提示，两次提示至少间隔progress_interval秒
+        """
+        # data: {"event": "workflow_started", "workflow_run_id": "...", "data": {"id": "...", "workflow_id": "...", "created_at": 1705407629}}
+        # data: {"event": "node_started", "workflow_run_id": "...", "data": {"node_id": "...", "node_type": "llm", "title": "LLM", "index": 2}}
+        # data: {"event": "text_chunk", "workflow_run_id": "...", "data": {"text": "Nice", "from_variable_selector": ["1745912968134", "text"]}}
+        # data: {"event": "node_finished", "workflow_run_id": "...", "data": {"node_id": "...", "title": "LLM", "status": "succeeded", "elapsed_time": 3.2}}
+        # data: {"event": "workflow_finished", "workflow_run_id": "...", "data": {"status": "succeeded", "outputs": {"text": "Nice to meet you."}, "elapsed_time": 5.1}}
+        streamed = False
+        raw_answer = ''
+        last_progress = time.monotonic()
+        for event in self._iter_sse_events(response):
+            event_name = event.get('event')
+            data = event.get('data') or {}
+            if event_name == 'text_chunk':
+                streamed = True
+                raw_answer += data.get('text', '')
+                for segment in segmenter.feed(data.get('text', '')):
+                    yield {'type': 'agent_message', 'content': segment, 'answer': raw_answer}
+                    raw_answer = ''
+            elif event_name == 'node_started':
+                if progress_interval and time.monotonic() - last_progress >= progress_interval:
+                    last_progress = time.monotonic()
+                    yield {'type': 'progress', 'content': f"正在执行：{data.get('title', '')}"}
+            elif event_name == 'node_finished':
+                logger.debug("[DIFY] workflow node finished: {} {} {}s".format(data.get('title'), data.get('status'), data.get('elapsed_time')))
+            elif event_name == 'workflow_finished':
+                if data.get('status') != 'succeeded':
+                    raise Exception("workflow {}: {}".format(data.get('status'), data.get('error')))
+                outputs = data.get('outputs') or {}
+                text = segmenter.flush()
+                if not streamed:
+                    # End节点的输出没有流式返回时，使用outputs中的text
+                    text = raw_answer = outputs.get('text', '')
+                if text:
+                    yield {'type': 'agent_message', 'content': text, 'answer': raw_answer}
+                for file in self._get_workflow_output_files(outputs):
+                    yield {'type': 'message_file', 'content': file}
+                return
+            elif event_name == 'error':
+                logger.error("[DIFY] error: {}".format(event))
+                raise Exception(event)
+            else:
+                logger.debug("[DIFY] ignore event: {}".format(event_name))
+        raise Exception("workflow_finished not received")
+
+    def _get_workflow_output_files(self, outputs: dict):
+        """工作流输出中的图片和文件，文件变量为dict，数组变量为list"""
+        files = []
+        for value in outputs.values():
+            for item in value if isinstance(value, list) else [value]:
+                if not isinstance(item, dict) or item.get('dify_model_identity') != '__dify__file__':
+                    continue
+                url = item.get('url') or item.get('remote_url')
+                if url:
+                    files.append({'type': item.get('type'), 'url': url})
+        return files
 
     def _handle_error_response(self, response_text, status_code):
         """处理错误响应并提供用户指导"""
+        if status_code == 429 or status_code >= 500:
+            report_overload()
+            report_failure()
         try:
             friendly_error_msg = UNKNOWN_ERROR_MSG
             error_data = json.loads(response_text)
@@ -1,4 +1,6 @@
-from common.expired_dict import ExpiredDict
+from collections import deque
+
+from common.session_store import build_session_dict
 from config import conf
 
 
@@ -13,6 +15,10 @@ class DifySession(object):
         self._user_name = ''
         self._room_id = ''
         self._room_name = ''
+        self._endpoint = None  # 会话固定使用的dify节点 (api_base, api_key)
+        # 滚动模式下本地保留的最近几轮问答 [(role, content)]，开启新会话时作为上文携带
+        self._history = deque(maxlen=max(1, conf().get("dify_conversation_rollover_turns", 3)) * 2)
+        self._rollover_context = ''  # 新会话的第一条消息需要携带的上文，新会话建立后清空
 
     def get_session_id(self):
         return self._session_id
@@ -25,6 +31,22 @@ class DifySession(object):
 
     def set_conversation_id(self, conversation_id):
         self._conversation_id = conversation_id
+        if conversation_id:
+            self._rollover_context = ''
+
+    def get_rollover_context(self):
+        return self._rollover_context
+
+    def record_message(self, role, content):
+        """记录一条问题(user)或回答(assistant)，只在开启滚动模式时保留"""
+        if conf().get("dify_conversation_rollover", False) and content:
+            self._history.append((role, content))
+
+    def get_endpoint(self):
+        return self._endpoint
+
+    def set_endpoint(self, endpoint):
+        self._endpoint = endpoint
 
     # 新增getter和setter方法
     def get_user_id(self):
@@ -53,18 +75,32 @@ class DifySession(object):
             return
         if self._user_message_counter >= conf().get("dify_conversation_max_messages", 5):
             self._user_message_counter = 0
-            # FIXME: dify目前不支持设置历史消息长度，暂时使用超过5条清空会话的策略，缺点是没有滑动窗口，会突然丢失历史消息
+            # dify不支持设置历史消息长度，超过最大消息数时开启新会话；
+            # 开启滚动模式时新会话携带本地保留的最近几轮问答，上下文不会突然丢失，提示词长度也不会无限增长
+            if conf().get("dify_conversation_rollover", False):
+                self._rollover_context = self._build_rollover_context()
             self._conversation_id = ''
-        
+
         self._user_message_counter += 1
 
+    def _build_rollover_context(self):
+        max_chars = conf().get("dify_conversation_rollover_max_chars", 2000)
+        lines = []
+        size = 0
+        # 从最近的一轮往前取，超过长度上限时丢弃更早的内容
+        for role, content in reversed(self._history):
+            line = ("用户：" if role == "user" else "助手：") + content
+            if size + len(line) > max_chars:
+                if not lines:
+                    lines.append(line[:max_chars])
+                break
+            lines.append(line)
+            size += len(line)
+        return "\n".join(reversed(lines))
+
 class DifySessionManager(object):
     def __init__(self, sessioncls, **session_kwargs):
-        if conf().get("expires_in_seconds"):
-            sessions = ExpiredDict(conf().get("expires_in_seconds"))
-        else:
-            sessions = dict()
-        self.sessions = sessions
+        self.sessions = build_session_dict(sessioncls.__name__)
         self.sessioncls = sessioncls
         self.session_kwargs = session_kwargs
 
@@ -5,7 +5,7 @@ import openai.error
 from bridge.reply import Reply, ReplyType
 
 from common.log import logger
-from common.token_bucket import TokenBucket
+from common.token_bucket import build_token_bucket
 from config import conf
 
 
@@ -15,7 +15,7 @@ class OpenAIImage(object):
         openai.api_base = conf().get("open_ai_api_base")
         openai.api_key = conf().get("open_ai_api_key")
         if conf().get("rate_limit_dalle"):
-            self.tb4dalle = TokenBucket(conf().get("rate_limit_dalle", 50))
+            self.tb4dalle = build_token_bucket("dalle", conf().get("rate_limit_dalle", 50))
 
     def create_img(self, query, retry_count=0, api_key=None, context=None):
         """
@@ -1,5 +1,5 @@
-from common.expired_dict import ExpiredDict
 from common.log import logger
+from common.session_store import build_session_dict
 from config import conf
 
 
@@ -38,11 +38,7 @@ class Session(object):
 
 class SessionManager(object):
     def __init__(self, sessioncls, **session_args):
-        if conf().get("expires_in_seconds"):
-            sessions = ExpiredDict(conf().get("expires_in_seconds"))
-        else:
-            sessions = dict()
-        self.sessions = sessions
+        self.sessions = build_session_dict(sessioncls.__name__)
         self.sessioncls = sessioncls
         self.session_args = session_args
 
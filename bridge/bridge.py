@@ -1,8 +1,13 @@
+import threading
+
 from bot.bot_factory import create_bot
-from bridge.context import Context
-from bridge.reply import Reply
-from common import const
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from common import const, memory, runtime_stats
+from common.circuit_breaker import CircuitBreaker, is_transport_error, report_failure
+from common.concurrency_limiter import AdaptiveLimiter
 from common.log import logger
+from common.reply_cache import RecordingChannel, ReplyCache, at_prefix
 from common.singleton import singleton
 from config import conf
 from translate.factory import create_translator
@@ -68,6 +73,12 @@ class Bridge(object):
 
         self.bots = {}
         self.chat_bots = {}
+        self.limiters = {}
+        self.limiters_lock = threading.Lock()
+        self.breakers = {}
+        self.breakers_lock = threading.Lock()
+        self.reply_cache = ReplyCache("reply", conf().get("reply_cache_ttl", 3600), conf().get("reply_cache_max_size", 1000))
+        runtime_stats.register("circuit_breakers", self.get_breaker_stats)
 
     # 模型对应的接口
     def get_bot(self, typename):
@@ -87,7 +98,136 @@ class Bridge(object):
         return self.btype[typename]
 
     def fetch_reply_content(self, query, context: Context) -> Reply:
-        return self.get_bot("chat").reply(query, context)
+        cache_key = self.get_reply_cache_key(query, context)
+        if cache_key is None:
+            return self._fetch_reply_content(query, context)
+        replies = self.reply_cache.get(cache_key)
+        if replies is not None:
+            logger.info("[Bridge] reply cache hit, query={}".format(query))
+            # 依次重发bot当时直接发送的消息，最后一条作为回复返回
+            prefix = at_prefix(context)
+            for reply in replies[:-1]:
+                content = prefix + reply.content if getattr(reply, "at_user", False) else reply.content
+                context["channel"].send(Reply(reply.type, content), context)
+            return Reply(replies[-1].type, replies[-1].content)
+        channel = context.get("channel")
+        recorder = RecordingChannel(channel) if channel else None
+        if recorder:
+            context["channel"] = recorder
+        try:
+            reply = self._fetch_reply_content(query, context)
+        finally:
+            if recorder:
+                context["channel"] = channel
+        if not context.get("reply_cache_bypass"):
+            self.reply_cache.put(cache_key, (recorder.sent if recorder else []) + [reply])
+        return reply
+
+    def get_reply_cache_key(self, query, context: Context):
+        """
+        获取回复缓存的key，不满足缓存条件时返回None
+        只缓存文字消息；有待识别的图片、bot认为请求有状态(如会话已有conversation_id)或context中设置了reply_cache_bypass时不缓存
+        """
+        if not conf().get("reply_cache_enabled", False) or context is None or context.type != ContextType.TEXT:
+            return None
+        if context.get("reply_cache_bypass") or memory.USER_IMAGE_CACHE.get(context.get("session_id")):
+            return None
+        scope = self.get_bot("chat").get_reply_cache_scope(context)
+        if scope is None:
+            return None
+        return self.btype["chat"], scope, ReplyCache.normalize(query)
+
+    def _fetch_reply_content(self, query, context: Context) -> Reply:
+        breaker = self.get_breaker(context)
+        if breaker is None:
+            return self._fetch_limited_reply_content(query, context)
+        if not breaker.acquire():
+            logger.warning("[Bridge] {} circuit open, fail fast".format(breaker.name))
+            return self._circuit_open_reply(context)
+        try:
+            return self._fetch_limited_reply_content(query, context)
+        except Exception as e:
+            if is_transport_error(e):
+                report_failure()
+            raise
+        finally:
+            breaker.release()
+
+    def _circuit_open_reply(self, context: Context) -> Reply:
+        if context is not None:
+            context["reply_cache_bypass"] = True
+        error_reply = conf().get("error_reply", "我暂时遇到了一些问题，请您稍后重试~")
+        if self.btype["chat"] == const.DIFY:
+            error_reply = conf().get("dify_error_reply") or error_reply
+        return Reply(ReplyType.TEXT, error_reply)
+
+    def get_breaker(self, context: Context):
+        """获取当前后端的熔断器，与限流器相同，按bot类型区分后端，插件为消息指定了dify应用时按应用的api_base区分"""
+        if not conf().get("circuit_breaker_enabled", False):
+            return None
+        name = self.btype["chat"]
+        if context and context.get("dify_api_base"):
+            name = "{}:{}".format(name, context.get("dify_api_base"))
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            with self.breakers_lock:
+                breaker = self.breakers.get(name)
+                if breaker is None:
+                    breaker = self.breakers[name] = CircuitBreaker(
+                        name,
+                        failure_threshold=conf().get("circuit_breaker_failure_threshold", 5),
+                        recovery_timeout=conf().get("circuit_breaker_recovery_timeout", 30),
+                        half_open_probes=conf().get("circuit_breaker_half_open_probes", 1),
+                    )
+        return breaker
+
+    def get_breaker_stats(self):
+        return [breaker.stats() for breaker in list(self.breakers.values())]
+
+    def _fetch_limited_reply_content(self, query, context: Context) -> Reply:
+        limiter = self.get_limiter(context)
+        if limiter is None:
+            return self.get_bot("chat").reply(query, context)
+        if not limiter.acquire():
+            logger.warning("[Bridge] {} too many pending requests, reject. stats={}".format(limiter.name, limiter.stats()))
+            return Reply(ReplyType.ERROR, "当前请求过多，请稍后再试")
+        try:
+            return self.get_bot("chat").reply(query, context)
+        finally:
+            limiter.release()
+
+    def prefetch_image(self, context: Context):
+        try:
+            self.get_bot("chat").prefetch_image(context)
+        except Exception as e:
+            logger.warning("[Bridge] prefetch image error: {}".format(e))
+
+    def get_limiter(self, context: Context):
+        """
+        获取当前后端的自适应并发限制器，未开启adaptive_concurrency时返回None
+        按bot类型区分后端，插件为消息指定了dify应用时按应用的api_base区分
+        """
+        if not conf().get("adaptive_concurrency", False):
+            return None
+        name = self.btype["chat"]
+        if context and context.get("dify_api_base"):
+            name = "{}:{}".format(name, context.get("dify_api_base"))
+        limiter = self.limiters.get(name)
+        if limiter is None:
+            with self.limiters_lock:
+                limiter = self.limiters.get(name)
+                if limiter is None:
+                    limiter = self.limiters[name] = AdaptiveLimiter(
+                        name,
+                        initial_limit=conf().get("adaptive_concurrency_initial", 4),
+                        max_limit=conf().get("adaptive_concurrency_max", 32),
+                        max_queue=conf().get("adaptive_concurrency_queue_size", 50),
+                        queue_timeout=conf().get("adaptive_concurrency_queue_timeout", 60),
+                    )
+        return limiter
+
+    def get_limiter_stats(self):
+        return [limiter.stats() for limiter in list(self.limiters.values())]
 
     def fetch_voice_to_text(self, voiceFile) -> Reply:
         return self.get_bot("voice_to_text").voiceToText(voiceFile)
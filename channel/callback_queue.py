@@ -0,0 +1,79 @@
+import queue
+import threading
+import zlib
+
+from common.log import logger
+from common.state_backend import DedupeSet
+
+
+class CallbackQueue:
+    """
+    回调消息的有界接收队列
+    回调接口只做校验并入队后立即返回，消息解析、昵称查询、插件处理等耗时操作交给后台线程池完成，
+    避免处理变慢时回调请求堆积超时
+    同一个shard_key(如同一个会话)的消息总是交给同一个线程，保证处理顺序与接收顺序一致；
+    队列已满时最多等待put_timeout秒，仍然满则丢弃并计数；按dedupe_key丢弃重复推送的消息，
+    去重记录保存在state_backend中，多个副本收到同一条消息时也只处理一次
+    """
+
+    def __init__(self, name, handler, workers=4, max_size=1000, put_timeout=1, dedupe_ttl=600):
+        self.name = name
+        self.handler = handler
+        self.put_timeout = put_timeout
+        self.queues = [queue.Queue(maxsize=max(1, max_size // workers)) for _ in range(workers)]
+        self.seen = DedupeSet(name, dedupe_ttl)
+        self.lock = threading.Lock()
+        self.received = 0
+        self.duplicated = 0
+        self.dropped = 0
+        self.processed = 0
+        self.failed = 0
+        for i, q in enumerate(self.queues):
+            thread = threading.Thread(target=self._run, args=(q,), name=f"{name}-callback-{i}", daemon=True)
+            thread.start()
+
+    def put(self, payload, shard_key=None, dedupe_key=None) -> bool:
+        """返回False表示消息重复或队列已满被丢弃"""
+        with self.lock:
+            self.received += 1
+        if dedupe_key is not None and not self.seen.add(dedupe_key):
+            with self.lock:
+                self.duplicated += 1
+            return False
+        index = zlib.crc32(str(shard_key).encode("utf-8")) % len(self.queues) if shard_key is not None else 0
+        try:
+            self.queues[index].put(payload, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            if dedupe_key is not None:
+                # 未处理的消息允许再次推送
+                self.seen.discard(dedupe_key)
+            logger.warning("[{}] callback queue is full, message dropped, shard_key={}".format(self.name, shard_key))
+            return False
+
+    def _run(self, q):
+        while True:
+            payload = q.get()
+            try:
+                self.handler(payload)
+                with self.lock:
+                    self.processed += 1
+            except Exception as e:
+                with self.lock:
+                    self.failed += 1
+                logger.exception("[{}] handle callback error: {}".format(self.name, e))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "name": self.name,
+                "workers": len(self.queues),
+                "queue_depth": sum(q.qsize() for q in self.queues),
+                "received": self.received,
+                "duplicated": self.duplicated,
+                "dropped": self.dropped,
+                "processed": self.processed,
+                "failed": self.failed,
+            }
@@ -3,11 +3,14 @@ import re
 import threading
 import time
 from asyncio import CancelledError
-from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import Future
 
 from bridge.context import *
 from bridge.reply import *
+from bridge.bridge import Bridge
 from channel.channel import Channel
+from channel.message_coalescer import MessageCoalescer
+from common.bulkhead import Bulkhead
 from common.dequeue import Dequeue
 from common import memory
 from plugins import *
@@ -17,7 +20,42 @@ try:
 except Exception as e:
     pass
 
-handler_pool = ThreadPoolExecutor(max_workers=8)  # 处理消息的线程池
+handler_pool = Bulkhead("default", conf().get("handler_pool_size", 8))  # 处理消息的默认线程池
+handler_pools = {"default": handler_pool}  # 按消息类型或bot类型隔离的线程池，配置见handler_pool_bulkheads
+handler_pools_lock = threading.Lock()
+
+
+def get_handler_pool(context: Context) -> Bulkhead:
+    """
+    根据消息类型(text/voice/image_create)或bot类型选择线程池，未配置独立线程池时使用默认线程池
+    """
+    bulkheads = conf().get("handler_pool_bulkheads") or {}
+    if not bulkheads:
+        return handler_pool
+    name = context.type.name.lower() if context.type else None
+    if name not in bulkheads:
+        name = Bridge().get_bot_type("chat")
+        if name not in bulkheads:
+            return handler_pool
+    with handler_pools_lock:
+        if name not in handler_pools:
+            handler_pools[name] = Bulkhead(name, int(bulkheads[name]), initializer=handler_pool._initializer)
+        return handler_pools[name]
+
+
+def resize_handler_pools():
+    """按当前配置调整线程池大小，用于重载配置后在运行时生效"""
+    handler_pool.resize(conf().get("handler_pool_size", 8))
+    bulkheads = conf().get("handler_pool_bulkheads") or {}
+    with handler_pools_lock:
+        for name, pool in handler_pools.items():
+            if name in bulkheads:
+                pool.resize(int(bulkheads[name]))
+
+
+def get_handler_pool_stats():
+    with handler_pools_lock:
+        return [pool.stats() for pool in handler_pools.values()]
 
 
 # 抽象类, 它包含了与消息通道无关的通用处理逻辑
@@ -27,8 +65,11 @@ class ChatChannel(Channel):
     futures = {}  # 记录每个session_id提交到线程池的future对象, 用于重置会话时把没执行的future取消掉，正在执行的不会被取消
     sessions = {}  # 用于控制并发，每个session_id同时只能有一个context在处理
     lock = threading.Lock()  # 用于控制对sessions的访问
+    ready_sessions = {}  # 有待调度任务的session_id，按唤醒顺序排列，value无意义
+    ready_cond = threading.Condition(lock)  # 新消息入队或worker结束时唤醒消费者线程
 
     def __init__(self):
+        resize_handler_pools()
         _thread = threading.Thread(target=self.consume)
         _thread.setDaemon(True)
         _thread.start()
@@ -223,11 +264,12 @@ class ChatChannel(Channel):
                         reply = self._generate_reply(new_context)
                     else:
                         return
-            elif context.type == ContextType.IMAGE:  # 图片消息，当前仅做下载保存到本地的逻辑
+            elif context.type == ContextType.IMAGE:  # 图片消息，保存到缓存，由bot在后台提前下载和上传
                 memory.USER_IMAGE_CACHE[context["session_id"]] = {
                     "path": context.content,
                     "msg": context.get("msg")
                 }
+                Bridge().prefetch_image(context)
             elif context.type == ContextType.ACCEPT_FRIEND:  # 好友申请，匹配字符串
                 reply = self._build_friend_request_reply(context)
             elif context.type == ContextType.SHARING:  # 分享信息，当前无默认逻辑
@@ -339,10 +381,32 @@ class ChatChannel(Channel):
                 logger.exception("Worker raise exception: {}".format(e))
             with self.lock:
                 self.sessions[session_id][1].release()
+                self._notify_ready(session_id)
 
         return func
 
+    # 标记session有待调度的任务并唤醒消费者线程，调用方需持有self.lock
+    def _notify_ready(self, session_id):
+        self.ready_sessions[session_id] = None
+        self.ready_cond.notify()
+
     def produce(self, context: Context):
+        coalescer = self._get_coalescer()
+        if coalescer and coalescer.offer(context):
+            return
+        self._enqueue(context)
+
+    # 开启message_coalesce_window时返回消息合并器，合并后的消息再进入队列
+    def _get_coalescer(self):
+        window = conf().get("message_coalesce_window", 0)
+        if not window:
+            return None
+        with self.lock:
+            if getattr(self, "_coalescer", None) is None or self._coalescer.window != window:
+                self._coalescer = MessageCoalescer(window, self._enqueue)
+            return self._coalescer
+
+    def _enqueue(self, context: Context):
         session_id = context.get("session_id", 0)
         with self.lock:
             if session_id not in self.sessions:
@@ -354,39 +418,50 @@ class ChatChannel(Channel):
                 self.sessions[session_id][0].putleft(context)  # 优先处理管理命令
             else:
                 self.sessions[session_id][0].put(context)
+            self._notify_ready(session_id)
 
-    # 消费者函数，单独线程，用于从消息队列中取出消息并处理
+    # 消费者函数，单独线程，只在produce或worker结束时被唤醒，并且只扫描有待调度任务的session
     def consume(self):
         while True:
-            with self.lock:
-                session_ids = list(self.sessions.keys())
+            with self.ready_cond:
+                while not self.ready_sessions:
+                    self.ready_cond.wait()
+                session_ids = list(self.ready_sessions.keys())
+                self.ready_sessions.clear()
             for session_id in session_ids:
-                with self.lock:
-                    context_queue, semaphore = self.sessions[session_id]
-                if semaphore.acquire(blocking=False):  # 等线程处理完毕才能删除
-                    if not context_queue.empty():
-                        context = context_queue.get()
-                        logger.debug("[chat_channel] consume context: {}".format(context))
-                        future: Future = handler_pool.submit(self._handle, context)
-                        future.add_done_callback(self._thread_pool_callback(session_id, context=context))
-                        with self.lock:
-                            if session_id not in self.futures:
-                                self.futures[session_id] = []
-                            self.futures[session_id].append(future)
-                    elif semaphore._initial_value == semaphore._value + 1:  # 除了当前，没有任务再申请到信号量，说明所有任务都处理完毕
-                        with self.lock:
-                            self.futures[session_id] = [t for t in self.futures[session_id] if not t.done()]
-                            assert len(self.futures[session_id]) == 0, "thread pool error"
-                            del self.sessions[session_id]
-                    else:
-                        semaphore.release()
-            time.sleep(0.2)
+                self._dispatch(session_id)
+
+    # 在concurrency_in_session允许的范围内提交session的排队消息，没有排队和处理中的消息时删除session
+    def _dispatch(self, session_id):
+        while True:
+            with self.lock:
+                if session_id not in self.sessions:
+                    return
+                context_queue, semaphore = self.sessions[session_id]
+                if not semaphore.acquire(blocking=False):
+                    return  # 并发已满，等worker结束后再次唤醒
+                if context_queue.empty():
+                    semaphore.release()
+                    if semaphore._initial_value == semaphore._value:  # 没有正在处理的任务，说明所有任务都处理完毕
+                        self.futures[session_id] = [t for t in self.futures.get(session_id, []) if not t.done()]
+                        assert len(self.futures[session_id]) == 0, "thread pool error"
+                        del self.futures[session_id]
+                        del self.sessions[session_id]
+                    return
+                context = context_queue.get()
+            logger.debug("[chat_channel] consume context: {}".format(context))
+            future: Future = get_handler_pool(context).submit(self._handle, context)
+            with self.lock:
+                if session_id not in self.futures:
+                    self.futures[session_id] = []
+                self.futures[session_id].append(future)
+            future.add_done_callback(self._thread_pool_callback(session_id, context=context))
 
     # 取消session_id对应的所有任务，只能取消排队的消息和已提交线程池但未执行的任务
     def cancel_session(self, session_id):
         with self.lock:
             if session_id in self.sessions:
-                for future in self.futures[session_id]:
+                for future in self.futures.get(session_id, []):
                     future.cancel()
                 cnt = self.sessions[session_id][0].qsize()
                 if cnt > 0:
@@ -396,7 +471,7 @@ class ChatChannel(Channel):
     def cancel_all_session(self):
         with self.lock:
             for session_id in self.sessions:
-                for future in self.futures[session_id]:
+                for future in self.futures.get(session_id, []):
                     future.cancel()
                 cnt = self.sessions[session_id][0].qsize()
                 if cnt > 0:
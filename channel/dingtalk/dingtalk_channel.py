@@ -20,9 +20,9 @@ from bridge.context import Context, ContextType
 from bridge.reply import Reply, ReplyType
 from channel.chat_channel import ChatChannel
 from channel.dingtalk.dingtalk_message import DingTalkMessage
-from common.expired_dict import ExpiredDict
 from common.log import logger
 from common.singleton import singleton
+from common.state_backend import DedupeSet
 from common.time_check import time_checker
 from config import conf
 
@@ -65,10 +65,9 @@ AICardReplier.start = CustomAICardReplier.start
 def _check(func):
     def wrapper(self, cmsg: DingTalkMessage):
         msgId = cmsg.msg_id
-        if msgId in self.receivedMsgs:
+        if not self.receivedMsgs.add(msgId):
             logger.info("DingTalk message {} already received, ignore".format(msgId))
             return
-        self.receivedMsgs[msgId] = True
         create_time = cmsg.create_time  # 消息时间戳
         if conf().get("hot_reload") == True and int(create_time) < int(time.time()) - 60:  # 跳过1分钟前的历史消息
             logger.debug("[DingTalk] History message {} skipped".format(msgId))
@@ -100,7 +99,7 @@ class DingTalkChanel(ChatChannel, dingtalk_stream.ChatbotHandler):
         super(dingtalk_stream.ChatbotHandler, self).__init__()
         self.logger = self.setup_logger()
         # 历史消息id暂存，用于幂等控制
-        self.receivedMsgs = ExpiredDict(conf().get("expires_in_seconds", 3600))
+        self.receivedMsgs = DedupeSet("dingtalk", conf().get("expires_in_seconds", 3600))
         logger.info("[DingTalk] client_id={}, client_secret={} ".format(
             self.dingtalk_client_id, self.dingtalk_client_secret))
         # 无需群校验和前缀
@@ -16,7 +16,7 @@ from bridge.reply import Reply, ReplyType
 from common.log import logger
 from common.singleton import singleton
 from config import conf
-from common.expired_dict import ExpiredDict
+from common.state_backend import DedupeSet
 from bridge.context import ContextType
 from channel.chat_channel import ChatChannel, check_prefix
 from common import utils
@@ -35,7 +35,7 @@ class FeiShuChanel(ChatChannel):
     def __init__(self):
         super().__init__()
         # 历史消息id暂存，用于幂等控制
-        self.receivedMsgs = ExpiredDict(60 * 60 * 7.1)
+        self.receivedMsgs = DedupeSet("feishu", 60 * 60 * 7.1)
         logger.info("[FeiShu] app_id={}, app_secret={} verification_token={}".format(
             self.feishu_app_id, self.feishu_app_secret, self.feishu_token))
         # 无需群校验和前缀
@@ -181,10 +181,9 @@ class FeishuController:
                 msg = event.get("message")
 
                 # 幂等判断
-                if channel.receivedMsgs.get(msg.get("message_id")):
+                if not channel.receivedMsgs.add(msg.get("message_id")):
                     logger.warning(f"[FeiShu] repeat msg filtered, event_id={header.get('event_id')}")
                     return self.SUCCESS_MSG
-                channel.receivedMsgs[msg.get("message_id")] = True
 
                 is_group = False
                 chat_type = msg.get("chat_type")
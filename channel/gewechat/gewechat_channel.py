@@ -6,18 +6,36 @@ from urllib.parse import urlparse
 
 from bridge.context import Context, ContextType
 from bridge.reply import Reply, ReplyType
+from channel.callback_queue import CallbackQueue
 from channel.chat_channel import ChatChannel
 from channel.gewechat.gewechat_message import GeWeChatMessage
+from channel.message_prefilter import MessagePreFilter
 from common.log import logger
 from common.singleton import singleton
 from common.tmp_dir import TmpDir
 from config import conf, save_config
-from lib.gewechat import GewechatClient
+from lib.gewechat import ContactCache, GewechatClient
 from voice.audio_convert import mp3_to_silk
 import uuid
 
 MAX_UTF8_LEN = 2048
 
+# GeWeChatMessage支持解析的消息类型，51为状态同步消息，直接忽略
+GEWECHAT_MSG_TYPES = {1, 3, 34, 47, 49, 10002}
+
+
+def create_client(base_url, token):
+    timeout = conf().get("gewechat_http_timeout", 60)
+    return GewechatClient(
+        base_url,
+        token,
+        timeout=timeout,
+        media_timeout=timeout * 3,
+        retries=conf().get("gewechat_http_retries", 2),
+        pool_size=conf().get("gewechat_http_pool_size", 10),
+    )
+
+
 @singleton
 class GeWeChatChannel(ChatChannel):
     NOT_SUPPORT_REPLYTYPE = []
@@ -30,7 +48,7 @@ class GeWeChatChannel(ChatChannel):
             logger.error("[gewechat] base_url is not set")
             return
         self.token = conf().get("gewechat_token")
-        self.client = GewechatClient(self.base_url, self.token)
+        self.client = create_client(self.base_url, self.token)
 
         # 如果token为空，尝试获取token
         if not self.token:
@@ -44,7 +62,18 @@ class GeWeChatChannel(ChatChannel):
             conf().set("gewechat_token", self.token)
             save_config()
             logger.info(f"[gewechat] new token saved: {self.token}")
-            self.client = GewechatClient(self.base_url, self.token)
+            self.client = create_client(self.base_url, self.token)
+
+        # 联系人、群成员昵称缓存，避免每条消息都请求gewechat服务
+        self.contact_cache = ContactCache(self.client, ttl=conf().get("gewechat_contact_cache_ttl", 3600))
+        self.prefilter = MessagePreFilter("gewechat")
+        # 回调消息接收队列，按会话分配处理线程，按NewMsgId去重
+        self.callback_queue = CallbackQueue(
+            "gewechat",
+            self.handle_callback,
+            workers=conf().get("gewechat_callback_workers", 4),
+            max_size=conf().get("gewechat_callback_queue_size", 1000),
+        )
 
         self.app_id = conf().get("gewechat_app_id")
         if not self.app_id:
@@ -56,6 +85,69 @@ class GeWeChatChannel(ChatChannel):
 
         logger.info(f"[gewechat] init: base_url: {self.base_url}, token: {self.token}, app_id: {self.app_id}, download_url: {self.download_url}")
 
+    def prefilter_callback(self, data):
+        """
+        根据回调的原始数据判断消息是否一定会被忽略，返回丢弃原因，需要处理时返回None
+        只读取字典字段和本地缓存，不发起网络请求，也不解析XML
+        """
+        msg_data = data.get('Data') or data.get('data') or {}
+        if 'NewMsgId' not in msg_data:
+            return "no_msg_id"
+        msg_type = msg_data.get('MsgType')
+        if msg_type not in GEWECHAT_MSG_TYPES:
+            return "msg_type"
+        if msg_type == 34 and conf().get("speech_recognition") != True:
+            return "voice"
+        from_user_id = (msg_data.get('FromUserName') or {}).get('string', '')
+        if data.get('Wxid') == from_user_id:
+            return "self"
+        if self.prefilter.is_expired(msg_data.get('CreateTime', 0), 60 * 5):
+            return "expired"
+        if "@chatroom" in from_user_id:
+            # 群名只从缓存中获取，未缓存时放行，解析消息时会缓存群名，之后同一个群的消息即可在这里过滤
+            group_name = self.contact_cache.peek_nickname(from_user_id)
+            if self.prefilter.group_allowed(group_name) is False:
+                return "group_white_list"
+        return None
+
+    def handle_callback(self, data):
+        """在后台线程中解析回调消息并生成context"""
+        gewechat_msg = GeWeChatMessage(data, self.client, self.contact_cache)
+        
+        # 微信客户端的状态同步消息
+        if gewechat_msg.ctype == ContextType.STATUS_SYNC:
+            logger.debug(f"[gewechat] ignore status sync message: {gewechat_msg.content}")
+            return
+
+        # 忽略非用户消息（如公众号、系统通知等）
+        if gewechat_msg.ctype == ContextType.NON_USER_MSG:
+            logger.debug(f"[gewechat] ignore non-user message from {gewechat_msg.from_user_id}: {gewechat_msg.content}")
+            return
+
+        # 判断是否需要忽略语音消息
+        if gewechat_msg.ctype == ContextType.VOICE:
+            if conf().get("speech_recognition") != True:
+                return
+
+        # 忽略来自自己的消息
+        if gewechat_msg.my_msg:
+            logger.debug(f"[gewechat] ignore message from myself: {gewechat_msg.actual_user_id}: {gewechat_msg.content}")
+            return
+
+        # 忽略过期的消息
+        if int(gewechat_msg.create_time) < int(time.time()) - 60 * 5: # 跳过5分钟前的历史消息
+            logger.debug(f"[gewechat] ignore expired message from {gewechat_msg.actual_user_id}: {gewechat_msg.content}")
+            return
+
+        context = self._compose_context(
+            gewechat_msg.ctype,
+            gewechat_msg.content,
+            isgroup=gewechat_msg.is_group,
+            msg=gewechat_msg,
+        )
+        if context:
+            self.produce(context)
+
     def startup(self):
         # 如果app_id为空或登录后获取到新的app_id，保存配置
         app_id, error_msg = self.client.login(self.app_id)
@@ -213,39 +305,24 @@ class Query:
             logger.debug(f"[gewechat] 收到gewechat服务发送的回调测试消息")
             return "success"
 
-        gewechat_msg = GeWeChatMessage(data, channel.client)
-        
-        # 微信客户端的状态同步消息
-        if gewechat_msg.ctype == ContextType.STATUS_SYNC:
-            logger.debug(f"[gewechat] ignore status sync message: {gewechat_msg.content}")
-            return "success"
-
-        # 忽略非用户消息（如公众号、系统通知等）
-        if gewechat_msg.ctype == ContextType.NON_USER_MSG:
-            logger.debug(f"[gewechat] ignore non-user message from {gewechat_msg.from_user_id}: {gewechat_msg.content}")
+        # 联系人信息变更或被删除，使缓存的昵称失效
+        if isinstance(data, dict) and data.get('TypeName') in ('ModContacts', 'DelContacts'):
+            channel.contact_cache.handle_callback(data)
+            logger.debug(f"[gewechat] contact changed: {data.get('TypeName')}")
             return "success"
 
-        # 判断是否需要忽略语音消息
-        if gewechat_msg.ctype == ContextType.VOICE:
-            if conf().get("speech_recognition") != True:
-                return "success"
-
-        # 忽略来自自己的消息
-        if gewechat_msg.my_msg:
-            logger.debug(f"[gewechat] ignore message from myself: {gewechat_msg.actual_user_id}: {gewechat_msg.content}")
+        if not isinstance(data, dict):
+            logger.warning(f"[gewechat] ignore invalid callback data: {web_data}")
             return "success"
 
-        # 忽略过期的消息
-        if int(gewechat_msg.create_time) < int(time.time()) - 60 * 5: # 跳过5分钟前的历史消息
-            logger.debug(f"[gewechat] ignore expired message from {gewechat_msg.actual_user_id}: {gewechat_msg.content}")
+        reason = channel.prefilter_callback(data)
+        if reason:
+            channel.prefilter.drop(reason)
+            logger.debug(f"[gewechat] message dropped by prefilter: {reason}")
             return "success"
 
-        context = channel._compose_context(
-            gewechat_msg.ctype,
-            gewechat_msg.content,
-            isgroup=gewechat_msg.is_group,
-            msg=gewechat_msg,
-        )
-        if context:
-            channel.produce(context)
+        # 只做校验后入队，解析消息、查询昵称、插件处理等交给后台线程，尽快响应gewechat服务
+        msg_data = data.get('Data') or data.get('data') or {}
+        shard_key = (msg_data.get('FromUserName') or {}).get('string')
+        channel.callback_queue.put(data, shard_key=shard_key, dedupe_key=msg_data.get('NewMsgId'))
         return "success"
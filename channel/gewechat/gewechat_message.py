@@ -6,7 +6,7 @@ from channel.chat_message import ChatMessage
 from common.log import logger
 from common.tmp_dir import TmpDir
 from config import conf
-from lib.gewechat import GewechatClient
+from lib.gewechat import ContactCache, GewechatClient
 import requests
 import xml.etree.ElementTree as ET
 
@@ -299,7 +299,7 @@ import xml.etree.ElementTree as ET
 """
 
 class GeWeChatMessage(ChatMessage):
-    def __init__(self, msg, client: GewechatClient):
+    def __init__(self, msg, client: GewechatClient, contact_cache: ContactCache = None):
         super().__init__(msg)
         self.msg = msg
         self.content = ''  # 初始化self.content为空字符串
@@ -487,10 +487,13 @@ class GeWeChatMessage(ChatMessage):
             raise NotImplementedError(f"Unsupported message type: Type:{msg_type}")
 
         # 获取群聊或好友的名称
-        brief_info_response = self.client.get_brief_info(self.app_id, [self.other_user_id])
-        if brief_info_response.get('ret') == 200 and brief_info_response.get('data'):
-            brief_info = brief_info_response['data'][0]
-            self.other_user_nickname = brief_info.get('nickName', self.other_user_id)
+        if contact_cache:
+            self.other_user_nickname = contact_cache.get_nickname(self.app_id, self.other_user_id) or self.other_user_id
+        else:
+            brief_info_response = self.client.get_brief_info(self.app_id, [self.other_user_id])
+            if brief_info_response.get('ret') == 200 and brief_info_response.get('data'):
+                brief_info = brief_info_response['data'][0]
+                self.other_user_nickname = brief_info.get('nickName', self.other_user_id)
 
         if self.is_group:
             # 如果是群聊消息，获取实际发送者信息
@@ -528,14 +531,18 @@ class GeWeChatMessage(ChatMessage):
                 }
             }
             """
-            chatroom_member_list_response = self.client.get_chatroom_member_list(self.app_id, self.from_user_id)
-            if chatroom_member_list_response.get('ret') == 200 and chatroom_member_list_response.get('data', {}).get('memberList'):
-                # 从群成员列表中匹配acual_user_id
-                for member_info in chatroom_member_list_response['data']['memberList']:
-                    if member_info['wxid'] == self.actual_user_id:
-                         # 先获取displayName，如果displayName为空，再获取nickName
-                        self.actual_user_nickname = member_info.get('displayName') or member_info.get('nickName', self.actual_user_id)
-                        break
+            if contact_cache:
+                # 群成员列表按wxid缓存，先获取displayName，如果displayName为空，再获取nickName
+                self.actual_user_nickname = contact_cache.get_member_nickname(self.app_id, self.from_user_id, self.actual_user_id)
+            else:
+                chatroom_member_list_response = self.client.get_chatroom_member_list(self.app_id, self.from_user_id)
+                if chatroom_member_list_response.get('ret') == 200 and chatroom_member_list_response.get('data', {}).get('memberList'):
+                    # 从群成员列表中匹配acual_user_id
+                    for member_info in chatroom_member_list_response['data']['memberList']:
+                        if member_info['wxid'] == self.actual_user_id:
+                             # 先获取displayName，如果displayName为空，再获取nickName
+                            self.actual_user_nickname = member_info.get('displayName') or member_info.get('nickName', self.actual_user_id)
+                            break
             self.actual_user_nickname = self.actual_user_nickname or self.actual_user_id
 
                         # 检查是否被at
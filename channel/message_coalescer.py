@@ -0,0 +1,100 @@
+import heapq
+import threading
+import time
+
+from bridge.context import Context, ContextType
+from common.log import logger
+from config import conf
+
+
+class MessageCoalescer:
+    """
+    按session合并短时间内连续发送的文本消息，合并后只调用一次bot
+    每收到一条新消息，等待窗口重新计时，但从第一条消息开始最多等待3个窗口，避免持续发消息时一直不回复
+    管理命令、插件命令以及非文本消息不参与合并，并且会先把该session已缓存的消息放行，保证顺序
+    """
+
+    def __init__(self, window, flush_fn):
+        self.window = window
+        self.max_wait = window * 3
+        self.flush_fn = flush_fn  # 合并后的context交给flush_fn处理
+        self.pending = {}  # session_id -> {"contexts": [], "first_at": float, "deadline": float}
+        self.heap = []  # (deadline, session_id)，过期的条目在弹出时忽略
+        self.cond = threading.Condition()
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def offer(self, context: Context) -> bool:
+        """返回True表示消息已被缓存等待合并，False表示调用方需要立即处理"""
+        session_id = context.get("session_id")
+        if not self._coalescable(context):
+            self.flush(session_id)
+            return False
+        now = time.monotonic()
+        expired = None
+        with self.cond:
+            entry = self.pending.get(session_id)
+            if entry and self._sender(entry["contexts"][-1]) != self._sender(context):
+                # 共享会话的群里不同用户的消息不合并
+                expired = self.pending.pop(session_id)
+                entry = None
+            if entry is None:
+                entry = {"contexts": [], "first_at": now}
+                self.pending[session_id] = entry
+            entry["contexts"].append(context)
+            entry["deadline"] = min(now + self.window, entry["first_at"] + self.max_wait)
+            heapq.heappush(self.heap, (entry["deadline"], session_id))
+            self.cond.notify()
+        if expired:
+            self._emit(expired["contexts"])
+        return True
+
+    def flush(self, session_id):
+        with self.cond:
+            entry = self.pending.pop(session_id, None)
+        if entry:
+            self._emit(entry["contexts"])
+
+    def _coalescable(self, context: Context):
+        if context.type != ContextType.TEXT:
+            return False
+        content = context.content or ""
+        if content.startswith("#"):
+            return False
+        plugin_trigger_prefix = conf().get("plugin_trigger_prefix", "$")
+        if plugin_trigger_prefix and content.startswith(plugin_trigger_prefix):
+            return False
+        return True
+
+    def _sender(self, context: Context):
+        msg = context.get("msg")
+        if msg is None:
+            return None
+        return msg.actual_user_id if context.get("isgroup", False) else msg.from_user_id
+
+    def _emit(self, contexts):
+        context = contexts[-1]  # 以最后一条消息为准进行回复
+        if len(contexts) > 1:
+            context.content = "\n".join(c.content for c in contexts)
+            logger.debug("[MessageCoalescer] merge {} messages in session {}".format(len(contexts), context.get("session_id")))
+        try:
+            self.flush_fn(context)
+        except Exception as e:
+            logger.exception("[MessageCoalescer] flush error: {}".format(e))
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.heap:
+                    self.cond.wait()
+                deadline, session_id = self.heap[0]
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self.cond.wait(remaining)
+                    continue
+                heapq.heappop(self.heap)
+                entry = self.pending.get(session_id)
+                if entry is None or entry["deadline"] > deadline:
+                    continue  # 已被放行或窗口已顺延
+                del self.pending[session_id]
+            self._emit(entry["contexts"])
@@ -0,0 +1,61 @@
+import re
+import threading
+import time
+from collections import Counter
+
+from config import conf
+
+
+class MessagePreFilter:
+    """
+    消息预过滤
+    在构造ChatMessage之前直接根据回调的原始数据判断消息是否需要处理，
+    不在白名单中的群、过期的消息、自己发送的消息等在这一步就被丢弃，不再触发网络请求和XML解析
+    这里只做确定会被后续流程丢弃的判断，判断不了的消息（如群名未知）一律放行，由_compose_context再次检查
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.dropped = Counter()  # 丢弃原因 -> 次数
+        self._rules_key = None
+        self._rules = None
+
+    def drop(self, reason):
+        with self.lock:
+            self.dropped[reason] += 1
+
+    def group_allowed(self, group_name):
+        """群名是否在group_name_white_list或group_name_keyword_white_list中，群名未知且无法判断时返回None"""
+        allow_all, names, keyword_pattern = self._compiled_rules()
+        if allow_all:
+            return True
+        if group_name is None:
+            return None
+        if group_name in names:
+            return True
+        return bool(keyword_pattern and keyword_pattern.search(group_name))
+
+    @staticmethod
+    def is_expired(create_time, max_age):
+        try:
+            return int(create_time) < int(time.time()) - max_age
+        except (TypeError, ValueError):
+            return False
+
+    def stats(self):
+        with self.lock:
+            return {"name": self.name, "dropped": dict(self.dropped)}
+
+    def _compiled_rules(self):
+        # 白名单可能被#reconf或管理后台修改，配置变化时重新编译
+        white_list = conf().get("group_name_white_list", []) or []
+        keyword_white_list = conf().get("group_name_keyword_white_list", []) or []
+        key = (tuple(white_list), tuple(keyword_white_list))
+        if key != self._rules_key:
+            keyword_pattern = None
+            if keyword_white_list:
+                keyword_pattern = re.compile("|".join(re.escape(keyword) for keyword in keyword_white_list))
+            self._rules = ("ALL_GROUP" in white_list, frozenset(white_list), keyword_pattern)
+            self._rules_key = key
+        return self._rules
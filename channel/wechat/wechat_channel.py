@@ -14,6 +14,7 @@ import requests
 from bridge.context import *
 from bridge.reply import *
 from channel.chat_channel import ChatChannel
+from channel.message_prefilter import MessagePreFilter
 from channel import chat_channel
 from channel.wechat.wechat_message import *
 from common.expired_dict import ExpiredDict
@@ -28,6 +29,8 @@ from lib.itchat.content import *
 
 @itchat.msg_register([TEXT, VOICE, PICTURE, NOTE, ATTACHMENT, SHARING])
 def handler_single_msg(msg):
+    if not WechatChannel().prefilter_msg(msg, False):
+        return None
     try:
         cmsg = WechatMessage(msg, False)
     except NotImplementedError as e:
@@ -39,6 +42,8 @@ def handler_single_msg(msg):
 
 @itchat.msg_register([TEXT, VOICE, PICTURE, NOTE, ATTACHMENT, SHARING], isGroupChat=True)
 def handler_group_msg(msg):
+    if not WechatChannel().prefilter_msg(msg, True):
+        return None
     try:
         cmsg = WechatMessage(msg, True)
     except NotImplementedError as e:
@@ -141,8 +146,26 @@ class WechatChannel(ChatChannel):
 
     def __init__(self):
         super().__init__()
-        self.receivedMsgs = ExpiredDict(conf().get("expires_in_seconds", 3600))
+        self.receivedMsgs = ExpiredDict(conf().get("expires_in_seconds", 3600), refresh_on_access=False)
         self.auto_login_times = 0
+        self.prefilter = MessagePreFilter("wx")
+
+    def prefilter_msg(self, msg, is_group):
+        """在构造WechatMessage之前，根据itchat原始消息丢弃一定会被忽略的消息，返回是否需要继续处理"""
+        reason = None
+        if conf().get("hot_reload") == True and self.prefilter.is_expired(msg.get("CreateTime", 0), 60):
+            reason = "expired"
+        elif is_group:
+            group_name = (msg.get("User") or {}).get("NickName")
+            if self.prefilter.group_allowed(group_name) is False:
+                reason = "group_white_list"
+        elif msg.get("User") and msg["ToUserName"] == msg["User"].get("UserName") and msg["ToUserName"] != msg["FromUserName"]:
+            reason = "self"
+        if reason:
+            self.prefilter.drop(reason)
+            logger.debug("[WX]message {} dropped by prefilter: {}".format(msg.get("MsgId"), reason))
+            return False
+        return True
 
     def startup(self):
         try:
@@ -17,6 +17,7 @@ from channel.wechatcom.wechatcomapp_client import WechatComAppClient
 from channel.wechatcom.wechatcomapp_message import WechatComAppMessage
 from common.log import logger
 from common.singleton import singleton
+from common.state_backend import DedupeSet
 from common.utils import compress_imgfile, fsize, split_string_by_utf8_length, convert_webp_to_png, remove_markdown_symbol
 from config import conf, subscribe_msg
 from voice.audio_convert import any_to_amr, split_audio
@@ -41,6 +42,8 @@ class WechatComAppChannel(ChatChannel):
         )
         self.crypto = WeChatCrypto(self.token, self.aes_key, self.corp_id)
         self.client = WechatComAppClient(self.corp_id, self.secret)
+        # 企业微信5秒内未收到响应会重试推送，按msg_id去重，多个副本收到同一条消息时也只处理一次
+        self.receivedMsgs = DedupeSet("wechatcom", 60)
 
     def startup(self):
         # start message listener
@@ -174,6 +177,9 @@ class Query:
             except NotImplementedError as e:
                 logger.debug("[wechatcom] " + str(e))
                 return "success"
+            if not channel.receivedMsgs.add(wechatcom_msg.msg_id):
+                logger.info("[wechatcom] repeat msg {} filtered".format(wechatcom_msg.msg_id))
+                return "success"
             context = channel._compose_context(
                 wechatcom_msg.ctype,
                 wechatcom_msg.content,
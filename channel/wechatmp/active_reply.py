@@ -40,6 +40,9 @@ class Query:
                 from_user = wechatmp_msg.from_user_id
                 content = wechatmp_msg.content
                 message_id = wechatmp_msg.msg_id
+                if not channel.receivedMsgs.add(message_id):
+                    logger.info("[wechatmp] repeat msg {} filtered".format(message_id))
+                    return "success"
 
                 logger.info(
                     "[wechatmp] {}:{} Receive post query {} {}: {}".format(
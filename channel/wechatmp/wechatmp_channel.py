@@ -19,6 +19,7 @@ from channel.wechatmp.common import *
 from channel.wechatmp.wechatmp_client import WechatMPClient
 from common.log import logger
 from common.singleton import singleton
+from common.state_backend import DedupeSet
 from common.utils import split_string_by_utf8_length, remove_markdown_symbol
 from config import conf
 from voice.audio_convert import any_to_mp3, split_audio
@@ -57,6 +58,9 @@ class WechatMPChannel(ChatChannel):
             t = threading.Thread(target=self.start_loop, args=(self.delete_media_loop,))
             t.setDaemon(True)
             t.start()
+        else:
+            # 微信服务器5秒内未收到响应会重试推送，按msg_id去重，多个副本收到同一条消息时也只处理一次
+            self.receivedMsgs = DedupeSet("wechatmp", 60)
 
     def startup(self):
         if self.passive_reply:
@@ -0,0 +1,126 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+from common.log import logger
+
+
+class Bulkhead:
+    """
+    可在运行时调整大小的线程池，用于隔离不同类型的任务，防止某一类慢任务占满所有线程
+    提交接口与ThreadPoolExecutor保持一致，返回concurrent.futures.Future
+    """
+
+    def __init__(self, name, max_workers, initializer=None):
+        if max_workers <= 0:
+            raise ValueError("max_workers must be greater than 0")
+        self.name = name
+        self._max_workers = max_workers
+        self._initializer = initializer  # 每个工作线程启动时调用，兼容ThreadPoolExecutor的同名属性
+        self._shutdown = False
+        self._work_queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._workers = 0  # 当前存活的工作线程数
+        self._idle = 0  # 空闲等待任务的工作线程数
+        self._busy = 0  # 正在执行任务的工作线程数
+        self._pending = 0  # 已提交但尚未开始执行的任务数
+        self._peak_pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._saturated = 0  # 提交时所有线程都在忙、任务需要排队的次数
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            future = Future()
+            self._submitted += 1
+            self._pending += 1
+            self._peak_pending = max(self._peak_pending, self._pending)
+            if self._idle < self._pending:
+                if self._workers < self._max_workers:
+                    self._start_worker()
+                else:
+                    self._saturated += 1
+            self._work_queue.put((future, fn, args, kwargs))
+        return future
+
+    def resize(self, max_workers):
+        """调整线程数上限，扩容时按需创建线程，缩容时多余的线程在完成当前任务后退出"""
+        if max_workers <= 0:
+            raise ValueError("max_workers must be greater than 0")
+        with self._lock:
+            if max_workers == self._max_workers:
+                return
+            logger.info("[Bulkhead] resize {} from {} to {}".format(self.name, self._max_workers, max_workers))
+            self._max_workers = max_workers
+            # 唤醒空闲线程检查是否需要退出
+            for _ in range(max(0, self._workers - max_workers)):
+                self._work_queue.put(None)
+            # 扩容时为排队中的任务补充线程
+            while self._workers < self._max_workers and self._idle < self._pending:
+                self._start_worker()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._shutdown = True
+            for _ in range(self._workers):
+                self._work_queue.put(None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "max_workers": self._max_workers,
+                "workers": self._workers,
+                "busy": self._busy,
+                "queue_depth": self._pending,
+                "peak_queue_depth": self._peak_pending,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "saturated": self._saturated,
+                "saturation": round(self._busy / self._max_workers, 2),
+            }
+
+    def _start_worker(self):
+        # 调用方需持有self._lock
+        self._workers += 1
+        thread = threading.Thread(target=self._worker, name=f"{self.name}-{self._workers}", daemon=True)
+        thread.start()
+
+    def _should_exit(self):
+        # 调用方需持有self._lock
+        if self._shutdown or self._workers > self._max_workers:
+            self._workers -= 1
+            return True
+        return False
+
+    def _worker(self):
+        if self._initializer:
+            try:
+                self._initializer()
+            except Exception as e:
+                logger.exception("[Bulkhead] {} initializer error: {}".format(self.name, e))
+        while True:
+            with self._lock:
+                if self._should_exit():
+                    return
+                self._idle += 1
+            item = self._work_queue.get()
+            with self._lock:
+                self._idle -= 1
+                if item is None:
+                    if self._should_exit():
+                        return
+                    continue
+                self._pending -= 1
+                self._busy += 1
+            future, fn, args, kwargs = item
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            with self._lock:
+                self._busy -= 1
+                self._completed += 1
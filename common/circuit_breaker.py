@@ -0,0 +1,126 @@
+import threading
+import time
+
+import requests
+
+from common.log import logger
+
+_local = threading.local()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    后端熔断器
+    closed: 正常放行，连续失败达到failure_threshold次后打开
+    open: 直接拒绝请求，让消息快速失败并释放处理线程，recovery_timeout秒后进入half_open
+    half_open: 只放行half_open_probes个探测请求，探测成功则关闭，失败则重新打开
+    失败由bot调用report_failure()上报，或bot.reply抛出连接、超时等网络异常时由Bridge上报
+    """
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30, half_open_probes=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = half_open_probes
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0  # 连续失败次数
+        self.opened_at = 0
+        self.probes = 0  # 半开状态下正在进行的探测请求数
+        self.trips = 0  # 打开的次数
+        self.rejected = 0
+
+    def acquire(self) -> bool:
+        """返回False表示熔断器打开，应直接返回错误提示"""
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+                self.state = HALF_OPEN
+                self.probes = 0
+                logger.info("[CircuitBreaker] {} half open, probing".format(self.name))
+            probe = False
+            if self.state == OPEN or (self.state == HALF_OPEN and self.probes >= self.half_open_probes):
+                self.rejected += 1
+                return False
+            if self.state == HALF_OPEN:
+                self.probes += 1
+                probe = True
+        _calls().append(_Call(self, probe))
+        return True
+
+    def release(self):
+        call = _calls().pop()
+        with self.lock:
+            if call.probe:
+                self.probes -= 1
+            if call.failed:
+                return
+            if self.state == HALF_OPEN and call.probe:
+                self.state = CLOSED
+                logger.info("[CircuitBreaker] {} closed, backend recovered".format(self.name))
+            if self.state == CLOSED:
+                self.failures = 0
+
+    def on_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.trips += 1
+                logger.warning("[CircuitBreaker] {} open after {} failures, fail fast for {}s".format(
+                    self.name, self.failures, self.recovery_timeout))
+            return self.state == OPEN
+
+    def stats(self):
+        with self.lock:
+            retry_in = 0
+            if self.state == OPEN:
+                retry_in = max(0, int(self.opened_at + self.recovery_timeout - time.monotonic()))
+            return {
+                "name": self.name,
+                "state": self.state,
+                "failures": self.failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "retry_in": retry_in,
+            }
+
+
+def is_transport_error(e) -> bool:
+    """连接失败、超时等与后端通信的异常，解析结果等本地代码的异常不算后端故障"""
+    return isinstance(e, (requests.RequestException, ConnectionError, TimeoutError))
+
+
+def report_failure() -> bool:
+    """
+    由bot在后端连接失败、超时或返回5xx时调用，记录到当前线程正在使用的熔断器
+    一次调用中多次重试失败只计一次失败
+    返回True表示熔断器已打开，bot应放弃重试；不在熔断调用中时返回False
+    """
+    calls = _calls()
+    if not calls:
+        return False
+    call = calls[-1]
+    if call.failed:
+        with call.breaker.lock:
+            return call.breaker.state == OPEN
+    call.failed = True
+    return call.breaker.on_failure()
+
+
+class _Call:
+    def __init__(self, breaker, probe):
+        self.breaker = breaker
+        self.probe = probe
+        self.failed = False
+
+
+def _calls():
+    # 当前线程正在进行的熔断调用，插件中可能嵌套调用bot，因此使用栈保存
+    if not hasattr(_local, "calls"):
+        _local.calls = []
+    return _local.calls
@@ -0,0 +1,128 @@
+import threading
+import time
+
+from common.log import logger
+
+_local = threading.local()
+
+
+class AdaptiveLimiter:
+    """
+    基于AIMD(加性增、乘性减)的自适应并发限制器
+    请求正常返回时并发上限缓慢增加，后端返回429/5xx或延迟明显升高时并发上限减半，
+    超过上限的请求在有界队列中等待，队列已满或等待超时的请求直接拒绝
+    """
+
+    def __init__(self, name, initial_limit=4, min_limit=1, max_limit=32, max_queue=50, queue_timeout=60,
+                 backoff_ratio=0.5, latency_tolerance=2.0):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance  # 近期延迟超过长期延迟的倍数时视为拥塞
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        # LLM回复耗时随回答长度波动很大，因此比较近期与长期的延迟均值，而不是单次请求的延迟
+        self.short_latency = 0.0
+        self.long_latency = 0.0
+        self.samples = 0
+        self.last_decrease = 0
+        self.rejected = 0
+        self.overloaded = 0
+
+    def acquire(self):
+        """获取执行许可，返回False表示队列已满或等待超时"""
+        with self.cond:
+            if self.in_flight >= int(self.limit):
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    return False
+                self.waiting += 1
+                try:
+                    deadline = time.monotonic() + self.queue_timeout
+                    while self.in_flight >= int(self.limit):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            return False
+                        self.cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+        _calls().append(_Call(self))
+        return True
+
+    def release(self):
+        call = _calls().pop()
+        latency = time.monotonic() - call.start_time
+        overloaded = call.overloaded
+        with self.cond:
+            self.in_flight -= 1
+            if not overloaded:
+                self.samples += 1
+                if self.samples == 1:
+                    self.short_latency = self.long_latency = latency
+                else:
+                    self.short_latency = 0.7 * self.short_latency + 0.3 * latency
+                    self.long_latency = 0.98 * self.long_latency + 0.02 * latency
+                if self.samples >= 20 and self.short_latency > self.long_latency * self.latency_tolerance:
+                    self._decrease(call.start_time)
+                elif self.in_flight + 1 >= int(self.limit):
+                    # 只有并发用满时才增加上限，每个完整窗口大约增加1
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    def on_overload(self, request_start):
+        with self.cond:
+            self.overloaded += 1
+            self._decrease(request_start)
+
+    def _decrease(self, request_start):
+        # 同一拥塞窗口内（上次减小之后发出的请求返回之前）只减小一次，避免并发失败时上限被连续减半
+        if request_start < self.last_decrease:
+            return
+        old_limit = self.limit
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        self.last_decrease = time.monotonic()
+        logger.warning("[Limiter] {} backend overloaded, concurrency limit {:.1f} -> {:.1f}".format(self.name, old_limit, self.limit))
+
+    def stats(self):
+        with self.cond:
+            return {
+                "name": self.name,
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "queue_depth": self.waiting,
+                "rejected": self.rejected,
+                "overloaded": self.overloaded,
+                "latency": round(self.short_latency, 2),
+            }
+
+
+def report_overload():
+    """
+    由bot在后端返回429/5xx时调用，通知当前线程正在使用的限制器立即减小并发上限
+    未开启自适应限流或不在限流调用中时不做任何处理
+    """
+    calls = _calls()
+    if calls and not calls[-1].overloaded:
+        calls[-1].overloaded = True
+        calls[-1].limiter.on_overload(calls[-1].start_time)
+
+
+class _Call:
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.start_time = time.monotonic()
+        self.overloaded = False
+
+
+def _calls():
+    # 当前线程正在进行的限流调用，插件中可能嵌套调用bot，因此使用栈保存
+    if not hasattr(_local, "calls"):
+        _local.calls = []
+    return _local.calls
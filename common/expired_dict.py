@@ -1,22 +1,52 @@
-from datetime import datetime, timedelta
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
 
 
-class ExpiredDict(dict):
-    def __init__(self, expires_in_seconds):
-        super().__init__()
+class ExpiredDict(MutableMapping):
+    """
+    带过期时间的字典
+    同一个字典内所有key的有效期相同，因此按最后写入/访问时间排序的OrderedDict同时也是按过期时间排序的，
+    过期的key总是集中在头部，每次读写时顺带清理头部过期的key，均摊O(1)；
+    后台线程定期清理长时间没有读写的字典
+
+    :param expires_in_seconds: 有效期，单位秒
+    :param max_size: 最多保存的key数量，超过时淘汰最久未使用的key，None表示不限制
+    :param refresh_on_access: 读取时是否刷新有效期，消息去重等场景应设置为False
+    """
+
+    def __init__(self, expires_in_seconds, max_size=None, refresh_on_access=True):
         self.expires_in_seconds = expires_in_seconds if expires_in_seconds else 3600
+        self.max_size = max_size
+        self.refresh_on_access = refresh_on_access
+        self._data = OrderedDict()  # key -> (value, expiry_time)
+        self._lock = threading.RLock()
+        _sweeper.register(self)
 
     def __getitem__(self, key):
-        value, expiry_time = super().__getitem__(key)
-        if datetime.now() > expiry_time:
-            del self[key]
-            raise KeyError("expired {}".format(key))
-        self.__setitem__(key, value)
-        return value
+        with self._lock:
+            value, expiry_time = self._data[key]
+            now = time.monotonic()
+            if now > expiry_time:
+                del self._data[key]
+                raise KeyError("expired {}".format(key))
+            if self.refresh_on_access:
+                self._data[key] = (value, now + self.expires_in_seconds)
+                self._data.move_to_end(key)
+            return value
 
     def __setitem__(self, key, value):
-        expiry_time = datetime.now() + timedelta(seconds=self.expires_in_seconds)
-        super().__setitem__(key, (value, expiry_time))
+        with self._lock:
+            now = time.monotonic()
+            self._data[key] = (value, now + self.expires_in_seconds)
+            self._data.move_to_end(key)
+            self._evict(now)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
 
     def get(self, key, default=None):
         try:
@@ -31,12 +61,75 @@ class ExpiredDict(dict):
         except KeyError:
             return False
 
+    def __len__(self):
+        with self._lock:
+            self._evict(time.monotonic())
+            return len(self._data)
+
     def keys(self):
-        keys = list(super().keys())
-        return [key for key in keys if key in self]
+        with self._lock:
+            self._evict(time.monotonic())
+            return list(self._data.keys())
 
     def items(self):
-        return [(key, self[key]) for key in self.keys()]
+        with self._lock:
+            self._evict(time.monotonic())
+            return [(key, value) for key, (value, _) in self._data.items()]
+
+    def values(self):
+        return [value for _, value in self.items()]
 
     def __iter__(self):
         return self.keys().__iter__()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def sweep(self):
+        """清理所有过期的key"""
+        with self._lock:
+            self._evict(time.monotonic())
+
+    def _evict(self, now):
+        # 调用方需持有self._lock
+        data = self._data
+        while data:
+            key = next(iter(data))
+            if data[key][1] >= now:
+                break
+            del data[key]
+        if self.max_size is not None:
+            while len(data) > self.max_size:
+                data.popitem(last=False)
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, dict(self.items()))
+
+
+class _Sweeper:
+    """所有ExpiredDict共用一个后台清理线程，只持有弱引用，不影响字典被回收"""
+
+    def __init__(self, interval=30):
+        self.interval = interval
+        self.dicts = weakref.WeakValueDictionary()  # id -> ExpiredDict，Mapping按内容比较相等，不能放进WeakSet
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def register(self, expired_dict):
+        with self.lock:
+            self.dicts[id(expired_dict)] = expired_dict
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="expired-dict-sweeper", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                dicts = list(self.dicts.values())
+            for expired_dict in dicts:
+                expired_dict.sweep()
+
+
+_sweeper = _Sweeper()
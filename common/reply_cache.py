@@ -0,0 +1,118 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from bridge.reply import Reply, ReplyType
+
+# 可以安全重放的回复类型，图片/文件等本地文件对象发送后可能被删除，不缓存
+CACHEABLE_REPLY_TYPES = (ReplyType.TEXT, ReplyType.IMAGE_URL, ReplyType.VIDEO_URL)
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s。！？!?.~～…]+$")
+
+
+class ReplyCache:
+    """
+    相同问题的回复缓存，用于无状态的dify工作流、知识库问答等场景，同一问题在多个群里被问到时只调用一次后端
+    按最后访问时间淘汰超过max_size的条目(LRU)，有效期从写入时开始计算，命中不会延长有效期
+
+    :param name: 名称，用于日志和统计
+    :param ttl: 缓存有效期，单位秒
+    :param max_size: 最多缓存的条目数
+    """
+
+    def __init__(self, name, ttl=3600, max_size=1000):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = OrderedDict()  # key -> (replies, expiry_time)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """忽略大小写、多余空白和句尾标点，"如何重置密码？" 与 "如何重置密码" 视为同一问题"""
+        query = _WHITESPACE.sub(" ", query.strip().lower())
+        return _TRAILING_PUNCTUATION.sub("", query)
+
+    def get(self, key):
+        """返回缓存的回复列表，前面的是bot通过channel直接发送的消息，最后一条是返回的回复"""
+        with self.lock:
+            item = self._data.get(key)
+            if item is not None and item[1] < time.monotonic():
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return item[0]
+
+    def put(self, key, replies):
+        """只缓存全部为可重放类型的回复，返回是否已缓存"""
+        if not replies or any(reply is None or reply.type not in CACHEABLE_REPLY_TYPES for reply in replies):
+            return False
+        replies = [self._copy(reply) for reply in replies]
+        with self.lock:
+            self._data[key] = (replies, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+        return True
+
+    @staticmethod
+    def _copy(reply):
+        copy = Reply(reply.type, reply.content)
+        copy.at_user = getattr(reply, "at_user", False)
+        return copy
+
+    def clear(self):
+        with self.lock:
+            size = len(self._data)
+            self._data.clear()
+            return size
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0,
+            }
+
+
+def at_prefix(context) -> str:
+    """群聊中bot直接发送的文字消息前会加上@提问者，私聊时为空"""
+    if context.get("isgroup", False) and context.get("msg") is not None:
+        return "@" + context["msg"].actual_user_nickname + "\n"
+    return ""
+
+
+class RecordingChannel:
+    """
+    包装channel，记录bot在生成回复过程中直接发送的消息，其余属性透传给原channel
+    记录的文字消息去掉@提问者的前缀并标记at_user，命中缓存重放时按当前的提问者重新加上
+    """
+
+    def __init__(self, channel):
+        self._channel = channel
+        self.sent = []
+
+    def send(self, reply, context):
+        prefix = at_prefix(context)
+        if prefix and reply.type == ReplyType.TEXT and isinstance(reply.content, str) and reply.content.startswith(prefix):
+            recorded = Reply(reply.type, reply.content[len(prefix):])
+            recorded.at_user = True
+            self.sent.append(recorded)
+        else:
+            self.sent.append(reply)
+        return self._channel.send(reply, context)
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
@@ -0,0 +1,74 @@
+import json
+import os
+import threading
+import time
+
+from common.log import logger
+from config import conf, get_appdata_dir
+
+STATS_FILE = "runtime_stats.json"
+
+_providers = {}  # 名称 -> 返回可序列化状态的函数
+_lock = threading.Lock()
+_writer = None
+
+
+def register(name, provider):
+    """
+    注册状态提供函数，bot进程定期把所有状态写入数据目录下的runtime_stats.json
+    管理后台与bot运行在不同的进程中，通过该文件读取熔断器、内存等运行状态
+    """
+    with _lock:
+        _providers[name] = provider
+
+
+def start():
+    """启动定期写入状态的线程，只在bot进程启动时调用"""
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_run, name="runtime-stats", daemon=True)
+            _writer.start()
+
+
+def snapshot():
+    with _lock:
+        providers = list(_providers.items())
+    result = {"updated_at": time.time()}
+    for name, provider in providers:
+        try:
+            result[name] = provider()
+        except Exception as e:
+            logger.warning("[RuntimeStats] collect {} error: {}".format(name, e))
+    return result
+
+
+def load(max_age=60):
+    """读取bot进程写入的状态，文件不存在或超过max_age秒未更新(bot已停止)时返回空字典"""
+    path = os.path.join(get_appdata_dir(), STATS_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if time.time() - stats.get("updated_at", 0) > max_age:
+        return {}
+    return stats
+
+
+def write():
+    path = os.path.join(get_appdata_dir(), STATS_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, ensure_ascii=False)
+    # 先写临时文件再替换，管理后台不会读到写了一半的文件
+    os.replace(tmp_path, path)
+
+
+def _run():
+    while True:
+        time.sleep(conf().get("runtime_stats_interval", 5))
+        try:
+            write()
+        except Exception as e:
+            logger.warning("[RuntimeStats] write stats error: {}".format(e))
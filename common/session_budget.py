@@ -0,0 +1,214 @@
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+
+from common import runtime_stats
+from common.log import logger
+from config import conf
+
+CHECK_INTERVAL = 10  # 统计会话内存占用并淘汰超出预算的会话的间隔，单位秒
+
+
+def estimate_size(obj, seen=None):
+    """估算会话对象占用的内存(字节)，递归计算字符串、容器和对象属性"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        return size
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += estimate_size(key, seen) + estimate_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        for item in obj:
+            size += estimate_size(item, seen)
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), seen)
+    return size
+
+
+class SessionBudget:
+    """
+    所有会话管理器共用的会话内存预算
+    会话被访问时记录到全局的LRU队列，后台线程定期估算所有会话占用的内存，
+    超过max_bytes时从最久未使用的会话开始淘汰，不区分属于哪个会话管理器
+    只有访问过的会话才重新估算大小，其余会话使用上次的结果
+
+    :param max_bytes: 内存预算，0表示不限制，只统计占用
+    """
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._lru = OrderedDict()  # (id(会话字典), key) -> None，最近访问的在尾部
+        self._touched = set()  # 上次统计后访问过的会话，需要重新估算大小
+        self._sizes = {}  # (id(会话字典), key) -> 估算的字节数
+        self._dicts = weakref.WeakValueDictionary()  # id -> TrackedSessionDict
+        self.usage = 0
+        self.evictions = 0
+
+    def register(self, session_dict):
+        with self.lock:
+            self._dicts[id(session_dict)] = session_dict
+
+    def touch(self, session_dict, key):
+        item = (id(session_dict), key)
+        with self.lock:
+            self._lru[item] = None
+            self._lru.move_to_end(item)
+            self._touched.add(item)
+
+    def discard(self, session_dict, key):
+        item = (id(session_dict), key)
+        with self.lock:
+            self._forget(item)
+
+    def discard_all(self, session_dict):
+        dict_id = id(session_dict)
+        with self.lock:
+            for item in [item for item in self._lru if item[0] == dict_id]:
+                self._forget(item)
+
+    def enforce(self):
+        """重新统计内存占用，超过预算时淘汰最久未使用的会话，返回淘汰的会话数"""
+        with self.lock:
+            dicts = dict(self._dicts)
+            touched, self._touched = self._touched, set()
+        sizes = {}
+        retry = set()
+        for dict_id, session_dict in dicts.items():
+            # 已过期或被会话字典自身淘汰的会话不再计入
+            for key, session in session_dict.peek_items():
+                item = (dict_id, key)
+                size = self._sizes.get(item)
+                if size is None or item in touched:
+                    try:
+                        size = estimate_size(session)
+                    except Exception as e:
+                        # 会话正在被处理线程修改(如deque mutated during iteration)，沿用上次的大小，下次统计时重试
+                        logger.debug("[SessionBudget] estimate session {} error: {}".format(key, e))
+                        retry.add(item)
+                        size = size or 0
+                sizes[item] = size
+        evicted = []
+        with self.lock:
+            self._touched |= retry
+            for item in [item for item in self._lru if item not in sizes]:
+                self._forget(item)
+            self._sizes = sizes
+            self.usage = sum(sizes.values())
+            if self.max_bytes:
+                for item in list(self._lru):
+                    if self.usage <= self.max_bytes:
+                        break
+                    self.usage -= sizes.get(item, 0)
+                    self._forget(item)
+                    evicted.append(item)
+            self.evictions += len(evicted)
+        for dict_id, key in evicted:
+            dicts[dict_id].evict(key)
+        if evicted:
+            logger.info("[SessionBudget] evicted {} sessions, usage={}KB, budget={}KB".format(
+                len(evicted), self.usage // 1024, self.max_bytes // 1024))
+        return len(evicted)
+
+    def stats(self):
+        with self.lock:
+            managers = {}
+            for (dict_id, _), size in self._sizes.items():
+                session_dict = self._dicts.get(dict_id)
+                if session_dict is None:
+                    continue
+                manager = managers.setdefault(dict_id, {"name": session_dict.name, "sessions": 0, "bytes": 0})
+                manager["sessions"] += 1
+                manager["bytes"] += size
+            return {
+                "budget_bytes": self.max_bytes,
+                "usage_bytes": self.usage,
+                "sessions": len(self._sizes),
+                "evictions": self.evictions,
+                "managers": list(managers.values()),
+            }
+
+    def _forget(self, item):
+        # 调用方需持有self.lock
+        self._lru.pop(item, None)
+        self._touched.discard(item)
+        self._sizes.pop(item, None)
+
+
+class TrackedSessionDict(MutableMapping):
+    """包装会话管理器的会话字典，把会话的访问记录到全局预算中，由预算统一淘汰"""
+
+    def __init__(self, name, sessions, budget):
+        self.name = name
+        self.sessions = sessions
+        self.budget = budget
+        budget.register(self)
+
+    def __getitem__(self, key):
+        session = self.sessions[key]
+        self.budget.touch(self, key)
+        return session
+
+    def __setitem__(self, key, session):
+        self.sessions[key] = session
+        self.budget.touch(self, key)
+
+    def __delitem__(self, key):
+        del self.sessions[key]
+        self.budget.discard(self, key)
+
+    def __contains__(self, key):
+        return key in self.sessions
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __iter__(self):
+        return iter(self.sessions)
+
+    def clear(self):
+        self.sessions.clear()
+        self.budget.discard_all(self)
+
+    def peek_items(self):
+        """返回内存中的会话，不刷新访问时间"""
+        return list(self.sessions.items())
+
+    def evict(self, key):
+        """从内存中淘汰会话，持久化的会话字典只释放内存，下次访问时重新加载"""
+        if hasattr(self.sessions, "evict"):
+            self.sessions.evict(key)
+        else:
+            self.sessions.pop(key, None)
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_session_budget():
+    """返回进程内共用的会话内存预算，第一次调用时启动后台统计线程"""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = SessionBudget(int(conf().get("session_memory_budget", 0) * 1024 * 1024))
+            threading.Thread(target=_run, args=(_budget,), name="session-budget", daemon=True).start()
+            runtime_stats.register("session_memory", _budget.stats)
+        return _budget
+
+
+def _run(budget):
+    while True:
+        time.sleep(CHECK_INTERVAL)
+        try:
+            budget.enforce()
+        except Exception as e:
+            logger.warning("[SessionBudget] enforce error: {}".format(e))
@@ -0,0 +1,386 @@
+import atexit
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from common.expired_dict import ExpiredDict
+from common.log import logger
+from common.session_budget import TrackedSessionDict, get_session_budget
+from common.state_backend import get_state_backend
+from config import conf, get_appdata_dir
+
+
+class SessionStore:
+    """
+    会话持久化存储后端，按(namespace, key)保存序列化后的会话
+    namespace区分不同的会话管理器，value为pickle后的bytes
+    shared为True表示多个bot副本共用同一个存储，会话可能被其他副本修改
+    """
+
+    shared = False
+
+    def load(self, namespace, key, max_age=None):
+        """返回保存的value，不存在或超过max_age秒未更新时返回None"""
+        raise NotImplementedError
+
+    def save(self, namespace, items, ttl=None):
+        """批量写入[(key, value)]，value为None表示删除；ttl为会话的过期时间(秒)，由存储自行处理过期时可以使用"""
+        raise NotImplementedError
+
+    def clear(self, namespace):
+        raise NotImplementedError
+
+    def purge(self, namespace, max_age):
+        """删除超过max_age秒未更新的会话"""
+        raise NotImplementedError
+
+
+class SqliteSessionStore(SessionStore):
+    """内置的SQLite存储，所有会话管理器共用一个数据库文件，连接在第一次读写时创建"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._conn = None
+
+    def _get_conn(self):
+        # 调用方需持有self.lock
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+                         "value BLOB NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (namespace, key))")
+            self._conn = conn
+        return self._conn
+
+    def load(self, namespace, key, max_age=None):
+        with self.lock:
+            row = self._get_conn().execute("SELECT value, updated_at FROM sessions WHERE namespace=? AND key=?",
+                                           (namespace, key)).fetchone()
+        if row is None or (max_age and time.time() - row[1] > max_age):
+            return None
+        return row[0]
+
+    def save(self, namespace, items, ttl=None):
+        now = time.time()
+        with self.lock:
+            conn = self._get_conn()
+            with conn:  # 一批写入在同一个事务中提交
+                conn.executemany("DELETE FROM sessions WHERE namespace=? AND key=?",
+                                 [(namespace, key) for key, value in items if value is None])
+                conn.executemany("INSERT OR REPLACE INTO sessions (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                                 [(namespace, key, value, now) for key, value in items if value is not None])
+
+    def clear(self, namespace):
+        with self.lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute("DELETE FROM sessions WHERE namespace=?", (namespace,))
+
+    def purge(self, namespace, max_age):
+        with self.lock:
+            conn = self._get_conn()
+            with conn:
+                conn.execute("DELETE FROM sessions WHERE namespace=? AND updated_at<?", (namespace, time.time() - max_age))
+
+    def close(self):
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class StateSessionStore(SessionStore):
+    """
+    保存在state_backend(如Redis)中的存储，多个bot副本共用，任意副本都能继续同一个会话
+    会话按ttl自动过期，不需要purge；同一个会话被多个副本同时修改时以最后写入的为准
+    """
+
+    shared = True
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def load(self, namespace, key, max_age=None):
+        return self.backend.get(self._key(namespace, key))
+
+    def save(self, namespace, items, ttl=None):
+        deleted = [self._key(namespace, key) for key, value in items if value is None]
+        if deleted:
+            self.backend.delete(*deleted)
+        self.backend.set_many({self._key(namespace, key): value for key, value in items if value is not None}, ttl)
+
+    def clear(self, namespace):
+        keys = self.backend.scan_keys(self._key(namespace, ""))
+        if keys:
+            self.backend.delete(*keys)
+
+    def purge(self, namespace, max_age):
+        pass
+
+    @staticmethod
+    def _key(namespace, key):
+        return "session:{}:{}".format(namespace, key)
+
+
+class PersistentSessionDict(MutableMapping):
+    """
+    带持久化的会话字典，用于替代会话管理器中的ExpiredDict/dict，bot进程重启后会话不丢失
+    内存中只保留最近使用的max_size个会话(LRU)，淘汰或不在内存中的会话在访问时从存储中加载
+    会话对象在取出后会被原地修改，因此被访问过的会话都视为已修改，由后台线程定期批量写入存储(write-behind)
+    len()和遍历只包含内存中的会话
+    存储为多个副本共用(store.shared)时，已写入存储的会话再次访问时重新从存储加载，使用其他副本的修改
+
+    :param namespace: 存储中的命名空间，不同会话管理器的session_id互不影响
+    :param store: SessionStore
+    :param max_size: 内存中最多保留的会话数
+    :param expires_in_seconds: 无操作会话的过期时间，None表示不过期
+    """
+
+    PURGE_INTERVAL = 60
+
+    def __init__(self, namespace, store, max_size=1000, expires_in_seconds=None):
+        self.namespace = namespace
+        self.store = store
+        self.max_size = max_size
+        self.expires_in_seconds = expires_in_seconds
+        self._hot = OrderedDict()  # key -> (session, last_access)
+        self._dirty = set()  # 内存中需要写入存储的key
+        self._pending = {}  # 已从内存淘汰但尚未写入存储的会话，None表示待删除
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._purged_at = 0
+        _flusher.register(self)
+
+    def __getitem__(self, key):
+        with self._lock:
+            now = time.monotonic()
+            item = self._hot.get(key)
+            if item is not None and self._expired(item[1], now):
+                self._remove(key)
+                item = None
+            if item is None:
+                session = self._load(key)
+                if session is None:
+                    raise KeyError(key)
+            elif self.store.shared and key not in self._dirty:
+                # 内存中的会话已写入存储，其他副本可能修改过，读取失败时使用内存中的会话
+                session = self._load(key, item[0])
+                if session is None:
+                    self._remove(key)
+                    raise KeyError(key)
+            else:
+                session = item[0]
+            self._hot[key] = (session, now)
+            self._hot.move_to_end(key)
+            self._dirty.add(key)
+            self._evict()
+            return session
+
+    def __setitem__(self, key, session):
+        with self._lock:
+            self._pending.pop(key, None)
+            self._hot[key] = (session, time.monotonic())
+            self._hot.move_to_end(key)
+            self._dirty.add(key)
+            self._evict()
+
+    def __delitem__(self, key):
+        with self._lock:
+            if key not in self:
+                raise KeyError(key)
+            self._remove(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        with self._lock:
+            return len(self._hot)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._hot.keys()))
+
+    def items(self):
+        """返回内存中的会话，不刷新访问时间"""
+        with self._lock:
+            return [(key, session) for key, (session, _) in self._hot.items()]
+
+    def evict(self, key):
+        """从内存中淘汰会话，尚未写入的会话转入待写入列表，下次访问时重新加载"""
+        with self._lock:
+            item = self._hot.pop(key, None)
+            if item is not None and key in self._dirty:
+                self._dirty.discard(key)
+                self._pending[key] = item[0]
+
+    def clear(self):
+        with self._flush_lock, self._lock:
+            self._hot.clear()
+            self._dirty.clear()
+            self._pending.clear()
+            self.store.clear(self.namespace)
+
+    def flush(self):
+        """把已修改的会话批量写入存储，由后台线程定期调用，进程退出前也会调用"""
+        with self._flush_lock:
+            with self._lock:
+                sessions = [(key, self._hot[key][0]) for key in self._dirty if key in self._hot]
+                sessions.extend(self._pending.items())
+                self._dirty.clear()
+                self._pending.clear()
+            items = []
+            for key, session in sessions:
+                try:
+                    items.append((key, None if session is None else pickle.dumps(session)))
+                except Exception as e:
+                    # 序列化时会话可能正在被其他线程修改，下次再写
+                    logger.debug("[SessionStore] serialize session {} error: {}".format(key, e))
+                    self._retry(key, session)
+            if items:
+                try:
+                    self.store.save(self.namespace, items, self.expires_in_seconds)
+                except Exception as e:
+                    logger.warning("[SessionStore] save {} sessions error: {}".format(self.namespace, e))
+                    for key, session in sessions:
+                        self._retry(key, session)
+            if self.expires_in_seconds and time.monotonic() - self._purged_at > self.PURGE_INTERVAL:
+                self._purged_at = time.monotonic()
+                self._sweep()
+
+    def _retry(self, key, session):
+        with self._lock:
+            if key in self._hot:
+                self._dirty.add(key)
+            elif key not in self._pending:
+                self._pending[key] = session
+
+    def _sweep(self):
+        with self._lock:
+            now = time.monotonic()
+            for key in [key for key, (_, last_access) in self._hot.items() if self._expired(last_access, now)]:
+                del self._hot[key]
+                self._dirty.discard(key)
+        try:
+            self.store.purge(self.namespace, self.expires_in_seconds)
+        except Exception as e:
+            logger.warning("[SessionStore] purge {} sessions error: {}".format(self.namespace, e))
+
+    def _expired(self, last_access, now):
+        return self.expires_in_seconds and now - last_access > self.expires_in_seconds
+
+    def _load(self, key, fallback=None):
+        # 调用方需持有self._lock
+        if key in self._pending:
+            session = self._pending[key]
+            if session is not None:  # 待删除的会话保留删除标记
+                del self._pending[key]
+            return session
+        try:
+            value = self.store.load(self.namespace, key, self.expires_in_seconds)
+            return None if value is None else pickle.loads(value)
+        except Exception as e:
+            # 会话类升级后旧数据可能无法还原，按新会话处理
+            logger.warning("[SessionStore] load session {} error: {}".format(key, e))
+            return fallback
+
+    def _remove(self, key):
+        # 调用方需持有self._lock
+        self._hot.pop(key, None)
+        self._dirty.discard(key)
+        self._pending[key] = None
+
+    def _evict(self):
+        # 调用方需持有self._lock，淘汰最久未使用的会话，未写入的会话转入待写入列表
+        while len(self._hot) > self.max_size:
+            key, (session, _) = self._hot.popitem(last=False)
+            if key in self._dirty:
+                self._dirty.discard(key)
+                self._pending[key] = session
+
+
+class _Flusher:
+    """所有PersistentSessionDict共用一个后台写入线程，只持有弱引用"""
+
+    def __init__(self):
+        self.dicts = weakref.WeakValueDictionary()  # id -> PersistentSessionDict
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def register(self, session_dict):
+        with self.lock:
+            self.dicts[id(session_dict)] = session_dict
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="session-store-flusher", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush_all)
+
+    def flush_all(self):
+        with self.lock:
+            dicts = list(self.dicts.values())
+        for session_dict in dicts:
+            try:
+                session_dict.flush()
+            except Exception as e:
+                logger.warning("[SessionStore] flush error: {}".format(e))
+
+    def _run(self):
+        while True:
+            time.sleep(conf().get("session_store_flush_interval", 2))
+            self.flush_all()
+
+
+_flusher = _Flusher()
+_store = None
+_store_lock = threading.Lock()
+
+SESSION_STORES = {
+    "sqlite": lambda: SqliteSessionStore(os.path.join(get_appdata_dir(), "sessions.db")),
+    "redis": lambda: StateSessionStore(get_state_backend("redis")),
+}
+
+
+def get_session_store():
+    """返回session_store配置对应的存储后端，进程内共用一个实例"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SESSION_STORES[conf().get("session_store")]()
+        return _store
+
+
+def build_session_dict(namespace):
+    """
+    创建会话管理器使用的会话字典
+    session_store为memory时与之前一样只保存在内存中，否则使用带持久化的会话字典
+    所有会话字典共用一个内存预算(session_memory_budget)，超出时淘汰最久未使用的会话
+    """
+    expires_in_seconds = conf().get("expires_in_seconds")
+    if conf().get("session_store", "memory") == "memory":
+        sessions = ExpiredDict(expires_in_seconds) if expires_in_seconds else dict()
+    else:
+        sessions = PersistentSessionDict(namespace, get_session_store(), conf().get("session_store_hot_size", 1000),
+                                         expires_in_seconds)
+    return TrackedSessionDict(namespace, sessions, get_session_budget())
+
+
+def flush_session_stores():
+    """立即写入所有未保存的会话，bot进程被停止前调用"""
+    _flusher.flush_all()
@@ -0,0 +1,309 @@
+import queue
+import socket
+import threading
+import time
+from urllib.parse import unquote, urlparse
+
+from common.log import logger
+from config import conf
+
+
+class StateBackendError(Exception):
+    pass
+
+
+class StateBackend:
+    """
+    多个bot副本共享的状态存储，会话、消息去重、调用频率限制都通过它读写
+    key为str，value为bytes；ttl单位秒，None表示不过期
+    set_if_absent、incr为原子操作，多个副本同时调用时结果与单个进程一致
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set_many(self, items, ttl=None):
+        """批量写入{key: value}"""
+        raise NotImplementedError
+
+    def set_if_absent(self, key, value, ttl=None) -> bool:
+        """key不存在时写入并返回True，已存在时返回False"""
+        raise NotImplementedError
+
+    def incr(self, key, ttl=None) -> int:
+        """把key的值加1并返回新值，每次递增都会刷新有效期"""
+        raise NotImplementedError
+
+    def delete(self, *keys):
+        raise NotImplementedError
+
+    def scan_keys(self, prefix):
+        """返回以prefix开头的所有key"""
+        raise NotImplementedError
+
+
+class MemoryStateBackend(StateBackend):
+    """进程内的实现，行为与之前各模块自己维护的字典一致，只适用于单个副本"""
+
+    SWEEP_INTERVAL = 30
+
+    def __init__(self):
+        self._data = {}  # key -> (value, expiry_time)
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key, time.monotonic())
+
+    def set_many(self, items, ttl=None):
+        with self._lock:
+            now = time.monotonic()
+            for key, value in items.items():
+                self._data[key] = (value, now + ttl if ttl else None)
+            self._sweep(now)
+
+    def set_if_absent(self, key, value, ttl=None):
+        with self._lock:
+            now = time.monotonic()
+            if self._get(key, now) is not None:
+                return False
+            self._data[key] = (value, now + ttl if ttl else None)
+            self._sweep(now)
+            return True
+
+    def incr(self, key, ttl=None):
+        with self._lock:
+            now = time.monotonic()
+            value = int(self._get(key, now) or 0) + 1
+            self._data[key] = (str(value).encode(), now + ttl if ttl else None)
+            self._sweep(now)
+            return value
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def scan_keys(self, prefix):
+        with self._lock:
+            now = time.monotonic()
+            return [key for key in list(self._data) if key.startswith(prefix) and self._get(key, now) is not None]
+
+    def _get(self, key, now):
+        # 调用方需持有self._lock
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] < now:
+            del self._data[key]
+            return None
+        return item[0]
+
+    def _sweep(self, now):
+        # 调用方需持有self._lock，定期清理不再被访问的过期key(如去重记录)
+        if now - self._swept_at < self.SWEEP_INTERVAL:
+            return
+        self._swept_at = now
+        for key in [key for key, (_, expiry_time) in self._data.items() if expiry_time is not None and expiry_time < now]:
+            del self._data[key]
+
+
+class RedisStateBackend(StateBackend):
+    """
+    基于Redis协议(RESP)的实现，可以连接Redis或兼容Redis协议的服务，不依赖redis客户端库
+    所有key加上prefix，多个bot可以共用一个Redis；连接放在连接池中复用
+
+    :param url: redis://[:password@]host[:port][/db]
+    :param prefix: key前缀
+    :param timeout: 连接和读写超时，单位秒
+    """
+
+    def __init__(self, url, prefix="", timeout=5, max_idle=8):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError("unsupported state backend url: {}".format(url))
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def get(self, key):
+        return self._execute(("GET", self.prefix + key))[0]
+
+    def set_many(self, items, ttl=None):
+        if not items:
+            return
+        expire = ("PX", int(ttl * 1000)) if ttl else ()
+        # 一次往返发送所有命令(pipeline)
+        self._execute(*[("SET", self.prefix + key, value) + expire for key, value in items.items()])
+
+    def set_if_absent(self, key, value, ttl=None):
+        expire = ("PX", int(ttl * 1000)) if ttl else ()
+        return self._execute(("SET", self.prefix + key, value, "NX") + expire)[0] is not None
+
+    def incr(self, key, ttl=None):
+        key = self.prefix + key
+        if not ttl:
+            return self._execute(("INCR", key))[0]
+        # MULTI/EXEC保证递增和设置有效期一起执行，不会留下没有有效期的key
+        replies = self._execute(("MULTI",), ("INCR", key), ("PEXPIRE", key, int(ttl * 1000)), ("EXEC",))
+        return replies[-1][0]
+
+    def delete(self, *keys):
+        if keys:
+            self._execute(("DEL",) + tuple(self.prefix + key for key in keys))
+
+    def scan_keys(self, prefix):
+        keys = []
+        cursor = "0"
+        while True:
+            cursor, batch = self._execute(("SCAN", cursor, "MATCH", self.prefix + prefix + "*", "COUNT", 1000))[0]
+            keys.extend(key.decode("utf-8")[len(self.prefix):] for key in batch)
+            cursor = cursor.decode("utf-8")
+            if cursor == "0":
+                return keys
+
+    def _execute(self, *commands):
+        """发送一组命令并返回每条命令的结果，复用的连接已失效时用新连接重试一次"""
+        for attempt in range(2):
+            conn, pooled = self._get_conn()
+            try:
+                conn.send(commands)
+                replies = [conn.read() for _ in commands]
+            except (OSError, EOFError) as e:
+                conn.close()
+                if pooled and attempt == 0:
+                    continue
+                raise StateBackendError("redis {}:{} error: {}".format(self.host, self.port, e))
+            self._put_conn(conn)
+            for reply in replies:
+                if isinstance(reply, StateBackendError):
+                    raise reply
+            return replies
+
+    def _get_conn(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            pass
+        try:
+            conn = _RespConnection(self.host, self.port, self.timeout)
+        except OSError as e:
+            raise StateBackendError("connect redis {}:{} error: {}".format(self.host, self.port, e))
+        try:
+            if self.password:
+                conn.call("AUTH", self.password)
+            if self.db:
+                conn.call("SELECT", self.db)
+        except (OSError, EOFError) as e:
+            conn.close()
+            raise StateBackendError("connect redis {}:{} error: {}".format(self.host, self.port, e))
+        except BaseException:
+            # 密码错误等，关闭连接后再抛出，避免泄漏socket
+            conn.close()
+            raise
+        return conn, False
+
+    def _put_conn(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+class _RespConnection:
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.file = self.sock.makefile("rb")
+
+    def call(self, *args):
+        self.send([args])
+        reply = self.read()
+        if isinstance(reply, StateBackendError):
+            raise reply
+        return reply
+
+    def send(self, commands):
+        buf = bytearray()
+        for args in commands:
+            buf += b"*%d\r\n" % len(args)
+            for arg in args:
+                if not isinstance(arg, bytes):
+                    arg = str(arg).encode("utf-8")
+                buf += b"$%d\r\n%s\r\n" % (len(arg), arg)
+        self.sock.sendall(buf)
+
+    def read(self):
+        line = self.file.readline()
+        if not line.endswith(b"\r\n"):
+            raise EOFError("connection closed")
+        kind, data = line[:1], line[1:-2]
+        if kind == b"+":
+            return data.decode("utf-8")
+        if kind == b"-":
+            # 错误作为结果返回，由调用方读完所有结果后再抛出，连接可以继续使用
+            return StateBackendError(data.decode("utf-8"))
+        if kind == b":":
+            return int(data)
+        if kind == b"$":
+            size = int(data)
+            return None if size < 0 else self.file.read(size + 2)[:-2]
+        if kind == b"*":
+            size = int(data)
+            return None if size < 0 else [self.read() for _ in range(size)]
+        raise EOFError("unexpected reply {}".format(line))
+
+    def close(self):
+        try:
+            self.file.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class DedupeSet:
+    """
+    按消息id去重，回调重试或多个副本收到同一条消息时只处理一次
+    记录保存在state_backend中，有效期为ttl秒；状态存储不可用时不去重，避免丢消息
+    """
+
+    def __init__(self, name, ttl, backend=None):
+        self.name = name
+        self.ttl = ttl
+        self.backend = backend or get_state_backend()
+
+    def add(self, key) -> bool:
+        """第一次出现时返回True，重复的消息返回False"""
+        try:
+            return self.backend.set_if_absent("dedupe:{}:{}".format(self.name, key), b"1", self.ttl)
+        except Exception as e:
+            logger.warning("[StateBackend] dedupe {} error: {}".format(self.name, e))
+            return True
+
+    def discard(self, key):
+        try:
+            self.backend.delete("dedupe:{}:{}".format(self.name, key))
+        except Exception as e:
+            logger.warning("[StateBackend] dedupe {} error: {}".format(self.name, e))
+
+
+STATE_BACKENDS = {
+    "memory": MemoryStateBackend,
+    "redis": lambda: RedisStateBackend(conf().get("state_backend_url", "redis://127.0.0.1:6379/0"),
+                                       conf().get("state_backend_prefix", "")),
+}
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_state_backend(kind=None):
+    """返回state_backend配置(或kind)对应的状态存储，进程内共用一个实例"""
+    kind = kind or conf().get("state_backend", "memory")
+    with _backends_lock:
+        if kind not in _backends:
+            _backends[kind] = STATE_BACKENDS[kind]()
+        return _backends[kind]
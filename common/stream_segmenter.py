@@ -0,0 +1,65 @@
+import re
+
+# 片段末尾有未闭合的markdown链接/图片时不能切分，例如 "![image](/files/tools/" 或 "[文件"
+_INCOMPLETE_LINK = re.compile(r"!?\[[^\]\n]*$|!?\[[^\]\n]*\]$|!?\[[^\]\n]*\]\([^)\s]*$")
+_SENTENCE_END = re.compile(r"[。！？!?；;…]+[”」』）)]?|\n")
+
+
+class StreamSegmenter:
+    """
+    把流式返回的文本切分成适合逐条发送的片段
+    优先在段落(空行)处切分，积累的文本过长时退而在句末切分；
+    不会在markdown图片/文件链接或代码块的中间切分，保证每个片段都能被parse_markdown_text正确解析
+
+    :param min_length: 片段的最短长度，避免把回复拆成太多条消息
+    :param max_length: 没有遇到段落结尾时，积累超过该长度就在句末切分
+    """
+
+    def __init__(self, min_length=80, max_length=None):
+        self.min_length = min_length
+        self.max_length = max_length or min_length * 3
+        self.buffer = ""
+
+    def feed(self, delta):
+        """追加一段增量文本，返回已经可以发送的片段列表"""
+        self.buffer += delta
+        segments = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            segment, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:]
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def flush(self):
+        """返回剩余的全部文本"""
+        rest, self.buffer = self.buffer.strip(), ""
+        return rest
+
+    def _find_cut(self):
+        text = self.buffer
+        if len(text) < self.min_length:
+            return None
+        start = self.min_length
+        while True:
+            pos = text.find("\n\n", start)
+            if pos < 0:
+                break
+            if self._is_safe(text[:pos]):
+                return pos + 2
+            start = pos + 2
+        if len(text) < self.max_length:
+            return None
+        cut = None
+        for match in _SENTENCE_END.finditer(text, self.min_length):
+            if self._is_safe(text[:match.end()]):
+                cut = match.end()
+        return cut
+
+    @staticmethod
+    def _is_safe(prefix):
+        if prefix.count("```") % 2 == 1:
+            return False
+        return _INCOMPLETE_LINK.search(prefix) is None
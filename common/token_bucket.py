@@ -1,6 +1,10 @@
 import threading
 import time
 
+from common.log import logger
+from common.state_backend import get_state_backend
+from config import conf
+
 
 class TokenBucket:
     def __init__(self, tpm, timeout=None):
@@ -36,6 +40,49 @@ class TokenBucket:
         self.is_running = False
 
 
+class SharedTokenBucket:
+    """
+    多个bot副本共用的限流器，接口与TokenBucket相同
+    按固定时间窗口计数，计数保存在state_backend中并原子递增，所有副本每个窗口合计最多通过tpm次请求
+    当前窗口已满时等待下一个窗口，需要等待的时间超过timeout则返回False；状态存储不可用时不限流
+    """
+
+    def __init__(self, name, tpm, timeout=None, window=60, backend=None):
+        self.name = name
+        self.capacity = int(tpm)
+        self.timeout = timeout
+        self.window = window
+        self.backend = backend or get_state_backend()
+
+    def get_token(self):
+        """获取令牌"""
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        while True:
+            now = time.time()
+            index = int(now // self.window)
+            try:
+                count = self.backend.incr("ratelimit:{}:{}".format(self.name, index), ttl=self.window * 2)
+            except Exception as e:
+                logger.warning("[TokenBucket] {} rate limit error: {}".format(self.name, e))
+                return True
+            if count <= self.capacity:
+                return True
+            next_window = (index + 1) * self.window
+            if deadline is not None and next_window > deadline:
+                return False
+            time.sleep(next_window - now)
+
+    def close(self):
+        pass
+
+
+def build_token_bucket(name, tpm, timeout=None):
+    """state_backend为memory时使用进程内的TokenBucket，否则使用多个副本共用的SharedTokenBucket"""
+    if conf().get("state_backend", "memory") == "memory":
+        return TokenBucket(tpm, timeout)
+    return SharedTokenBucket(name, tpm, timeout)
+
+
 if __name__ == "__main__":
     token_bucket = TokenBucket(20, None)  # 创建一个每分钟生产20个tokens的令牌桶
     # token_bucket = TokenBucket(20, 0.1)
@@ -0,0 +1,67 @@
+import hashlib
+import threading
+
+from common.expired_dict import ExpiredDict
+from common.log import logger
+
+
+class UploadCache:
+    """
+    按文件内容哈希缓存上传结果，同一张图片(表情包、转发的海报等)在多个群里出现时只上传一次
+    缓存key为 (内容sha256, 上传目标)，上传目标需区分后端地址、应用和用户，
+    有效期从上传时开始计算，应不超过后端保留上传文件的时间
+
+    :param name: 名称，用于日志和统计
+    :param ttl: 缓存有效期，单位秒
+    :param max_size: 最多缓存的条目数
+    """
+
+    def __init__(self, name, ttl, max_size=10000):
+        self.name = name
+        self.cache = ExpiredDict(ttl, max_size=max_size, refresh_on_access=False)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_upload(self, path, target, upload_fn):
+        """
+        :param path: 本地文件路径
+        :param target: 上传目标，需可哈希，如 (api_base, api_key, user)
+        :param upload_fn: 未命中时调用 upload_fn(path) 上传，返回值为None时不缓存
+        """
+        key = (self._digest(path), target)
+        result = self.cache.get(key)
+        with self.lock:
+            if result is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if result is not None:
+            logger.debug("[{}] upload cache hit, path={}".format(self.name, path))
+            return result
+        result = upload_fn(path)
+        if result is not None:
+            self.cache[key] = result
+        return result
+
+    def invalidate(self, path, target):
+        self.cache.pop((self._digest(path), target), None)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self.cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0,
+            }
+
+    @staticmethod
+    def _digest(path):
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(64 * 1024), b""):
+                sha256.update(block)
+        return sha256.hexdigest()
@@ -37,6 +37,23 @@ def compress_imgfile(file, max_size):
         quality -= 5
 
 
+def compress_image_file(path, max_size):
+    """图片文件超过max_size字节时压缩为jpg并返回新文件路径，max_size<=0或压缩失败时返回原路径"""
+    if not max_size or max_size <= 0 or os.path.getsize(path) <= max_size:
+        return path
+    try:
+        with open(path, "rb") as f:
+            buf = compress_imgfile(f, max_size)
+        compressed_path = os.path.splitext(path)[0] + "_compressed.jpg"
+        with open(compressed_path, "wb") as f:
+            f.write(buf.getvalue())
+        logger.debug("[utils] compress image {} -> {}, size={}".format(path, compressed_path, fsize(compressed_path)))
+        return compressed_path
+    except Exception as e:
+        logger.warning("[utils] compress image failed, use raw file. path={}, error={}".format(path, e))
+        return path
+
+
 def split_string_by_utf8_length(string, max_length, max_split=0):
     encoded = string.encode("utf-8")
     start, end = 0, 0
@@ -56,18 +56,49 @@ available_setting = {
     "image_proxy": True,  # 是否需要图片代理，国内访问LinkAI时需要
     "image_create_prefix": ["画", "看", "找"],  # 开启图片回复的前缀
     "concurrency_in_session": 1,  # 同一会话最多有多少条消息在处理中，大于1可能乱序
+    "message_coalesce_window": 0,  # 合并同一会话连续发送的文本消息的等待时间，单位秒，0表示不合并；管理命令、插件命令、语音和图片不参与合并
+    "handler_pool_size": 8,  # 处理消息的默认线程池大小
+    "handler_pool_bulkheads": {},  # 独立线程池大小，key为消息类型(text/voice/image_create)或bot类型(如dify)，如 {"voice": 2, "dify": 8}，未配置的使用默认线程池
     "image_create_size": "256x256",  # 图片大小,可选有 256x256, 512x512, 1024x1024 (dall-e-3默认为1024x1024)
     "group_chat_exit_group": False,
     "group_exit_msg": "",  # 退出群聊的消息
     "accept_friend_msg": "",  # 接受好友请求后发送的消息
     # chatgpt会话参数
     "expires_in_seconds": 3600,  # 无操作会话的过期时间
+    # 会话存储，memory只保存在内存中，bot重启后会话丢失；sqlite保存到数据目录下的sessions.db，重启后继续之前的会话(包括dify/coze的conversation_id)；
+    # redis保存到state_backend_url指定的Redis中，部署多个副本时任意副本都能继续同一个会话
+    "session_store": "memory",
+    "session_store_hot_size": 1000,  # 开启会话存储时内存中最多保留的会话数，其余会话在访问时从存储中加载
+    "session_store_flush_interval": 2,  # 后台批量写入已修改会话的间隔，单位秒
+    "session_memory_budget": 0,  # 所有会话占用内存的上限(MB，按会话内容估算)，超过时淘汰最久未使用的会话，开启会话存储时被淘汰的会话可重新加载，0为不限制
+    # 多副本共享状态，memory只在当前进程内有效；redis时消息去重、调用频率限制(rate_limit_chatgpt/rate_limit_dalle)由所有副本共用
+    "state_backend": "memory",
+    "state_backend_url": "redis://127.0.0.1:6379/0",  # Redis地址，格式为 redis://[:密码@]主机:端口/db
+    "state_backend_prefix": "dow:",  # 写入Redis的key前缀，多个bot共用一个Redis时用于区分
     # 人格描述
     "character_desc": "你是ChatGPT, 一个由OpenAI训练的大型语言模型, 你旨在回答并解决人们的任何问题，并且可以使用多种语言与人交流。",
     "conversation_max_tokens": 1000,  # 支持上下文记忆的最多字符数
+    "token_estimate_margin": 0.2,  # 会话token数的估算值低于conversation_max_tokens的(1-该比例)时直接使用估算值，接近上限时才用tiktoken精确计算
     # chatgpt限流配置
     "rate_limit_chatgpt": 20,  # chatgpt的调用频率限制
     "rate_limit_dalle": 50,  # openai dalle的调用频率限制
+    # 后端自适应并发限制，根据延迟和429/5xx自动调整每个后端的并发上限(AIMD)
+    "adaptive_concurrency": False,  # 是否开启
+    "adaptive_concurrency_initial": 4,  # 初始并发上限
+    "adaptive_concurrency_max": 32,  # 最大并发上限
+    "adaptive_concurrency_queue_size": 50,  # 超过并发上限时最多排队的请求数，超过则直接拒绝
+    "adaptive_concurrency_queue_timeout": 60,  # 排队等待的超时时间，单位秒
+    # 后端熔断，连续失败达到阈值后一段时间内直接回复error_reply/dify_error_reply，不再等待后端超时
+    "circuit_breaker_enabled": False,  # 是否开启
+    "circuit_breaker_failure_threshold": 5,  # 连续失败多少次后熔断
+    "circuit_breaker_recovery_timeout": 30,  # 熔断持续时间，单位秒，到期后放行探测请求，成功则恢复
+    "circuit_breaker_half_open_probes": 1,  # 恢复期同时放行的探测请求数
+    "runtime_stats_interval": 5,  # bot进程写入运行状态(熔断器等)供管理后台查看的间隔，单位秒
+    # 回复缓存，相同的问题直接返回缓存的回复，只适用于无状态的应用(如dify工作流、知识库问答)，
+    # 已有conversation_id的会话、图片消息不缓存；dify非工作流应用按用户/群信息分别缓存
+    "reply_cache_enabled": False,  # 是否开启
+    "reply_cache_ttl": 3600,  # 缓存有效期，单位秒
+    "reply_cache_max_size": 1000,  # 最多缓存的问题数，超过时淘汰最久未命中的
     # chatgpt api参数 参考https://platform.openai.com/docs/api-reference/chat/create
     "temperature": 0.9,
     "top_p": 1,
@@ -105,13 +136,32 @@ available_setting = {
     "dify_api_base": "https://api.dify.ai/v1",
     "dify_api_key": "app-xxx",
     "dify_app_type": "chatbot", # dify助手类型 chatbot(对应聊天助手或对话流)/agent(对应Agent)/workflow(对应工作流，则默认为chatbot
-    "dify_conversation_max_messages": 5, # dify目前不支持设置历史消息长度，暂时使用超过最大消息数清空会话的策略，缺点是没有滑动窗口，会突然丢失历史消息，当设置的值小于等于0，则不限制历史消息长度
+    "dify_conversation_max_messages": 5, # dify目前不支持设置历史消息长度，超过最大消息数时开启新会话，当设置的值小于等于0，则不限制历史消息长度
+    "dify_conversation_rollover": False,  # 滚动模式，开启新会话时携带本地保留的最近几轮问答，避免上下文突然丢失；关闭时直接清空会话
+    "dify_conversation_rollover_turns": 3,  # 滚动模式下携带的最近问答轮数
+    "dify_conversation_rollover_max_chars": 2000,  # 携带的上文最多字数，超过时丢弃更早的内容
+    "dify_conversation_rollover_input": "",  # 通过该名称的输入变量传递上文(需在dify应用中定义)，为空时附在新会话第一个问题的前面
     "dify_error_reply": "", # dify bot错误时给用户的回复
+    "dify_endpoints": [],  # 同一个dify应用的多个节点，如 [{"api_base": "http://dify-1/v1", "api_key": "app-xxx", "weight": 1}]，为空时使用dify_api_base和dify_api_key；节点须属于同一个应用(同一套部署的多个副本或同一应用的多个api_key)
+    "dify_lb_strategy": "least_requests",  # 节点选择策略，least_requests(进行中请求最少)/round_robin(加权轮询)，同一个会话固定使用同一个节点
+    "dify_lb_max_failures": 3,  # 节点连续失败的次数达到该值时暂时摘除
+    "dify_lb_eject_seconds": 30,  # 节点被摘除的时间，单位秒
+    "dify_lb_retries": 1,  # 连接失败或返回429/502/503时换节点重试的次数
+    "dify_stream_reply": False,  # chatbot/chatflow/workflow是否使用流式回复，开启后边生成边按段落/句子分条发送，缩短首条回复的等待时间
+    "dify_stream_segment_length": 80,  # 流式回复时每条消息的最短字数，积累超过3倍仍没有段落结尾时在句末切分
+    "dify_workflow_progress_interval": 0,  # 流式工作流执行时发送"正在执行：节点名"进度提示的最小间隔，单位秒，0表示不发送
+    "dify_upload_cache_ttl": 86400,  # 上传到dify的图片按内容哈希缓存的有效期，单位秒，相同图片在有效期内不重复上传，应不超过dify保留上传文件的时间
+    "dify_media_download_workers": 4,  # 并发下载dify回答中图片和文件的线程数
+    "dify_http_pool_size": 10,  # 每个dify应用(api_base+api_key)的连接池大小
+    "dify_http_keep_alive": True,  # 是否与dify保持长连接，复用TCP连接和TLS会话
+    "dify_connect_timeout": 10,  # 连接dify的超时时间，单位秒
+    "dify_read_timeout": 0,  # 等待dify响应的超时时间，单位秒，0表示不限制，流式响应时为两次数据之间的最大间隔
     # coze配置
     "coze_api_base": "https://api.coze.cn",
     "coze_api_key": "xxx",
     "coze_bot_id": "xxx",
     "coze_return_show_img": "false",
+    "coze_upload_cache_ttl": 86400,  # 上传到coze的图片按内容哈希缓存的有效期，单位秒
     # wework的通用配置
     "wework_smart": True,  # 配置wework是否使用已登录的企业微信，False为多开
     # 语音设置
@@ -137,6 +187,9 @@ available_setting = {
     "xi_voice_id": "",   #ElevenLabs提供了9种英式、美式等英语发音id，分别是“Adam/Antoni/Arnold/Bella/Domi/Elli/Josh/Rachel/Sam”
     # 图像模型设置
     "image_recognition": False, # 是否开启图片识别
+    "image_prefetch_workers": 2,  # 收到图片后在后台下载并上传到dify/coze的线程数
+    "image_prefetch_timeout": 60,  # 提问时等待后台图片上传完成的最长时间，单位秒
+    "image_upload_max_size": 0,  # 上传前将超过该大小(字节)的图片压缩为jpg，0表示不压缩
     # 服务时间限制，目前支持itchat
     "chat_time_module": False,  # 是否开启服务时间限制
     "chat_start_time": "00:00",  # 服务开始时间
@@ -180,6 +233,12 @@ available_setting = {
     "gewechat_token": "",
     "gewechat_app_id": "",
     "gewechat_callback_url": "", # 回调地址，示例：http://172.17.0.1:9919/v2/api/callback/collect
+    "gewechat_http_timeout": 60,  # 调用gewechat接口的超时时间，单位秒，上传下载文件的接口为该值的3倍
+    "gewechat_http_retries": 2,  # 连接gewechat服务失败时的重试次数
+    "gewechat_http_pool_size": 10,  # 与gewechat服务之间的keep-alive连接池大小
+    "gewechat_callback_workers": 4,  # 后台处理回调消息的线程数
+    "gewechat_callback_queue_size": 1000,  # 回调消息队列长度，队列满时丢弃新消息
+    "gewechat_contact_cache_ttl": 3600,  # 联系人昵称、群成员昵称的缓存有效期，单位秒，联系人变更时会收到回调使缓存失效
     
     # chatgpt指令自定义触发词
     "clear_memory_commands": ["#清除记忆"],  # 重置会话指令，必须以#开头
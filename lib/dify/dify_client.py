@@ -1,10 +1,21 @@
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
 
 
 class DifyClient:
-    def __init__(self, api_key, base_url: str = 'https://api.dify.ai/v1'):
+    def __init__(self, api_key, base_url: str = 'https://api.dify.ai/v1', session: requests.Session = None, timeout=None):
         self.api_key = api_key
         self.base_url = base_url
+        # 传入session时复用其连接池，否则每次请求新建连接
+        self.session = session
+        self.timeout = timeout
+
+    def _request(self, method, url, **kwargs):
+        if self.session is not None:
+            return self.session.request(method, url, timeout=self.timeout, **kwargs)
+        return requests.request(method, url, timeout=self.timeout, **kwargs)
 
     def _send_request(self, method, endpoint, json=None, params=None, stream=False):
         headers = {
@@ -13,7 +24,7 @@ class DifyClient:
         }
 
         url = f"{self.base_url}{endpoint}"
-        response = requests.request(method, url, json=json, params=params, headers=headers, stream=stream)
+        response = self._request(method, url, json=json, params=params, headers=headers, stream=stream)
 
         return response
 
@@ -23,7 +34,7 @@ class DifyClient:
         }
 
         url = f"{self.base_url}{endpoint}"
-        response = requests.request(method, url, data=data, headers=headers, files=files)
+        response = self._request(method, url, data=data, headers=headers, files=files)
 
         return response
 
@@ -91,3 +102,70 @@ class ChatClient(DifyClient):
     def rename_conversation(self, conversation_id, name, user):
         data = {"name": name, "user": user}
         return self._send_request("POST", f"/conversations/{conversation_id}/name", data)
+
+
+class ClientRegistry:
+    """
+    进程内共用的Dify客户端注册表，按(api_base, api_key)区分应用，每个应用一个带连接池的requests.Session，
+    配合CustomDifyApp按群切换应用时，同一个应用的请求也能复用keep-alive连接和TLS会话
+
+    :param pool_size: 每个应用的连接池大小
+    :param timeout: 请求超时时间，可以是秒数或(连接超时, 读取超时)，None表示不限制
+    :param keep_alive: 是否保持长连接
+    """
+
+    def __init__(self, pool_size=10, timeout=None, keep_alive=True):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.lock = threading.Lock()
+        self.clients = {}  # (api_base, api_key) -> ChatClient
+
+    def get(self, api_key, api_base) -> "ChatClient":
+        key = (api_base, api_key)
+        client = self.clients.get(key)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(key)
+                if client is None:
+                    client = ChatClient(api_key, api_base, session=self._new_session(), timeout=self.timeout)
+                    self.clients[key] = client
+        return client
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def stats(self):
+        """每个应用已建立的连接数、已发出的请求数和当前空闲的连接数"""
+        with self.lock:
+            clients = list(self.clients.items())
+        result = []
+        for (api_base, api_key), client in clients:
+            connections = requests_count = idle = 0
+            adapters = {id(adapter): adapter for adapter in client.session.adapters.values()}  # http和https挂载的是同一个adapter
+            for adapter in adapters.values():
+                for pool in list(adapter.poolmanager.pools._container.values()):
+                    connections += pool.num_connections
+                    requests_count += pool.num_requests
+                    # 连接池队列中未建立的连接以None占位
+                    idle += sum(1 for conn in list(pool.pool.queue) if conn) if pool.pool else 0
+            result.append({
+                "api_base": api_base,
+                "api_key": f"...{api_key[-4:]}" if api_key else "",
+                "connections": connections,
+                "requests": requests_count,
+                "idle": idle,
+            })
+        return result
+
+    def close(self):
+        with self.lock:
+            for client in self.clients.values():
+                client.session.close()
+            self.clients.clear()
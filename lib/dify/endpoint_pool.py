@@ -0,0 +1,127 @@
+import threading
+import time
+
+from common.log import logger
+
+
+class Endpoint:
+    """
+    一个dify节点(api_base + api_key)及其被动健康统计
+    成功/失败率和延迟用指数加权移动平均(EWMA)统计，连续失败达到阈值时暂时摘除
+    """
+
+    def __init__(self, api_base, api_key, weight=1):
+        self.api_base = api_base
+        self.api_key = api_key
+        self.weight = max(1, int(weight or 1))
+        self.outstanding = 0  # 正在进行的请求数
+        self.latency = 0.0  # 首字节延迟的EWMA，单位秒
+        self.error_rate = 0.0  # 失败率的EWMA
+        self.failures = 0  # 连续失败次数
+        self.ejected_until = 0
+        self.requests = 0
+        self.current_weight = 0  # 平滑加权轮询的当前权重
+
+    @property
+    def key(self):
+        return self.api_base, self.api_key
+
+    def is_ejected(self, now):
+        return now < self.ejected_until
+
+
+class EndpointPool:
+    """
+    同一个dify应用的多个节点(多个API副本或多个api_key)，按策略选择节点并做故障转移
+    least_requests: 选择 进行中的请求数/权重 最小的节点，相同时选延迟低的
+    round_robin: 平滑加权轮询
+    节点连续失败max_failures次或近期失败率超过一半时摘除eject_seconds秒，到期后自动恢复；
+    所有节点都被摘除时仍选择最早恢复的节点，不直接拒绝请求
+
+    :param endpoints: [{"api_base": ..., "api_key": ..., "weight": 1}]
+    """
+
+    def __init__(self, endpoints, strategy="least_requests", max_failures=3, eject_seconds=30, alpha=0.1):
+        if not endpoints:
+            raise ValueError("endpoints must not be empty")
+        self.endpoints = [Endpoint(e["api_base"], e["api_key"], e.get("weight", 1)) for e in endpoints]
+        self.key = tuple(e.key for e in self.endpoints)
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.alpha = alpha
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def select(self, preferred=None, exclude=()) -> Endpoint:
+        """
+        选择节点，preferred节点可用时优先使用，保证同一个会话固定在同一个节点
+        :param preferred: 会话上次使用的节点key (api_base, api_key)
+        :param exclude: 本次请求已经失败过的节点key
+        """
+        now = time.monotonic()
+        with self.lock:
+            candidates = [e for e in self.endpoints if e.key not in exclude] or self.endpoints
+            healthy = [e for e in candidates if not e.is_ejected(now)]
+            for endpoint in healthy:
+                if endpoint.key == preferred:
+                    return endpoint
+            if not healthy:
+                return min(candidates, key=lambda e: e.ejected_until)
+            if self.strategy == "round_robin":
+                return self._next_round_robin(healthy)
+            return min(healthy, key=lambda e: ((e.outstanding + 1) / e.weight, e.latency))
+
+    def begin(self, endpoint: Endpoint):
+        with self.lock:
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+        return time.monotonic()
+
+    def end(self, endpoint: Endpoint, start, ok: bool):
+        now = time.monotonic()
+        with self.lock:
+            endpoint.outstanding -= 1
+            alpha = self.alpha
+            if ok:
+                elapsed = now - start
+                endpoint.latency = elapsed if endpoint.latency == 0 else (1 - alpha) * endpoint.latency + alpha * elapsed
+                endpoint.failures = 0
+            else:
+                endpoint.failures += 1
+            endpoint.error_rate = (1 - alpha) * endpoint.error_rate + alpha * (0 if ok else 1)
+            if not ok and (endpoint.failures >= self.max_failures or endpoint.error_rate > 0.5):
+                endpoint.ejected_until = now + self.eject_seconds
+                # 恢复后重新开始统计，避免刚恢复又因历史失败率被摘除
+                endpoint.failures = 0
+                endpoint.error_rate = 0.0
+                logger.warning("[DIFY] endpoint {} ejected for {}s".format(endpoint.api_base, self.eject_seconds))
+
+    def stats(self):
+        now = time.monotonic()
+        with self.lock:
+            return [{
+                "api_base": e.api_base,
+                "api_key": f"...{e.api_key[-4:]}" if e.api_key else "",
+                "weight": e.weight,
+                "outstanding": e.outstanding,
+                "requests": e.requests,
+                "latency_ms": int(e.latency * 1000),
+                "error_rate": round(e.error_rate, 3),
+                "ejected": e.is_ejected(now),
+            } for e in self.endpoints]
+
+    @staticmethod
+    def _next_round_robin(endpoints):
+        # 调用方需持有self.lock，nginx的平滑加权轮询，权重高的节点不会连续集中被选中
+        total = 0
+        best = None
+        for endpoint in endpoints:
+            endpoint.current_weight += endpoint.weight
+            total += endpoint.weight
+            if best is None or endpoint.current_weight > best.current_weight:
+                best = endpoint
+        best.current_weight -= total
+        return best
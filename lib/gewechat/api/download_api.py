@@ -1,9 +1,10 @@
-from ..util.http_util import post_json
+from ..util.http_util import HttpClient
 
 class DownloadApi:
-    def __init__(self, base_url, token):
+    def __init__(self, base_url, token, http=None):
         self.base_url = base_url
         self.token = token
+        self.http = http or HttpClient(base_url, token)
 
     def download_image(self, app_id, xml, type):
         """下载图片"""
@@ -12,7 +13,7 @@ class DownloadApi:
             "xml": xml,
             "type": type
         }
-        return post_json(self.base_url, "/message/downloadImage", self.token, param)
+        return self.http.post_json("/message/downloadImage", param, timeout=self.http.media_timeout)
 
     def download_voice(self, app_id, xml, msg_id):
         """下载语音"""
@@ -21,7 +22,7 @@ class DownloadApi:
             "xml": xml,
             "msgId": msg_id
         }
-        return post_json(self.base_url, "/message/downloadVoice", self.token, param)
+        return self.http.post_json("/message/downloadVoice", param, timeout=self.http.media_timeout)
 
     def download_video(self, app_id, xml):
         """下载视频"""
@@ -29,7 +30,7 @@ class DownloadApi:
             "appId": app_id,
             "xml": xml
         }
-        return post_json(self.base_url, "/message/downloadVideo", self.token, param)
+        return self.http.post_json("/message/downloadVideo", param, timeout=self.http.media_timeout)
 
     def download_emoji_md5(self, app_id, emoji_md5):
         """下载emoji"""
@@ -37,7 +38,7 @@ class DownloadApi:
             "appId": app_id,
             "emojiMd5": emoji_md5
         }
-        return post_json(self.base_url, "/message/downloadEmojiMd5", self.token, param)
+        return self.http.post_json("/message/downloadEmojiMd5", param)
 
     def download_cdn(self, app_id, aes_key, file_id, type, total_size, suffix):
         """cdn下载"""
@@ -49,4 +50,4 @@ class DownloadApi:
             "type": type,
             "suffix": suffix
         }
-        return post_json(self.base_url, "/message/downloadCdn", self.token, param)
\ No newline at end of file
+        return self.http.post_json("/message/downloadCdn", param, timeout=self.http.media_timeout)
\ No newline at end of file
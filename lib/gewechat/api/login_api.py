@@ -1,16 +1,17 @@
 from ..util.terminal_printer import make_and_print_qr, print_green, print_yellow, print_red
-from ..util.http_util import post_json
+from ..util.http_util import HttpClient
 import time
 
 
 class LoginApi:
-    def __init__(self, base_url, token):
+    def __init__(self, base_url, token, http=None):
         self.base_url = base_url
         self.token = token
+        self.http = http or HttpClient(base_url, token)
 
     def get_token(self):
         """获取tokenId"""
-        return post_json(self.base_url, "/tools/getTokenId", self.token, {})
+        return self.http.post_json("/tools/getTokenId", {})
 
     def set_callback(self, token, callback_url):
         """设置微信消息的回调地址"""
@@ -18,14 +19,14 @@ class LoginApi:
             "token": token,
             "callbackUrl": callback_url
         }
-        return post_json(self.base_url, "/tools/setCallback", self.token, param)
+        return self.http.post_json("/tools/setCallback", param)
 
     def get_qr(self, app_id):
         """获取登录二维码"""
         param = {
             "appId": app_id
         }
-        return post_json(self.base_url, "/login/getLoginQrCode", self.token, param)
+        return self.http.post_json("/login/getLoginQrCode", param)
 
     def check_qr(self, app_id, uuid, captch_code):
         """确认登陆"""
@@ -34,35 +35,35 @@ class LoginApi:
             "uuid": uuid,
             "captchCode": captch_code
         }
-        return post_json(self.base_url, "/login/checkLogin", self.token, param)
+        return self.http.post_json("/login/checkLogin", param)
 
     def log_out(self, app_id):
         """退出微信"""
         param = {
             "appId": app_id
         }
-        return post_json(self.base_url, "/login/logout", self.token, param)
+        return self.http.post_json("/login/logout", param)
 
     def dialog_login(self, app_id):
         """弹框登录"""
         param = {
             "appId": app_id
         }
-        return post_json(self.base_url, "/login/dialogLogin", self.token, param)
+        return self.http.post_json("/login/dialogLogin", param)
 
     def check_online(self, app_id):
         """检查是否在线"""
         param = {
             "appId": app_id
         }
-        return post_json(self.base_url, "/login/checkOnline", self.token, param)
+        return self.http.post_json("/login/checkOnline", param)
 
     def logout(self, app_id):
         """退出"""
         param = {
             "appId": app_id
         }
-        return post_json(self.base_url, "/login/logout", self.token, param)
+        return self.http.post_json("/login/logout", param)
 
     def _get_and_validate_qr(self, app_id):
         """获取并验证二维码数据
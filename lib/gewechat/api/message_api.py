@@ -1,9 +1,10 @@
-from ..util.http_util import post_json
+from ..util.http_util import HttpClient
 
 class MessageApi:
-    def __init__(self, base_url, token):
+    def __init__(self, base_url, token, http=None):
         self.base_url = base_url
         self.token = token
+        self.http = http or HttpClient(base_url, token)
 
     def post_text(self, app_id, to_wxid, content, ats):
         """发送文字消息"""
@@ -13,7 +14,7 @@ class MessageApi:
             "content": content,
             "ats": ats
         }
-        return post_json(self.base_url, "/message/postText", self.token, param)
+        return self.http.post_json("/message/postText", param)
 
     def post_file(self, app_id, to_wxid, file_url, file_name):
         """发送文件消息"""
@@ -23,7 +24,7 @@ class MessageApi:
             "fileUrl": file_url,
             "fileName": file_name
         }
-        return post_json(self.base_url, "/message/postFile", self.token, param)
+        return self.http.post_json("/message/postFile", param, timeout=self.http.media_timeout)
 
     def post_image(self, app_id, to_wxid, img_url):
         """发送图片消息"""
@@ -32,7 +33,7 @@ class MessageApi:
             "toWxid": to_wxid,
             "imgUrl": img_url
         }
-        return post_json(self.base_url, "/message/postImage", self.token, param)
+        return self.http.post_json("/message/postImage", param)
 
     def post_voice(self, app_id, to_wxid, voice_url, voice_duration):
         """发送语音消息"""
@@ -42,7 +43,7 @@ class MessageApi:
             "voiceUrl": voice_url,
             "voiceDuration": voice_duration
         }
-        return post_json(self.base_url, "/message/postVoice", self.token, param)
+        return self.http.post_json("/message/postVoice", param)
 
     def post_video(self, app_id, to_wxid, video_url, thumb_url, video_duration):
         """发送视频消息"""
@@ -53,7 +54,7 @@ class MessageApi:
             "thumbUrl": thumb_url,
             "videoDuration": video_duration
         }
-        return post_json(self.base_url, "/message/postVideo", self.token, param)
+        return self.http.post_json("/message/postVideo", param, timeout=self.http.media_timeout)
 
     def post_link(self, app_id, to_wxid, title, desc, link_url, thumb_url):
         """发送链接消息"""
@@ -65,7 +66,7 @@ class MessageApi:
             "linkUrl": link_url,
             "thumbUrl": thumb_url
         }
-        return post_json(self.base_url, "/message/postLink", self.token, param)
+        return self.http.post_json("/message/postLink", param)
 
     def post_name_card(self, app_id, to_wxid, nick_name, name_card_wxid):
         """发送名片消息"""
@@ -75,7 +76,7 @@ class MessageApi:
             "nickName": nick_name,
             "nameCardWxid": name_card_wxid
         }
-        return post_json(self.base_url, "/message/postNameCard", self.token, param)
+        return self.http.post_json("/message/postNameCard", param)
 
     def post_emoji(self, app_id, to_wxid, emoji_md5, emoji_size):
         """发送emoji消息"""
@@ -85,7 +86,7 @@ class MessageApi:
             "emojiMd5": emoji_md5,
             "emojiSize": emoji_size
         }
-        return post_json(self.base_url, "/message/postEmoji", self.token, param)
+        return self.http.post_json("/message/postEmoji", param)
 
     def post_app_msg(self, app_id, to_wxid, appmsg):
         """发送appmsg消息"""
@@ -94,7 +95,7 @@ class MessageApi:
             "toWxid": to_wxid,
             "appmsg": appmsg
         }
-        return post_json(self.base_url, "/message/postAppMsg", self.token, param)
+        return self.http.post_json("/message/postAppMsg", param)
 
     def post_mini_app(self, app_id, to_wxid, mini_app_id, display_name, page_path, cover_img_url, title, user_name):
         """发送小程序消息"""
@@ -108,7 +109,7 @@ class MessageApi:
             "title": title,
             "userName": user_name
         }
-        return post_json(self.base_url, "/message/postMiniApp", self.token, param)
+        return self.http.post_json("/message/postMiniApp", param)
 
     def forward_file(self, app_id, to_wxid, xml):
         """转发文件"""
@@ -117,7 +118,7 @@ class MessageApi:
             "toWxid": to_wxid,
             "xml": xml
         }
-        return post_json(self.base_url, "/message/forwardFile", self.token, param)
+        return self.http.post_json("/message/forwardFile", param, timeout=self.http.media_timeout)
 
     def forward_image(self, app_id, to_wxid, xml):
         """转发图片"""
@@ -126,7 +127,7 @@ class MessageApi:
             "toWxid": to_wxid,
             "xml": xml
         }
-        return post_json(self.base_url, "/message/forwardImage", self.token, param)
+        return self.http.post_json("/message/forwardImage", param)
 
     def forward_video(self, app_id, to_wxid, xml):
         """转发视频"""
@@ -135,7 +136,7 @@ class MessageApi:
             "toWxid": to_wxid,
             "xml": xml
         }
-        return post_json(self.base_url, "/message/forwardVideo", self.token, param)
+        return self.http.post_json("/message/forwardVideo", param, timeout=self.http.media_timeout)
 
     def forward_url(self, app_id, to_wxid, xml):
         """转发链接"""
@@ -144,7 +145,7 @@ class MessageApi:
             "toWxid": to_wxid,
             "xml": xml
         }
-        return post_json(self.base_url, "/message/forwardUrl", self.token, param)
+        return self.http.post_json("/message/forwardUrl", param)
 
     def forward_mini_app(self, app_id, to_wxid, xml, cover_img_url):
         """转发小程序"""
@@ -154,7 +155,7 @@ class MessageApi:
             "xml": xml,
             "coverImgUrl": cover_img_url
         }
-        return post_json(self.base_url, "/message/forwardMiniApp", self.token, param)
+        return self.http.post_json("/message/forwardMiniApp", param)
 
     def revoke_msg(self, app_id, to_wxid, msg_id, new_msg_id, create_time):
         """撤回消息"""
@@ -165,4 +166,4 @@ class MessageApi:
             "newMsgId": new_msg_id,
             "createTime": create_time
         }
-        return post_json(self.base_url, "/message/revokeMsg", self.token, param)
\ No newline at end of file
+        return self.http.post_json("/message/revokeMsg", param)
\ No newline at end of file
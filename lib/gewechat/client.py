@@ -1,12 +1,12 @@
 from .api.contact_api import ContactApi
 from .api.download_api import DownloadApi
-from .api.download_api import DownloadApi
 from .api.favor_api import FavorApi
 from .api.group_api import GroupApi
 from .api.label_api import LabelApi
 from .api.login_api import LoginApi
 from .api.message_api import MessageApi
 from .api.personal_api import PersonalApi
+from .util.http_util import HttpClient
 
 class GewechatClient:
     """
@@ -29,16 +29,25 @@ class GewechatClient:
     ```
 
     注意: 在使用任何方法之前，请确保你已经正确初始化了客户端，并且有有效的 base_url 和 token。
+    所有API共用一个keep-alive连接池，客户端是线程安全的，应尽量复用同一个客户端实例。
     """
-    def __init__(self, base_url, token):
-        self._contact_api = ContactApi(base_url, token)
-        self._download_api = DownloadApi(base_url, token)
-        self._favor_api = FavorApi(base_url, token)
-        self._group_api = GroupApi(base_url, token)
-        self._label_api = LabelApi(base_url, token)
-        self._login_api = LoginApi(base_url, token)
-        self._message_api = MessageApi(base_url, token)
-        self._personal_api = PersonalApi(base_url, token)
+    def __init__(self, base_url, token, timeout=60, media_timeout=180, retries=2, backoff=0.5, pool_size=10):
+        self.base_url = base_url
+        self.token = token
+        self._http = HttpClient(base_url, token, timeout=timeout, media_timeout=media_timeout,
+                                retries=retries, backoff=backoff, pool_size=pool_size)
+        self._contact_api = ContactApi(base_url, token, self._http)
+        self._download_api = DownloadApi(base_url, token, self._http)
+        self._favor_api = FavorApi(base_url, token, self._http)
+        self._group_api = GroupApi(base_url, token, self._http)
+        self._label_api = LabelApi(base_url, token, self._http)
+        self._login_api = LoginApi(base_url, token, self._http)
+        self._message_api = MessageApi(base_url, token, self._http)
+        self._personal_api = PersonalApi(base_url, token, self._http)
+
+    def close(self):
+        """关闭连接池"""
+        self._http.close()
 
     def fetch_contacts_list(self, app_id):
         """获取通讯录列表"""
@@ -0,0 +1,168 @@
+import threading
+import time
+
+
+class ContactCache:
+    """
+    好友/群昵称及群成员昵称的共享缓存，按wxid索引
+
+    收到消息时只需在内存中查询昵称，未命中时才请求gewechat服务；
+    缓存的条目在TTL内有效，后台线程定期批量刷新最近用到、即将过期的条目；
+    收到ModContacts/DelContacts回调时使对应条目失效
+
+    使用示例:
+    ```
+    cache = ContactCache(client, ttl=3600)
+    nickname = cache.get_nickname(app_id, "wxid_xxx")
+    member_nickname = cache.get_member_nickname(app_id, "xxx@chatroom", "wxid_xxx")
+    ```
+    """
+    BRIEF_INFO_BATCH_SIZE = 100  # get_brief_info单次最多查询的wxid数量
+    MEMBER_REFETCH_INTERVAL = 60  # 群内找不到成员（如新成员入群）时，重新拉取成员列表的最小间隔，单位秒
+
+    def __init__(self, client, ttl=3600):
+        self.client = client
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._contacts = {}  # wxid -> {"nickname": str, "fetched_at": float, "used_at": float}
+        self._chatrooms = {}  # chatroom_id -> {"members": {wxid: nickname}, "fetched_at": float, "used_at": float}
+        self._app_id = None  # 首次查询时记录，后台刷新时使用
+        self._refresh_thread = None
+
+    def get_nickname(self, app_id, wxid):
+        """获取好友或群的昵称，获取失败时返回None"""
+        now = time.monotonic()
+        self._start_refresh(app_id)
+        with self._lock:
+            entry = self._contacts.get(wxid)
+            if entry and now - entry["fetched_at"] < self.ttl:
+                entry["used_at"] = now
+                return entry["nickname"]
+        self._fetch_contacts(app_id, [wxid])
+        with self._lock:
+            entry = self._contacts.get(wxid)
+            return entry["nickname"] if entry else None
+
+    def peek_nickname(self, wxid):
+        """只查询缓存，不请求接口，未缓存时返回None"""
+        with self._lock:
+            entry = self._contacts.get(wxid)
+            if entry and time.monotonic() - entry["fetched_at"] < self.ttl:
+                return entry["nickname"]
+        return None
+
+    def get_member_nickname(self, app_id, chatroom_id, wxid):
+        """获取群成员的群昵称，没有群昵称时返回微信昵称，获取失败时返回None"""
+        now = time.monotonic()
+        self._start_refresh(app_id)
+        with self._lock:
+            room = self._chatrooms.get(chatroom_id)
+            if room and now - room["fetched_at"] < self.ttl:
+                room["used_at"] = now
+                if wxid in room["members"]:
+                    return room["members"][wxid]
+                if now - room["fetched_at"] < self.MEMBER_REFETCH_INTERVAL:
+                    return None
+        self._fetch_members(app_id, chatroom_id)
+        with self._lock:
+            room = self._chatrooms.get(chatroom_id)
+            return room["members"].get(wxid) if room else None
+
+    def invalidate(self, wxid):
+        with self._lock:
+            self._contacts.pop(wxid, None)
+            self._chatrooms.pop(wxid, None)
+
+    def handle_callback(self, data):
+        """处理gewechat的ModContacts/DelContacts回调，使对应的缓存失效"""
+        msg_data = data.get("Data") or data.get("data") or {}
+        wxid = (msg_data.get("UserName") or {}).get("string")
+        if not wxid:
+            return
+        self.invalidate(wxid)
+        nickname = (msg_data.get("NickName") or {}).get("string")
+        if data.get("TypeName") == "ModContacts" and nickname:
+            # ModContacts回调中已经带有最新的昵称，直接写入缓存
+            now = time.monotonic()
+            with self._lock:
+                self._contacts[wxid] = {"nickname": nickname, "fetched_at": now, "used_at": now}
+
+    def _fetch_contacts(self, app_id, wxids):
+        for i in range(0, len(wxids), self.BRIEF_INFO_BATCH_SIZE):
+            batch = wxids[i:i + self.BRIEF_INFO_BATCH_SIZE]
+            try:
+                response = self.client.get_brief_info(app_id, batch)
+            except Exception as e:
+                print(f"获取联系人信息失败, wxids={batch}, exception={e}")
+                continue
+            now = time.monotonic()
+            with self._lock:
+                for info in response.get("data") or []:
+                    wxid = info.get("userName")
+                    if not wxid:
+                        continue
+                    old = self._contacts.get(wxid)
+                    self._contacts[wxid] = {
+                        "nickname": info.get("nickName") or wxid,
+                        "fetched_at": now,
+                        "used_at": old["used_at"] if old else now,
+                    }
+                # 接口没有返回userName时，按请求顺序对应
+                if len(batch) == 1 and batch[0] not in self._contacts and response.get("data"):
+                    self._contacts[batch[0]] = {
+                        "nickname": response["data"][0].get("nickName") or batch[0],
+                        "fetched_at": now,
+                        "used_at": now,
+                    }
+
+    def _fetch_members(self, app_id, chatroom_id):
+        try:
+            response = self.client.get_chatroom_member_list(app_id, chatroom_id)
+        except Exception as e:
+            print(f"获取群成员列表失败, chatroom_id={chatroom_id}, exception={e}")
+            return
+        members = {}
+        for member_info in (response.get("data") or {}).get("memberList") or []:
+            # 优先使用群昵称displayName，没有时使用微信昵称nickName
+            members[member_info["wxid"]] = member_info.get("displayName") or member_info.get("nickName") or member_info["wxid"]
+        now = time.monotonic()
+        with self._lock:
+            old = self._chatrooms.get(chatroom_id)
+            self._chatrooms[chatroom_id] = {
+                "members": members,
+                "fetched_at": now,
+                "used_at": old["used_at"] if old else now,
+            }
+
+    def _start_refresh(self, app_id):
+        self._app_id = app_id
+        if self._refresh_thread is None:
+            with self._lock:
+                if self._refresh_thread is None:
+                    self._refresh_thread = threading.Thread(target=self._refresh_loop, name="gewechat-contact-cache", daemon=True)
+                    self._refresh_thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(max(self.ttl / 4, 1))
+            if not self._app_id:
+                continue
+            try:
+                self._refresh(self._app_id)
+            except Exception as e:
+                print(f"刷新联系人缓存失败, exception={e}")
+
+    def _refresh(self, app_id):
+        now = time.monotonic()
+        stale_contacts, stale_rooms = [], []
+        with self._lock:
+            for cache, stale in ((self._contacts, stale_contacts), (self._chatrooms, stale_rooms)):
+                for key, entry in list(cache.items()):
+                    if now - entry["used_at"] > self.ttl:
+                        del cache[key]  # 一个TTL内没有用到的条目直接丢弃
+                    elif now - entry["fetched_at"] > self.ttl / 2:
+                        stale.append(key)
+        if stale_contacts:
+            self._fetch_contacts(app_id, stale_contacts)
+        for chatroom_id in stale_rooms:
+            self._fetch_members(app_id, chatroom_id)
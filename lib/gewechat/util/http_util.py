@@ -1,23 +1,49 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class HttpClient:
+    """
+    与gewechat服务通信的HTTP客户端，同一个GewechatClient的所有API共用一个连接池，
+    keep-alive复用TCP连接，避免每次调用都重新建立连接
+
+    :param timeout: 默认超时时间，单位秒，可在每次调用时单独指定
+    :param media_timeout: 上传、下载图片/文件/视频等接口的超时时间，单位秒
+    :param retries: 连接失败时的重试次数，只重试请求未发出的情况，避免重复发送消息
+    :param backoff: 重试间隔的退避系数，第n次重试前等待 backoff * 2^(n-1) 秒
+    :param pool_size: 连接池大小，应不小于同时调用接口的线程数
+    """
+
+    def __init__(self, base_url, token, timeout=60, media_timeout=180, retries=2, backoff=0.5, pool_size=10):
+        self.base_url = base_url
+        self.token = token
+        self.timeout = timeout
+        self.media_timeout = media_timeout
+        self.session = requests.Session()
+        self.session.headers['Content-Type'] = 'application/json'
+        if token:
+            self.session.headers['X-GEWE-TOKEN'] = token
+        retry = Retry(total=retries, connect=retries, read=0, status=0, other=0, backoff_factor=backoff)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post_json(self, route, data, timeout=None):
+        url = self.base_url + route
+        try:
+            response = self.session.post(url, json=data, timeout=timeout or self.timeout)
+            response.raise_for_status()
+            result = response.json()
+
+            if result.get('ret') == 200:
+                return result
+            else:
+                raise RuntimeError(response.text)
+        except Exception as e:
+            print(f"http请求失败, url={url}, exception={e}")
+            raise RuntimeError(str(e))
+
+    def close(self):
+        self.session.close()
 
-def post_json(base_url, route, token, data):
-    headers = {
-        'Content-Type': 'application/json'
-    }
-    if token:
-        headers['X-GEWE-TOKEN'] = token
-
-    url = base_url + route
-
-    try:
-        response = requests.post(url, json=data, headers=headers, timeout=60)
-        response.raise_for_status()
-        result = response.json()
-
-        if result.get('ret') == 200:
-            return result
-        else:
-            raise RuntimeError(response.text)
-    except Exception as e:
-        print(f"http请求失败, url={url}, exception={e}")
-        raise RuntimeError(str(e))
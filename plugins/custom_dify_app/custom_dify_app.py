@@ -65,6 +65,10 @@ class CustomDifyApp(Plugin):
             if dify_app_conf is None:
                 return
             # 检查配置是否完整
+            endpoints = dify_app_conf.get("endpoints") or []
+            if endpoints and not dify_app_conf.get("api_base"):
+                # 只配置了节点列表时，以第一个节点作为应用的api_base和api_key
+                dify_app_conf = dict(dify_app_conf, api_base=endpoints[0].get("api_base"), api_key=endpoints[0].get("api_key"))
             if not (dify_app_conf.get("app_type") and dify_app_conf.get("api_base") and dify_app_conf.get("api_key")):
                 logger.warning(f"[CustomDifyApp] dify app config is invalid: {dify_app_conf}")
                 return
@@ -74,6 +78,8 @@ class CustomDifyApp(Plugin):
             context["dify_app_type"] = dify_app_conf["app_type"]
             context["dify_api_base"] = dify_app_conf["api_base"]
             context["dify_api_key"] = dify_app_conf["api_key"]
+            # 未配置节点列表时显式置空，避免使用全局配置中其他应用的节点
+            context["dify_endpoints"] = endpoints
             context["image_recognition"] = dify_app_conf.get("image_recognition", False)
         except Exception as e:
             logger.error(f"[CustomDifyApp] on_handle_context error: {e}")
@@ -12,7 +12,9 @@ import plugins
 from bridge.bridge import Bridge
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
+from channel.chat_channel import get_handler_pool_stats, resize_handler_pools
 from common import const
+from common.session_budget import get_session_budget
 from config import conf, load_config, global_config
 from plugins import *
 
@@ -131,6 +133,14 @@ ADMIN_COMMANDS = {
         "alias": ["debug", "调试模式", "DEBUG"],
         "desc": "开启机器调试日志",
     },
+    "pools": {
+        "alias": ["pools", "线程池"],
+        "desc": "查看消息处理线程池和后端限流状态",
+    },
+    "flushcache": {
+        "alias": ["flushcache", "清空回复缓存"],
+        "desc": "清空回复缓存",
+    },
 }
 
 def generate_temporary_password(length=12):
@@ -375,6 +385,7 @@ class Godcmd(Plugin):
                             ok, result = True, "服务已恢复"
                         elif cmd == "reconf":
                             load_config()
+                            resize_handler_pools()
                             ok, result = True, "配置已重载"
                         elif cmd == "resetall":
                             if bottype in [const.OPEN_AI, const.CHATGPT, const.CHATGPTONAZURE, const.LINKAI, const.DIFY, const.COZE,
@@ -391,6 +402,55 @@ class Godcmd(Plugin):
                             else:
                                 logger.setLevel(logging.DEBUG)
                                 ok, result = True, "DEBUG模式已开启"
+                        elif cmd == "pools":
+                            ok = True
+                            result = "线程池状态：\n"
+                            for stats in get_handler_pool_stats():
+                                result += f"{stats['name']}: 线程{stats['busy']}/{stats['max_workers']} 排队{stats['queue_depth']} 饱和次数{stats['saturated']}\n"
+                            limiter_stats = Bridge().get_limiter_stats()
+                            if limiter_stats:
+                                result += "后端限流状态：\n"
+                                for stats in limiter_stats:
+                                    result += f"{stats['name']}: 并发{stats['in_flight']}/{stats['limit']} 排队{stats['queue_depth']} 拒绝{stats['rejected']} 过载{stats['overloaded']}\n"
+                            breaker_stats = Bridge().get_breaker_stats()
+                            if breaker_stats:
+                                result += "后端熔断状态：\n"
+                                for stats in breaker_stats:
+                                    result += f"{stats['name']}: {stats['state']} 连续失败{stats['failures']} 熔断次数{stats['trips']} 快速失败{stats['rejected']}\n"
+                            memory_stats = get_session_budget().stats()
+                            budget = f"{memory_stats['budget_bytes'] // 1024}KB" if memory_stats['budget_bytes'] else "不限制"
+                            result += f"会话内存：{memory_stats['sessions']}个会话 {memory_stats['usage_bytes'] // 1024}KB/{budget} 淘汰{memory_stats['evictions']}\n"
+                            chat_bot = Bridge().get_bot("chat")
+                            if hasattr(chat_bot, "get_client_stats"):
+                                result += "Dify连接池：\n"
+                                for stats in chat_bot.get_client_stats():
+                                    result += f"{stats['api_base']} {stats['api_key']}: 连接{stats['connections']} 空闲{stats['idle']} 请求{stats['requests']}\n"
+                            if hasattr(chat_bot, "get_endpoint_stats"):
+                                endpoint_stats = chat_bot.get_endpoint_stats()
+                                if len(endpoint_stats) > 1:
+                                    result += "Dify节点：\n"
+                                    for stats in endpoint_stats:
+                                        state = "已摘除" if stats['ejected'] else "正常"
+                                        result += f"{stats['api_base']} {stats['api_key']}: {state} 进行中{stats['outstanding']} 请求{stats['requests']} 延迟{stats['latency_ms']}ms 失败率{stats['error_rate']:.1%}\n"
+                            stats = Bridge().reply_cache.stats()
+                            result += f"回复缓存：条目{stats['size']} 命中{stats['hits']} 未命中{stats['misses']} 命中率{stats['hit_rate']:.1%}\n"
+                            upload_cache = getattr(chat_bot, "upload_cache", None)
+                            if upload_cache:
+                                stats = upload_cache.stats()
+                                result += f"上传缓存：{stats['name']} 条目{stats['size']} 命中{stats['hits']} 未命中{stats['misses']} 命中率{stats['hit_rate']:.1%}\n"
+                            callback_queue = getattr(channel, "callback_queue", None)
+                            if callback_queue:
+                                stats = callback_queue.stats()
+                                result += "回调接收队列：\n"
+                                result += f"{stats['name']}: 排队{stats['queue_depth']} 已处理{stats['processed']} 重复{stats['duplicated']} 丢弃{stats['dropped']} 失败{stats['failed']}\n"
+                            prefilter = getattr(channel, "prefilter", None)
+                            if prefilter:
+                                dropped = prefilter.stats()["dropped"]
+                                result += "预过滤丢弃：" + (" ".join(f"{reason}{count}" for reason, count in dropped.items()) or "无") + "\n"
+                        elif cmd == "flushcache":
+                            stats = Bridge().reply_cache.stats()
+                            size = Bridge().reply_cache.clear()
+                            ok, result = True, f"已清空回复缓存{size}条，命中率{stats['hit_rate']:.1%}"
                         elif cmd == "plist":
                             plugins = PluginManager().list_plugins()
                             ok = True
@@ -0,0 +1,110 @@
+"""
+对比新旧 ExpiredDict 的吞吐和内存占用
+
+运行方式（项目根目录下）:
+    python -m tests.benchmarks.bench_expired_dict
+
+场景:
+  1. 写入: 连续写入 N 个不同的key
+  2. 读取: 随机读取已有的key
+  3. keys(): 遍历全部key
+  4. 过期后的内存: 写入 N 个key，全部过期后再写入 N 个新key，统计常驻内存
+"""
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from common.expired_dict import ExpiredDict
+
+SIZES = [1000, 10000, 100000]
+
+
+class LegacyExpiredDict(dict):
+    """改造前的实现，只在key被再次读取时才清理"""
+
+    def __init__(self, expires_in_seconds):
+        super().__init__()
+        self.expires_in_seconds = expires_in_seconds if expires_in_seconds else 3600
+
+    def __getitem__(self, key):
+        value, expiry_time = super().__getitem__(key)
+        if datetime.now() > expiry_time:
+            del self[key]
+            raise KeyError("expired {}".format(key))
+        self.__setitem__(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        expiry_time = datetime.now() + timedelta(seconds=self.expires_in_seconds)
+        super().__setitem__(key, (value, expiry_time))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def keys(self):
+        keys = list(super().keys())
+        return [key for key in keys if key in self]
+
+
+def ops_per_second(fn, count):
+    start = time.perf_counter()
+    fn()
+    return count / (time.perf_counter() - start)
+
+
+def bench_throughput(cls, size):
+    d = cls(3600)
+    keys = [f"session-{i}" for i in range(size)]
+    lookups = [random.choice(keys) for _ in range(size)]
+
+    def write():
+        for key in keys:
+            d[key] = key
+
+    def read():
+        for key in lookups:
+            d.get(key)
+
+    write_ops = ops_per_second(write, size)
+    read_ops = ops_per_second(read, size)
+    start = time.perf_counter()
+    d.keys()
+    keys_ms = (time.perf_counter() - start) * 1000
+    return write_ops, read_ops, keys_ms
+
+
+def bench_memory(cls, size):
+    tracemalloc.start()
+    d = cls(2)
+    for i in range(size):
+        d[f"old-{i}"] = i
+    time.sleep(2.1)
+    for i in range(size):
+        d[f"new-{i}"] = i
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / 1024 / 1024
+
+
+def main():
+    print(f"{'impl':<8}{'size':>8}{'write/s':>12}{'read/s':>12}{'keys()(ms)':>12}{'mem after expiry(MB)':>22}")
+    for size in SIZES:
+        for name, cls in (("legacy", LegacyExpiredDict), ("new", ExpiredDict)):
+            write_ops, read_ops, keys_ms = bench_throughput(cls, size)
+            memory = bench_memory(cls, size)
+            print(f"{name:<8}{size:>8}{write_ops:>12.0f}{read_ops:>12.0f}{keys_ms:>12.1f}{memory:>22.2f}")
+
+
+if __name__ == "__main__":
+    main()
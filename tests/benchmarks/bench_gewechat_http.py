@@ -0,0 +1,68 @@
+"""
+对比每次新建连接与keep-alive连接池下顺序调用 post_text 的吞吐
+
+运行方式（项目根目录下）:
+    python -m tests.benchmarks.bench_gewechat_http
+
+在本地启动一个模拟gewechat接口的HTTP/1.1服务，直接返回 {"ret": 200}，
+因此测到的主要是建立TCP连接和请求本身的开销，远端gewechat服务上差距会随网络延迟进一步放大
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from lib.gewechat import GewechatClient
+
+COUNT = 2000
+BODY = json.dumps({"ret": 200, "msg": "操作成功", "data": {}}).encode("utf-8")
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # 响应头和响应体分两次写入，不关闭Nagle算法时keep-alive连接会被延迟确认拖慢
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def legacy_post_text(base_url, token, app_id, to_wxid, content):
+    """改造前的实现，每次调用requests.post，不复用连接"""
+    headers = {"Content-Type": "application/json", "X-GEWE-TOKEN": token}
+    param = {"appId": app_id, "toWxid": to_wxid, "content": content, "ats": ""}
+    response = requests.post(base_url + "/message/postText", json=param, headers=headers, timeout=60)
+    response.raise_for_status()
+    return response.json()
+
+
+def run(name, fn):
+    start = time.perf_counter()
+    for i in range(COUNT):
+        fn(i)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10}{COUNT:>8}{COUNT / elapsed:>12.0f}{elapsed / COUNT * 1000:>12.3f}")
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v2/api"
+    client = GewechatClient(base_url, "token")
+    print(f"{'impl':<10}{'calls':>8}{'calls/s':>12}{'ms/call':>12}")
+    run("legacy", lambda i: legacy_post_text(base_url, "token", "app", "wxid_a", f"hello {i}"))
+    run("pooled", lambda i: client.post_text("app", "wxid_a", f"hello {i}", ""))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
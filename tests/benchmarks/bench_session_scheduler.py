@@ -0,0 +1,150 @@
+"""
+对比 ChatChannel 事件驱动调度器与旧版 0.2s 轮询消费者的调度延迟和空闲CPU占用
+
+运行方式（项目根目录下）:
+    python -m tests.benchmarks.bench_session_scheduler
+
+每个场景先构造 N 个"驻留"会话（会话内有一条正在处理的消息和一条排队消息，与线上大量活跃群会话的状态一致），
+然后:
+  1. 空闲CPU: 不产生新消息，统计一段时间内进程消耗的CPU时间
+  2. 调度延迟: 向新的会话随机间隔投递消息，统计 produce() 到 _handle() 开始执行的耗时 p50/p99
+"""
+import random
+import statistics
+import threading
+import time
+
+from bridge.context import Context, ContextType
+from channel import chat_channel
+from channel.chat_channel import ChatChannel
+from common.dequeue import Dequeue
+
+SESSION_COUNTS = [10, 1000, 10000]
+IDLE_SECONDS = 2.0
+PROBE_COUNT = 200
+
+
+class EventDrivenChannel(ChatChannel):
+    # 每个基准通道使用独立的调度状态，避免与其他通道共享类属性
+    futures = {}
+    sessions = {}
+    lock = threading.Lock()
+    ready_sessions = {}
+    ready_cond = threading.Condition(lock)
+
+    def __init__(self):
+        self.latencies = []
+        self.done = threading.Semaphore(0)
+        super().__init__()
+
+    def _handle(self, context: Context):
+        self.latencies.append(time.perf_counter() - context["produced_at"])
+        self.done.release()
+
+
+class PollingChannel(EventDrivenChannel):
+    futures = {}
+    sessions = {}
+    lock = threading.Lock()
+    ready_sessions = {}
+    ready_cond = threading.Condition(lock)
+
+    def __init__(self):
+        self.running = True
+        super().__init__()
+
+    # 旧版实现：每0.2s遍历全部session并尝试获取信号量
+    def consume(self):
+        while self.running:
+            with self.lock:
+                session_ids = list(self.sessions.keys())
+            for session_id in session_ids:
+                with self.lock:
+                    context_queue, semaphore = self.sessions[session_id]
+                if semaphore.acquire(blocking=False):
+                    if not context_queue.empty():
+                        context = context_queue.get()
+                        future = chat_channel.handler_pool.submit(self._handle, context)
+                        future.add_done_callback(self._thread_pool_callback(session_id, context=context))
+                        with self.lock:
+                            if session_id not in self.futures:
+                                self.futures[session_id] = []
+                            self.futures[session_id].append(future)
+                    elif semaphore._initial_value == semaphore._value + 1:
+                        with self.lock:
+                            self.futures[session_id] = [t for t in self.futures[session_id] if not t.done()]
+                            del self.sessions[session_id]
+                    else:
+                        semaphore.release()
+            time.sleep(0.2)
+
+
+def park_sessions(channel, count):
+    """构造count个处于"处理中"状态的会话：信号量已被占用，队列中还有一条等待的消息"""
+    parked = []
+    with channel.lock:
+        for i in range(count):
+            session_id = f"parked-{i}"
+            queue = Dequeue()
+            queue.put(new_context(session_id))
+            semaphore = threading.BoundedSemaphore(1)
+            semaphore.acquire()
+            channel.sessions[session_id] = [queue, semaphore]
+            channel.futures[session_id] = []
+            parked.append(session_id)
+    return parked
+
+
+def unpark_sessions(channel, parked):
+    with channel.lock:
+        for session_id in parked:
+            channel.sessions.pop(session_id, None)
+            channel.futures.pop(session_id, None)
+
+
+def new_context(session_id):
+    context = Context(ContextType.TEXT, "ping", kwargs=dict())
+    context["session_id"] = session_id
+    context["produced_at"] = time.perf_counter()
+    return context
+
+
+def measure(channel, session_count):
+    parked = park_sessions(channel, session_count)
+    try:
+        start_cpu = time.process_time()
+        time.sleep(IDLE_SECONDS)
+        idle_cpu = (time.process_time() - start_cpu) / IDLE_SECONDS * 100
+
+        channel.latencies.clear()
+        for i in range(PROBE_COUNT):
+            time.sleep(random.uniform(0, 0.01))
+            channel.produce(new_context(f"probe-{session_count}-{i}"))
+        for _ in range(PROBE_COUNT):
+            channel.done.acquire()
+        latencies = sorted(channel.latencies)
+    finally:
+        unpark_sessions(channel, parked)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    return p50, p99, idle_cpu
+
+
+def main():
+    results = []
+    polling = PollingChannel()
+    for count in SESSION_COUNTS:
+        results.append(("polling", count) + measure(polling, count))
+    polling.running = False
+
+    event_driven = EventDrivenChannel()
+    for count in SESSION_COUNTS:
+        results.append(("event", count) + measure(event_driven, count))
+
+    print(f"{'scheduler':<10}{'sessions':>10}{'p50(ms)':>12}{'p99(ms)':>12}{'idle cpu(%)':>14}")
+    for name, count, p50, p99, idle_cpu in results:
+        print(f"{name:<10}{count:>10}{p50:>12.2f}{p99:>12.2f}{idle_cpu:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
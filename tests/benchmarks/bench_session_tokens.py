@@ -0,0 +1,78 @@
+"""
+对比 ChatGPTSession.discard_exceeding 每次删除消息后全量重算token与增量计数的耗时
+
+运行方式（项目根目录下）:
+    python -m tests.benchmarks.bench_session_tokens
+
+场景: 构造包含 N 条历史消息的会话，追加一轮问答后裁剪到 conversation_max_tokens，
+与线上每轮 session_query / session_reply 各裁剪一次的调用方式一致
+安装了tiktoken时按gpt-3.5-turbo计算，否则按字符计算
+"""
+import time
+
+from bot.chatgpt.chat_gpt_session import ChatGPTSession, num_tokens_from_messages
+
+MESSAGE_COUNTS = [50, 200, 1000]
+ROUNDS = 20
+MAX_TOKENS = 1000
+
+try:
+    import tiktoken  # noqa: F401
+
+    MODEL = "gpt-3.5-turbo"
+except ImportError:
+    MODEL = "xunfei"
+
+
+class LegacySession(ChatGPTSession):
+    """改造前的实现，每删除一条消息都重新编码全部消息"""
+
+    def discard_exceeding(self, max_tokens, cur_tokens=None):
+        cur_tokens = self.calc_tokens()
+        while cur_tokens > max_tokens:
+            if len(self.messages) > 2:
+                self.messages.pop(1)
+            else:
+                break
+            cur_tokens = self.calc_tokens()
+        return cur_tokens
+
+    def calc_tokens(self):
+        return num_tokens_from_messages(self.messages, self.model)
+
+
+def build_session(cls, count):
+    session = cls("bench", system_prompt="你是一个乐于助人的助手。", model=MODEL)
+    for i in range(count // 2):
+        session.add_query(f"第{i}个问题：今天的天气怎么样，适合出门吗？")
+        session.add_reply(f"第{i}个回答：今天晴转多云，气温适宜，适合出门散步。")
+    return session
+
+
+def bench(cls, count):
+    """返回首次裁剪N条历史的耗时和之后每轮裁剪的平均耗时(ms)"""
+    session = build_session(cls, count)
+    start = time.perf_counter()
+    session.discard_exceeding(MAX_TOKENS)
+    first_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        session.add_query(f"追加问题{i}：明天呢？")
+        session.discard_exceeding(MAX_TOKENS)
+        session.add_reply(f"追加回答{i}：明天有小雨，记得带伞。")
+        session.discard_exceeding(MAX_TOKENS)
+    round_ms = (time.perf_counter() - start) * 1000 / ROUNDS
+    return first_ms, round_ms
+
+
+def main():
+    print(f"model={MODEL}, max_tokens={MAX_TOKENS}")
+    print(f"{'impl':<8}{'messages':>10}{'first trim(ms)':>16}{'per round(ms)':>16}")
+    for count in MESSAGE_COUNTS:
+        for name, cls in (("legacy", LegacySession), ("new", ChatGPTSession)):
+            first_ms, round_ms = bench(cls, count)
+            print(f"{name:<8}{count:>10}{first_ms:>16.2f}{round_ms:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
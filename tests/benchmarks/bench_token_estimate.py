@@ -0,0 +1,139 @@
+"""
+对比按字符类别估算token数与tiktoken精确计数的误差和耗时
+
+运行方式（项目根目录下，需要安装tiktoken）:
+    python -m tests.benchmarks.bench_token_estimate
+
+语料为中文、英文、中英混合的群聊消息(含表情、数字、链接、代码)，
+分别统计单条消息的估算误差(平均/最大相对误差、偏差)和整段语料的总误差，
+以及估算与tiktoken编码的耗时、会话每轮统计token数的耗时
+"""
+import statistics
+import time
+
+from bot.chatgpt.chat_gpt_session import ChatGPTSession, estimate_text_tokens, get_token_encoding
+
+MODEL = "gpt-3.5-turbo"
+SESSION_MESSAGES = [50, 200, 1000]
+
+CORPUS = {
+    "中文": [
+        "大家好，今天下午三点开会，记得带上周报。",
+        "这个问题我也遇到过，重启一下路由器就好了",
+        "哈哈哈哈哈哈笑死我了",
+        "请问有人知道附近哪里有好吃的川菜馆吗？最好人均一百以内的。",
+        "收到，我明天上午把合同发给你，有问题再联系。",
+        "你是一个乐于助人的助手，请用简洁的中文回答用户的问题，不要编造事实，不知道的时候直接说不知道。",
+        "今天的天气晴转多云，最高气温二十八度，最低气温十九度，东南风三到四级，适合户外活动，但紫外线较强，出门请注意防晒。",
+        "《三体》第二部《黑暗森林》讲述了面壁计划和罗辑如何建立黑暗森林威慑的故事。",
+        "好的👌",
+        "群里有没有做跨境电商的朋友？想请教一下物流和清关方面的问题，目前我们主要发欧洲，时效太慢了。",
+        "根据您提供的信息，建议先检查网络连接是否正常，然后清除浏览器缓存，再重新登录账号尝试。如果问题依然存在，请联系客服并提供错误截图。",
+        "周末一起去爬山吗？早上七点在地铁站集合。",
+        "老师，作业第三题的第二小问怎么做呀，我算出来的答案和书后面的不一样。",
+        "机器学习中，过拟合是指模型在训练集上表现很好，但在测试集上表现较差的现象，常见的解决方法有正则化、数据增强和提前停止。",
+        "恭喜发财，红包拿来！🧧🧧",
+        "嗯嗯",
+        "我觉得这个方案可行，但是预算方面需要再和财务确认一下，另外时间节点也要再细化。",
+        "床前明月光，疑是地上霜。举头望明月，低头思故乡。",
+    ],
+    "英文": [
+        "Hi everyone, the meeting is moved to 3pm today.",
+        "Can someone share the link to the design doc?",
+        "lol that's hilarious",
+        "You are a helpful assistant. Answer the user's questions concisely and do not make things up.",
+        "The quick brown fox jumps over the lazy dog.",
+        "I think we should refactor the authentication module before adding new features, otherwise the technical debt will keep growing.",
+        "Thanks! 🙏",
+        "Overfitting happens when a model performs well on the training data but poorly on unseen data. Regularization, data augmentation and early stopping are common remedies.",
+        "Does anyone know a good place for dinner near the station?",
+        "Please check your network connection, clear the browser cache and try logging in again.",
+        "ok",
+        "Internationalization and localization are often abbreviated as i18n and l10n respectively.",
+    ],
+    "中英混合": [
+        "用Python写一个快速排序，要求时间复杂度O(n log n)",
+        "我的iPhone 15 Pro升级到iOS 18以后电池掉电好快",
+        "请把这段话翻译成英文：我们下周二上线新版本。",
+        "Dify的workflow里怎么调用HTTP请求节点？",
+        "报错信息是 ConnectionError: HTTPSConnectionPool(host='api.openai.com', port=443): Read timed out.",
+        "链接在这里 https://github.com/hanfangyuan4396/dify-on-wechat 记得点个star⭐",
+        "def quick_sort(arr):\n    if len(arr) <= 1:\n        return arr\n    pivot = arr[len(arr) // 2]\n    return quick_sort([x for x in arr if x < pivot]) + [pivot] + quick_sort([x for x in arr if x > pivot])",
+        "订单号20240518123456789已发货，预计3-5个工作日送达，快递单号SF1234567890。",
+        "今天GPT-4o的API价格是多少？每百万token输入5美元吗",
+        "会议时间：2024年5月20日 14:00-15:30\n地点：3楼会议室A\n议题：Q2 OKR复盘",
+        "这个bug是因为没有处理None的情况，加个判断就行了 if value is None: return",
+        "我在用ChatGPT写周报，效率提升了不少👍",
+    ],
+}
+
+
+def relative_errors(texts, encoding):
+    errors = []
+    for text in texts:
+        exact = len(encoding.encode(text))
+        estimate = estimate_text_tokens(text)
+        errors.append((estimate - exact) / exact)
+    return errors
+
+
+def bench_accuracy(encoding):
+    print(f"{'corpus':<10}{'texts':>6}{'mean |err|':>12}{'max |err|':>12}{'bias':>10}{'total err':>12}")
+    all_texts = []
+    for name, texts in CORPUS.items():
+        all_texts.extend(texts)
+        errors = relative_errors(texts, encoding)
+        exact = sum(len(encoding.encode(text)) for text in texts)
+        estimate = sum(estimate_text_tokens(text) for text in texts)
+        print(f"{name:<10}{len(texts):>6}{statistics.mean(map(abs, errors)):>12.1%}{max(map(abs, errors)):>12.1%}"
+              f"{statistics.mean(errors):>+10.1%}{(estimate - exact) / exact:>+12.1%}")
+    errors = relative_errors(all_texts, encoding)
+    print(f"{'all':<10}{len(all_texts):>6}{statistics.mean(map(abs, errors)):>12.1%}{max(map(abs, errors)):>12.1%}"
+          f"{statistics.mean(errors):>+10.1%}")
+
+
+def bench_speed(encoding):
+    texts = [text for texts in CORPUS.values() for text in texts]
+    print(f"{'messages':>10}{'tiktoken(ms)':>14}{'estimate(ms)':>14}{'speedup':>10}")
+    for count in SESSION_MESSAGES:
+        messages = [texts[i % len(texts)] for i in range(count)]
+        start = time.perf_counter()
+        for text in messages:
+            encoding.encode(text)
+        exact_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for text in messages:
+            estimate_text_tokens(text)
+        estimate_ms = (time.perf_counter() - start) * 1000
+        print(f"{count:>10}{exact_ms:>14.2f}{estimate_ms:>14.2f}{exact_ms / estimate_ms:>9.1f}x")
+
+
+def bench_session(count):
+    """每轮追加一条消息后统计会话token数的耗时(ms)：精确计数需要编码新消息，估算值远低于上限时不需要编码"""
+    texts = [text for texts in CORPUS.values() for text in texts]
+    results = []
+    for count_tokens in (ChatGPTSession.calc_tokens, lambda session: session.count_tokens(10 ** 9)):
+        session = ChatGPTSession("bench", system_prompt="你是一个乐于助人的助手。", model=MODEL)
+        start = time.perf_counter()
+        for i in range(count):
+            session.add_query(texts[i % len(texts)])
+            count_tokens(session)
+        results.append((time.perf_counter() - start) * 1000 / count)
+    return results
+
+
+def main():
+    encoding = get_token_encoding(MODEL)[0]
+    print(f"model={MODEL}, encoding={encoding.name}")
+    bench_accuracy(encoding)
+    print()
+    bench_speed(encoding)
+    print()
+    print(f"{'turns':>10}{'exact(ms/turn)':>16}{'estimate(ms/turn)':>19}")
+    for count in SESSION_MESSAGES:
+        exact_ms, estimate_ms = bench_session(count)
+        print(f"{count:>10}{exact_ms:>16.4f}{estimate_ms:>19.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import threading
+import time
+import unittest
+
+from common.bulkhead import Bulkhead
+
+
+class TestBulkhead(unittest.TestCase):
+    def test_submit_result(self):
+        """测试提交任务并获取结果和异常"""
+        pool = Bulkhead("test", 2)
+        self.assertEqual(pool.submit(lambda x: x * 2, 21).result(timeout=1), 42)
+        future = pool.submit(lambda: 1 / 0)
+        self.assertIsInstance(future.exception(timeout=1), ZeroDivisionError)
+        pool.shutdown()
+
+    def test_max_workers_and_queue_depth(self):
+        """测试并发数不超过上限，超出的任务排队并计入饱和次数"""
+        pool = Bulkhead("test", 2)
+        gate = threading.Event()
+        futures = [pool.submit(gate.wait) for _ in range(5)]
+        time.sleep(0.1)
+        stats = pool.stats()
+        self.assertEqual(stats["busy"], 2)
+        self.assertEqual(stats["queue_depth"], 3)
+        self.assertEqual(stats["saturated"], 3)
+        gate.set()
+        for future in futures:
+            future.result(timeout=1)
+        self.assertEqual(pool.stats()["completed"], 5)
+        pool.shutdown()
+
+    def test_resize(self):
+        """测试运行时扩容和缩容"""
+        pool = Bulkhead("test", 1)
+        gate = threading.Event()
+        futures = [pool.submit(gate.wait) for _ in range(3)]
+        time.sleep(0.1)
+        self.assertEqual(pool.stats()["busy"], 1)
+        pool.resize(3)
+        time.sleep(0.1)
+        self.assertEqual(pool.stats()["busy"], 3)
+        gate.set()
+        for future in futures:
+            future.result(timeout=1)
+        pool.resize(1)
+        time.sleep(0.1)
+        self.assertEqual(pool.stats()["workers"], 1)
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
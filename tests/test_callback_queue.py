@@ -0,0 +1,65 @@
+import threading
+import time
+import unittest
+
+from channel.callback_queue import CallbackQueue
+
+
+class TestCallbackQueue(unittest.TestCase):
+    def test_order_within_shard(self):
+        """测试同一个会话的消息按接收顺序处理"""
+        handled = []
+        done = threading.Event()
+
+        def handler(payload):
+            time.sleep(0.001)
+            handled.append(payload)
+            if len(handled) == 20:
+                done.set()
+
+        q = CallbackQueue("test", handler, workers=4)
+        for i in range(20):
+            q.put(("a" if i % 2 else "b", i), shard_key="a" if i % 2 else "b")
+        self.assertTrue(done.wait(2))
+        for key in ("a", "b"):
+            seq = [i for k, i in handled if k == key]
+            self.assertEqual(seq, sorted(seq))
+
+    def test_dedupe(self):
+        """测试重复推送的消息只处理一次"""
+        handled = []
+        q = CallbackQueue("test", handled.append, workers=1)
+        self.assertTrue(q.put("m1", dedupe_key=1))
+        self.assertFalse(q.put("m1", dedupe_key=1))
+        time.sleep(0.1)
+        self.assertEqual(handled, ["m1"])
+        self.assertEqual(q.stats()["duplicated"], 1)
+
+    def test_drop_when_full(self):
+        """测试队列已满时丢弃消息并计数，handler异常不影响后续消息"""
+        gate = threading.Event()
+        handled = []
+
+        def handler(payload):
+            gate.wait()
+            if payload == "bad":
+                raise ValueError(payload)
+            handled.append(payload)
+
+        q = CallbackQueue("test", handler, workers=1, max_size=1, put_timeout=0.05)
+        q.put("bad")
+        time.sleep(0.05)  # 第一条已被线程取出，阻塞在handler中
+        self.assertTrue(q.put("m2", dedupe_key=2))
+        self.assertFalse(q.put("m3", dedupe_key=3))
+        gate.set()
+        time.sleep(0.1)
+        stats = q.stats()
+        self.assertEqual(stats["dropped"], 1)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(handled, ["m2"])
+        # 被丢弃的消息可以再次推送
+        self.assertTrue(q.put("m3", dedupe_key=3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+
+from bridge.context import Context, ContextType
+from channel.chat_channel import ChatChannel
+from config import conf
+
+
+class RecordingChannel(ChatChannel):
+    def __init__(self):
+        # 每个实例使用独立的调度状态，避免测试之间通过类属性互相影响
+        self.futures = {}
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.ready_sessions = {}
+        self.ready_cond = threading.Condition(self.lock)
+        self.handled = []
+        self.running = 0
+        self.max_running = 0
+        self.counter_lock = threading.Lock()
+        self.gate = threading.Event()  # 清除后处理线程阻塞，用于确定地观察并发数
+        self.gate.set()
+        super().__init__()
+
+    def _handle(self, context: Context):
+        with self.counter_lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.gate.wait(5)
+        time.sleep(0.01)
+        with self.counter_lock:
+            self.running -= 1
+            self.handled.append(context.content)
+
+
+def new_context(session_id, content):
+    context = Context(ContextType.TEXT, content, kwargs=dict())
+    context["session_id"] = session_id
+    return context
+
+
+class TestSessionScheduler(unittest.TestCase):
+    def wait_for(self, predicate, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if predicate():
+                return True
+            time.sleep(0.01)
+        return False
+
+    def test_session_order_and_cleanup(self):
+        """测试同一会话内按顺序处理，处理完毕后会话被清理"""
+        conf()["concurrency_in_session"] = 1
+        channel = RecordingChannel()
+        for i in range(5):
+            channel.produce(new_context("s1", str(i)))
+        self.assertTrue(self.wait_for(lambda: len(channel.handled) == 5))
+        self.assertEqual(channel.handled, ["0", "1", "2", "3", "4"])
+        self.assertEqual(channel.max_running, 1)
+        self.assertTrue(self.wait_for(lambda: "s1" not in channel.sessions))
+
+    def test_concurrency_in_session(self):
+        """测试同一会话并发数不超过concurrency_in_session，不同会话互不阻塞"""
+        conf()["concurrency_in_session"] = 2
+        try:
+            channel = RecordingChannel()
+            channel.gate.clear()
+            for i in range(6):
+                channel.produce(new_context("s2", str(i)))
+            channel.produce(new_context("s3", "x"))
+            # s2的两条消息和s3的消息同时处理，s2的其余消息等待
+            self.assertTrue(self.wait_for(lambda: channel.running == 3))
+            time.sleep(0.05)
+            self.assertEqual(channel.running, 3)
+            channel.gate.set()
+            self.assertTrue(self.wait_for(lambda: len(channel.handled) == 7))
+            self.assertEqual(channel.max_running, 3)
+        finally:
+            conf()["concurrency_in_session"] = 1
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from unittest import mock
+
+from bot.chatgpt import chat_gpt_session
+from bot.chatgpt.chat_gpt_session import ChatGPTSession, estimate_text_tokens, num_tokens_from_messages
+
+
+class FakeEncoding:
+    """按字符编码，记录编码过的文本"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text):
+        self.encoded.append(text)
+        return list(text)
+
+
+class TestChatGPTSessionTokens(unittest.TestCase):
+    def setUp(self):
+        self.counted = []
+        real = chat_gpt_session.estimate_message_tokens
+
+        def counting(message, model):
+            self.counted.append(message["content"])
+            return real(message, model)
+
+        patcher = mock.patch.object(chat_gpt_session, "estimate_message_tokens", side_effect=counting)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _session(self, turns, model="xunfei"):
+        session = ChatGPTSession("s1", system_prompt="sys", model=model)
+        for i in range(turns):
+            session.add_query(f"q{i:03d}")
+            session.add_reply(f"a{i:03d}")
+        return session
+
+    def test_each_message_counted_once(self):
+        """测试裁剪时每条消息只计算一次token，结果与完整重算一致"""
+        session = self._session(50)
+        total = session.discard_exceeding(100)
+        self.assertEqual(len(self.counted), 101)
+        self.assertLessEqual(total, 100)
+        self.assertEqual(total, num_tokens_from_messages(session.messages, "xunfei"))
+        self.counted.clear()
+        session.add_query("next")
+        self.assertEqual(session.discard_exceeding(100), num_tokens_from_messages(session.messages, "xunfei"))
+        self.assertEqual(self.counted[0], "next")
+
+    def test_resync_after_external_change(self):
+        """测试消息列表被外部修改或重置后，token总数仍然正确"""
+        session = self._session(3)
+        session.calc_tokens()
+        session.messages.pop(0)  # 如claude去掉system消息
+        self.counted.clear()
+        total = session.calc_tokens()
+        self.assertEqual(self.counted, [])
+        self.assertEqual(total, num_tokens_from_messages(session.messages, "xunfei"))
+        session.set_system_prompt("new prompt")
+        self.assertEqual(session.calc_tokens(), estimate_text_tokens("new prompt"))
+
+    def test_exact_only_near_limit(self):
+        """测试估算值远低于上限时不编码，接近上限时才精确计算并按精确值裁剪"""
+        encoding = FakeEncoding()
+        with mock.patch.object(chat_gpt_session, "get_token_encoding", return_value=(encoding, 4, -1)):
+            session = self._session(10, model="gpt-3.5-turbo")
+            estimated = session.discard_exceeding(1000)
+            self.assertEqual(estimated, session.estimate_tokens())
+            self.assertEqual(encoding.encoded, [])
+            total = session.discard_exceeding(estimated + 1)  # 在误差范围内，需要精确计算
+            self.assertEqual(len(encoding.encoded), 42)
+            self.assertLessEqual(total, estimated + 1)
+            self.assertEqual(total, num_tokens_from_messages(session.messages, "gpt-3.5-turbo"))
+
+    def test_estimate_without_tiktoken(self):
+        """测试没有安装tiktoken时按估算值裁剪"""
+        with mock.patch.object(chat_gpt_session, "get_token_encoding", side_effect=ImportError("tiktoken")):
+            session = self._session(20, model="gpt-3.5-turbo")
+            total = session.discard_exceeding(50)
+            self.assertLessEqual(total, 50)
+            self.assertEqual(total, session.estimate_tokens())
+
+    def test_estimate_text_tokens(self):
+        """测试按汉字和ASCII字符分别估算"""
+        self.assertEqual(estimate_text_tokens(""), 0)
+        self.assertEqual(estimate_text_tokens("你好"), 3)
+        self.assertEqual(estimate_text_tokens("hello world"), 3)
+        self.assertEqual(estimate_text_tokens("你好 world"), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import tempfile
+import time
+import unittest
+
+import requests
+
+from bot.bot import Bot
+from bridge.bridge import Bridge
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from common import runtime_stats
+from common.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, report_failure
+from config import conf
+
+
+class FailingBot(Bot):
+    def __init__(self):
+        self.calls = 0
+        self.down = True
+
+    def reply(self, query, context=None):
+        self.calls += 1
+        if self.down:
+            report_failure()
+            return Reply(ReplyType.TEXT, "后端错误")
+        return Reply(ReplyType.TEXT, "ok")
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def _call(self, breaker, fail):
+        if not breaker.acquire():
+            return False
+        try:
+            if fail:
+                report_failure()
+        finally:
+            breaker.release()
+        return True
+
+    def test_open_and_recover(self):
+        """测试连续失败后打开，恢复期只放行探测请求，探测成功后关闭"""
+        breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=0.2)
+        self._call(breaker, fail=True)
+        self._call(breaker, fail=False)  # 成功后重新计数
+        for _ in range(3):
+            self._call(breaker, fail=True)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(self._call(breaker, fail=False))
+        time.sleep(0.25)
+        self.assertTrue(breaker.acquire())  # 探测请求
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.acquire())  # 探测期间其他请求快速失败
+        breaker.release()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.stats()["rejected"], 2)
+
+    def test_probe_failure_reopens(self):
+        """测试探测请求失败时重新打开"""
+        breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0.1)
+        self._call(breaker, fail=True)
+        time.sleep(0.15)
+        self.assertTrue(self._call(breaker, fail=True))
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.stats()["trips"], 2)
+
+    def test_retries_count_once(self):
+        """测试一次调用中多次重试失败只计一次失败，之后仍返回熔断器是否打开"""
+        breaker = CircuitBreaker("test", failure_threshold=2)
+        self.assertTrue(breaker.acquire())
+        self.assertEqual([report_failure() for _ in range(3)], [False] * 3)
+        breaker.release()
+        self.assertEqual(breaker.stats()["failures"], 1)
+        self.assertTrue(breaker.acquire())
+        self.assertEqual([report_failure() for _ in range(2)], [True] * 2)
+        breaker.release()
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_report_outside_call(self):
+        """测试不在熔断调用中上报失败时不做处理"""
+        self.assertFalse(report_failure())
+
+
+class TestBridgeCircuitBreaker(unittest.TestCase):
+    KEYS = ("circuit_breaker_enabled", "circuit_breaker_failure_threshold", "error_reply", "appdata_dir")
+
+    def setUp(self):
+        self.saved = {k: conf()[k] for k in self.KEYS if k in conf()}
+        conf()["circuit_breaker_enabled"] = True
+        conf()["circuit_breaker_failure_threshold"] = 2
+        conf()["error_reply"] = "服务繁忙"
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        conf()["appdata_dir"] = self.tmp_dir.name
+        self.bridge = Bridge()
+        self.bridge.breakers.clear()
+        self.bot = FailingBot()
+        self.saved_bot = self.bridge.bots.get("chat")
+        self.bridge.bots["chat"] = self.bot
+
+    def tearDown(self):
+        for k in self.KEYS:
+            if k in self.saved:
+                conf()[k] = self.saved[k]
+            else:
+                conf().pop(k, None)
+        self.bridge.bots["chat"] = self.saved_bot
+        self.bridge.breakers.clear()
+        self.tmp_dir.cleanup()
+
+    def _ask(self):
+        context = Context(ContextType.TEXT, "hi", kwargs=dict(session_id="s1"))
+        return self.bridge.fetch_reply_content("hi", context).content
+
+    def test_fail_fast_when_open(self):
+        """测试熔断后不再调用bot，直接回复error_reply，状态可供管理后台读取"""
+        self._ask()
+        self._ask()
+        self.assertEqual(self._ask(), "服务繁忙")
+        self.assertEqual(self.bot.calls, 2)
+        runtime_stats.write()
+        breakers = runtime_stats.load()["circuit_breakers"]
+        self.assertEqual(breakers[0]["state"], OPEN)
+        self.assertEqual(breakers[0]["rejected"], 1)
+
+    def test_exception_counts_as_failure(self):
+        """测试bot抛出网络异常时记为失败，本地代码的异常不触发熔断"""
+        self.bot.reply = lambda query, context=None: 1 / 0
+        for _ in range(3):
+            with self.assertRaises(ZeroDivisionError):
+                self._ask()
+        self.assertEqual(self.bridge.get_breaker_stats()[0]["state"], CLOSED)
+
+        def timeout(query, context=None):
+            raise requests.ConnectTimeout("timeout")
+
+        self.bot.reply = timeout
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectTimeout):
+                self._ask()
+        self.assertEqual(self._ask(), "服务繁忙")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import threading
+import time
+import unittest
+
+from common.concurrency_limiter import AdaptiveLimiter, report_overload
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    def test_additive_increase(self):
+        """测试并发用满且请求正常返回时上限缓慢增加"""
+        limiter = AdaptiveLimiter("test", initial_limit=2, max_limit=4)
+        for _ in range(10):
+            self.assertTrue(limiter.acquire())
+            self.assertTrue(limiter.acquire())
+            limiter.release()
+            limiter.release()
+        self.assertGreater(limiter.limit, 2)
+        self.assertLessEqual(limiter.limit, 4)
+
+    def test_multiplicative_decrease(self):
+        """测试后端过载时上限减半，同一窗口内只减小一次"""
+        limiter = AdaptiveLimiter("test", initial_limit=8)
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        report_overload()
+        limiter.release()
+        report_overload()
+        limiter.release()
+        self.assertEqual(limiter.stats()["limit"], 4)
+        self.assertEqual(limiter.stats()["overloaded"], 2)
+
+    def test_report_overload_without_limiter(self):
+        """测试不在限流调用中时report_overload不报错"""
+        report_overload()
+
+    def test_bounded_queue(self):
+        """测试超过上限的请求排队，队列满或超时的请求被拒绝"""
+        limiter = AdaptiveLimiter("test", initial_limit=1, max_queue=1, queue_timeout=0.2)
+        self.assertTrue(limiter.acquire())
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+        waiter.start()
+        time.sleep(0.05)
+        self.assertEqual(limiter.stats()["queue_depth"], 1)
+        self.assertFalse(limiter.acquire())  # 队列已满
+        waiter.join()
+        self.assertEqual(results, [False])  # 等待超时
+        self.assertEqual(limiter.stats()["rejected"], 2)
+        limiter.release()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+from lib.gewechat.contact_cache import ContactCache
+
+
+class FakeClient:
+    """记录调用次数的gewechat客户端"""
+
+    def __init__(self):
+        self.brief_calls = []
+        self.member_calls = []
+        self.nicknames = {"wxid_a": "A", "wxid_b": "B"}
+        self.members = [
+            {"wxid": "wxid_a", "nickName": "A", "displayName": None},
+            {"wxid": "wxid_b", "nickName": "B", "displayName": "B1"},
+        ]
+
+    def get_brief_info(self, app_id, wxids):
+        self.brief_calls.append(list(wxids))
+        data = [{"userName": wxid, "nickName": self.nicknames[wxid]} for wxid in wxids if wxid in self.nicknames]
+        return {"ret": 200, "data": data}
+
+    def get_chatroom_member_list(self, app_id, chatroom_id):
+        self.member_calls.append(chatroom_id)
+        return {"ret": 200, "data": {"memberList": list(self.members)}}
+
+
+class TestContactCache(unittest.TestCase):
+    def test_nickname_cached(self):
+        """测试好友昵称只在首次查询时请求接口"""
+        client = FakeClient()
+        cache = ContactCache(client)
+        self.assertEqual(cache.get_nickname("app", "wxid_a"), "A")
+        self.assertEqual(cache.get_nickname("app", "wxid_a"), "A")
+        self.assertEqual(len(client.brief_calls), 1)
+
+    def test_member_nickname_indexed(self):
+        """测试群成员列表只拉取一次，优先返回群昵称"""
+        client = FakeClient()
+        cache = ContactCache(client)
+        self.assertEqual(cache.get_member_nickname("app", "1@chatroom", "wxid_a"), "A")
+        self.assertEqual(cache.get_member_nickname("app", "1@chatroom", "wxid_b"), "B1")
+        self.assertIsNone(cache.get_member_nickname("app", "1@chatroom", "wxid_new"))
+        self.assertEqual(client.member_calls, ["1@chatroom"])
+
+    def test_mod_contacts_callback(self):
+        """测试ModContacts回调直接更新昵称，DelContacts回调使缓存失效"""
+        client = FakeClient()
+        cache = ContactCache(client)
+        cache.get_nickname("app", "wxid_a")
+        cache.handle_callback({"TypeName": "ModContacts", "Data": {"UserName": {"string": "wxid_a"}, "NickName": {"string": "A2"}}})
+        self.assertEqual(cache.get_nickname("app", "wxid_a"), "A2")
+        cache.handle_callback({"TypeName": "DelContacts", "Data": {"UserName": {"string": "wxid_a"}}})
+        self.assertEqual(cache.get_nickname("app", "wxid_a"), "A")
+        self.assertEqual(len(client.brief_calls), 2)
+
+    def test_chatroom_invalidated(self):
+        """测试群信息变更后重新拉取成员列表"""
+        client = FakeClient()
+        cache = ContactCache(client)
+        cache.get_member_nickname("app", "1@chatroom", "wxid_a")
+        client.members.append({"wxid": "wxid_c", "nickName": "C", "displayName": ""})
+        cache.handle_callback({"TypeName": "ModContacts", "Data": {"UserName": {"string": "1@chatroom"}}})
+        self.assertEqual(cache.get_member_nickname("app", "1@chatroom", "wxid_c"), "C")
+        self.assertEqual(len(client.member_calls), 2)
+
+    def test_bulk_refresh(self):
+        """测试后台刷新时批量查询即将过期的联系人"""
+        client = FakeClient()
+        cache = ContactCache(client, ttl=100)
+        cache.get_nickname("app", "wxid_a")
+        cache.get_nickname("app", "wxid_b")
+        for entry in cache._contacts.values():
+            entry["fetched_at"] -= 60
+        cache._refresh("app")
+        self.assertEqual(client.brief_calls[-1], ["wxid_a", "wxid_b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
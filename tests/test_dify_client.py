@@ -0,0 +1,64 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lib.dify.dify_client import ClientRegistry
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append((self.client_address, self.headers.get("Authorization")))
+        body = json.dumps({"answer": "ok"}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestClientRegistry(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_base = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self.registry = ClientRegistry(pool_size=2, timeout=(5, 5))
+
+    def tearDown(self):
+        self.registry.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_client_per_app(self):
+        """测试相同应用复用同一个客户端，不同api_key使用不同的客户端"""
+        client = self.registry.get("app-1", self.api_base)
+        self.assertIs(self.registry.get("app-1", self.api_base), client)
+        self.assertIsNot(self.registry.get("app-2", self.api_base), client)
+
+    def test_connection_reused_and_stats(self):
+        """测试同一应用的请求复用连接，并统计连接数和请求数"""
+        client = self.registry.get("app-1234", self.api_base)
+        for _ in range(3):
+            response = client.create_chat_message(inputs={}, query="hi", user="u")
+            self.assertEqual(response.json()["answer"], "ok")
+        client._send_request("POST", "/workflows/run", json={})
+        self.assertEqual(len({address for address, _ in self.server.requests}), 1)
+        self.assertEqual(self.server.requests[0][1], "Bearer app-1234")
+        stats = self.registry.stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]["api_key"], "...1234")
+        self.assertEqual(stats[0]["connections"], 1)
+        self.assertEqual(stats[0]["requests"], 4)
+        self.assertEqual(stats[0]["idle"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
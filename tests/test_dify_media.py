@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bot.dify.dify_bot import DifyBot
+from bridge.context import Context, ContextType
+from bridge.reply import ReplyType
+from common.utils import parse_markdown_text
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(0.3)
+        body = self.path.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RecordingChannel:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reply, context):
+        self.sent.append(reply)
+
+
+class TestDifyMediaPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_parallel_download_in_order(self):
+        """测试回答中的图片和文件并发下载，并按文档顺序发送"""
+        bot = DifyBot()
+        channel = RecordingChannel()
+        context = Context(ContextType.TEXT, "hi", kwargs=dict())
+        context["channel"] = channel
+        answer = (f"图1 ![a]({self.base}/a.png) 图2 ![b]({self.base}/b.png) "
+                  f"文件 [c]({self.base}/c.txt) 结尾")
+        start = time.monotonic()
+        reply = bot._send_parsed_content(parse_markdown_text(answer), context)
+        elapsed = time.monotonic() - start
+        self.assertLess(elapsed, 0.8)  # 串行下载需要0.9秒以上
+        types = [r.type for r in channel.sent]
+        self.assertEqual(types, [ReplyType.TEXT, ReplyType.IMAGE, ReplyType.TEXT, ReplyType.IMAGE, ReplyType.TEXT, ReplyType.FILE])
+        self.assertEqual(channel.sent[1].content.read(), b"/a.png")
+        self.assertEqual(channel.sent[3].content.read(), b"/b.png")
+        with open(channel.sent[5].content, "rb") as f:
+            self.assertEqual(f.read(), b"/c.txt")
+        self.assertEqual(reply.content, "结尾")
+        os.remove(channel.sent[5].content)
+
+
+if __name__ == "__main__":
+    unittest.main()
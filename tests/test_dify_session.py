@@ -0,0 +1,106 @@
+import unittest
+from types import SimpleNamespace
+
+from bot.dify.dify_bot import DifyBot
+from bot.dify.dify_session import DifySession
+from bridge.context import Context, ContextType
+from config import conf
+
+
+class TestDifySessionRollover(unittest.TestCase):
+    KEYS = ("dify_conversation_max_messages", "dify_conversation_rollover", "dify_conversation_rollover_turns",
+            "dify_conversation_rollover_max_chars", "dify_conversation_rollover_input")
+
+    def setUp(self):
+        self.saved = {k: conf()[k] for k in self.KEYS if k in conf()}
+        conf()["dify_conversation_max_messages"] = 2
+        conf()["dify_conversation_rollover"] = True
+        conf()["dify_conversation_rollover_turns"] = 2
+        conf()["dify_conversation_rollover_max_chars"] = 2000
+        conf()["dify_conversation_rollover_input"] = ""
+        self.bot = DifyBot()
+
+    def tearDown(self):
+        for k in self.KEYS:
+            if k in self.saved:
+                conf()[k] = self.saved[k]
+            else:
+                conf().pop(k, None)
+
+    def _chat(self, session, query, answer):
+        session.count_user_message()
+        session.record_message("user", query)
+        payload = self.bot._get_payload(query, session, "blocking")
+        session.record_message("assistant", answer)
+        session.set_conversation_id("conv-" + query)
+        return payload
+
+    def test_rollover_carries_recent_turns(self):
+        """测试超过最大消息数时开启新会话，并携带最近几轮问答"""
+        conf()["dify_conversation_rollover_turns"] = 1
+        session = DifySession("s1", "alice")
+        self._chat(session, "q1", "a1")
+        self._chat(session, "q2", "a2")
+        payload = self._chat(session, "q3", "a3")  # 上一会话已有2条消息，开启新会话
+        self.assertEqual(payload["conversation_id"], "")
+        self.assertIn("用户：q2\n助手：a2", payload["query"])
+        self.assertNotIn("q1", payload["query"])
+        self.assertTrue(payload["query"].endswith("q3"))
+        payload = self._chat(session, "q4", "a4")  # 新会话已建立，不再携带
+        self.assertEqual(payload["query"], "q4")
+
+    def test_rollover_input_and_max_chars(self):
+        """测试通过输入变量传递上文，超过长度上限时丢弃更早的内容"""
+        conf()["dify_conversation_rollover_input"] = "history"
+        conf()["dify_conversation_rollover_max_chars"] = 12
+        session = DifySession("s1", "alice")
+        for i in range(3):
+            payload = self._chat(session, f"q{i}", "回答" * 3)
+        self.assertEqual(payload["query"], "q2")
+        self.assertEqual(payload["inputs"]["history"], "助手：回答回答回答")
+
+    def test_hard_reset_when_disabled(self):
+        """测试未开启滚动模式时直接清空会话"""
+        conf()["dify_conversation_rollover"] = False
+        session = DifySession("s1", "alice")
+        for i in range(3):
+            payload = self._chat(session, f"q{i}", "a")
+        self.assertEqual(payload["conversation_id"], "")
+        self.assertEqual(payload["query"], "q2")
+
+
+class TestDifyReplyCacheScope(unittest.TestCase):
+    KEYS = ("dify_app_type",)
+
+    def setUp(self):
+        self.saved = {k: conf()[k] for k in self.KEYS if k in conf()}
+        self.bot = DifyBot()
+
+    def tearDown(self):
+        for k in self.KEYS:
+            if k in self.saved:
+                conf()[k] = self.saved[k]
+            else:
+                conf().pop(k, None)
+
+    def _context(self, user_id, room_id=None):
+        msg = SimpleNamespace(other_user_id=room_id or user_id, other_user_nickname=room_id or user_id,
+                              actual_user_id=user_id, actual_user_nickname=user_id)
+        return Context(ContextType.TEXT, "q", {"session_id": user_id, "msg": msg, "isgroup": room_id is not None})
+
+    def test_scope_includes_user_and_room_inputs(self):
+        """测试inputs带有用户和群聊信息的应用，不同用户或群聊的缓存作用域不同"""
+        conf()["dify_app_type"] = "chatbot"
+        scopes = [self.bot.get_reply_cache_scope(self._context(*args)) for args in [("u1",), ("u2",), ("u1", "r1"), ("u1", "r2")]]
+        self.assertEqual(len(set(scopes)), 4)
+        self.assertEqual(self.bot.get_reply_cache_scope(self._context("u1")), scopes[0])
+
+    def test_workflow_scope_shared(self):
+        """测试工作流的inputs不带用户信息，所有用户共用缓存作用域"""
+        conf()["dify_app_type"] = "workflow"
+        self.assertEqual(self.bot.get_reply_cache_scope(self._context("u1")),
+                         self.bot.get_reply_cache_scope(self._context("u2", "r1")))
+
+
+if __name__ == "__main__":
+    unittest.main()
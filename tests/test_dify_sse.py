@@ -0,0 +1,119 @@
+import json
+import unittest
+
+from bot.dify.dify_bot import DifyBot
+from bot.dify.dify_session import DifySession
+from bridge.context import Context, ContextType
+from bridge.reply import ReplyType
+from common.stream_segmenter import StreamSegmenter
+
+
+class FakeResponse:
+    """逐行返回SSE事件，并记录已经被读取的事件数"""
+
+    def __init__(self, events):
+        self.lines = [("data: " + json.dumps(event)).encode("utf-8") for event in events]
+        self.consumed = 0
+
+    def iter_lines(self):
+        for line in self.lines:
+            self.consumed += 1
+            yield line
+            yield b""
+
+
+class RecordingChannel:
+    def __init__(self, response):
+        self.response = response
+        self.sent = []
+
+    def send(self, reply, context):
+        self.sent.append((reply, self.response.consumed))
+
+
+def agent_events():
+    return [
+        {"event": "agent_thought", "conversation_id": "c1", "thought": ""},
+        {"event": "agent_message", "conversation_id": "c1", "answer": "正在"},
+        {"event": "agent_message", "conversation_id": "c1", "answer": "画图"},
+        {"event": "agent_thought", "conversation_id": "c1", "tool": "dalle3"},
+        {"event": "message_file", "conversation_id": "c1", "type": "image", "url": "https://example.com/1.png"},
+        {"event": "agent_message", "conversation_id": "c1", "answer": "画好了"},
+        {"event": "message_end", "conversation_id": "c1", "metadata": {"usage": {}}},
+    ]
+
+
+class TestDifySse(unittest.TestCase):
+    def test_iter_sse_messages(self):
+        """测试文本在agent_thought和message_file处结束，并在读取后续事件前产出"""
+        bot = DifyBot()
+        response = FakeResponse(agent_events())
+        msgs = []
+        for msg in bot._iter_sse_messages(response):
+            msgs.append((msg["type"], msg["content"] if msg["type"] == "agent_message" else msg["content"]["url"], response.consumed))
+        self.assertEqual(msgs, [
+            ("agent_message", "正在画图", 4),
+            ("message_file", "https://example.com/1.png", 5),
+            ("agent_message", "画好了", 7),
+        ])
+
+    def test_agent_deliver_while_running(self):
+        """测试agent模式在运行过程中按顺序发送消息，最后一条作为回复返回"""
+        bot = DifyBot()
+        response = FakeResponse(agent_events())
+        channel = RecordingChannel(response)
+        context = Context(ContextType.TEXT, "画一张图", kwargs=dict())
+        context["channel"] = channel
+        session = DifySession("s1", "user")
+        reply, err = bot._deliver_sse_messages(response, session, context)
+        self.assertIsNone(err)
+        self.assertEqual([(r.type, r.content, consumed) for r, consumed in channel.sent], [
+            (ReplyType.TEXT, "正在画图", 5),
+            (ReplyType.IMAGE_URL, "https://example.com/1.png", 7),
+        ])
+        self.assertEqual(reply.content, "画好了")
+        self.assertEqual(session.get_conversation_id(), "c1")
+
+    def test_workflow_stream(self):
+        """测试流式工作流逐段发送文本，结束时返回输出中的文件，进度提示立即发送"""
+        bot = DifyBot()
+        file = {"dify_model_identity": "__dify__file__", "type": "image", "url": "https://example.com/1.png"}
+        response = FakeResponse([
+            {"event": "workflow_started", "data": {"id": "w1"}},
+            {"event": "node_started", "data": {"title": "LLM"}},
+            {"event": "text_chunk", "data": {"text": "第一段。\n\n"}},
+            {"event": "text_chunk", "data": {"text": "第二段。"}},
+            {"event": "node_finished", "data": {"title": "LLM", "status": "succeeded"}},
+            {"event": "workflow_finished", "data": {"status": "succeeded", "outputs": {"text": "第一段。\n\n第二段。", "files": [file]}}},
+        ])
+        channel = RecordingChannel(response)
+        context = Context(ContextType.TEXT, "hi", kwargs=dict())
+        context["channel"] = channel
+        segmenter = StreamSegmenter(min_length=2)
+        messages = bot._iter_workflow_messages(response, segmenter, progress_interval=-1)
+        reply, err = bot._deliver_messages(messages, DifySession("s1", "user"), context, parse_markdown=True)
+        self.assertIsNone(err)
+        self.assertEqual([(r.content, consumed) for r, consumed in channel.sent], [
+            ("正在执行：LLM", 2),
+            ("第一段。", 6),
+            ("第二段。", 6),
+        ])
+        self.assertEqual((reply.type, reply.content), (ReplyType.IMAGE_URL, "https://example.com/1.png"))
+
+    def test_workflow_failed(self):
+        """测试工作流执行失败时抛出异常"""
+        bot = DifyBot()
+        response = FakeResponse([{"event": "workflow_finished", "data": {"status": "failed", "error": "boom"}}])
+        with self.assertRaises(Exception):
+            list(bot._iter_workflow_messages(response, StreamSegmenter()))
+
+    def test_error_event(self):
+        """测试收到error事件时抛出异常"""
+        bot = DifyBot()
+        response = FakeResponse([{"event": "error", "message": "boom"}])
+        with self.assertRaises(Exception):
+            list(bot._iter_sse_messages(response))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import socket
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bot.dify.dify_bot import DifyBot
+from bot.dify.dify_session import DifySession
+from bridge.context import Context, ContextType
+from lib.dify.endpoint_pool import EndpointPool
+
+
+def make_handler(status):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = b'{"ok": true}'
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def unused_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestEndpointPool(unittest.TestCase):
+    def _pool(self, strategy="least_requests", weights=(1, 1)):
+        endpoints = [{"api_base": f"http://node{i}", "api_key": "key", "weight": w} for i, w in enumerate(weights)]
+        return EndpointPool(endpoints, strategy=strategy, max_failures=2, eject_seconds=0.2)
+
+    def test_least_requests(self):
+        """测试选择进行中请求最少的节点"""
+        pool = self._pool()
+        first = pool.select()
+        pool.begin(first)
+        self.assertNotEqual(pool.select().key, first.key)
+
+    def test_weighted_round_robin(self):
+        """测试加权轮询按权重分配且不连续集中在同一个节点"""
+        pool = self._pool("round_robin", weights=(2, 1))
+        picks = [pool.select().api_base for _ in range(6)]
+        self.assertEqual(picks.count("http://node0"), 4)
+        self.assertNotEqual(picks[:2], ["http://node0", "http://node0"])
+
+    def test_sticky_and_ejection(self):
+        """测试会话固定在原节点，节点连续失败被摘除后切换，到期后恢复"""
+        pool = self._pool()
+        node0 = pool.endpoints[0]
+        pool.begin(node0)  # node0更忙，但会话固定在node0
+        self.assertIs(pool.select(preferred=node0.key), node0)
+        for _ in range(2):
+            pool.end(node0, pool.begin(node0), ok=False)
+        self.assertTrue(pool.stats()[0]["ejected"])
+        self.assertIsNot(pool.select(preferred=node0.key), node0)
+        time.sleep(0.25)
+        self.assertIs(pool.select(preferred=node0.key), node0)
+
+
+class TestDifyFailover(unittest.TestCase):
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def _server(self, status):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(status))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    def _send(self, bot, session, context):
+        return bot._send_with_failover(session, context, lambda client: client._send_request("POST", "/workflows/run", json={}))
+
+    def test_retry_on_another_endpoint(self):
+        """测试连接失败和503时换节点重试，会话固定到成功的节点"""
+        ok = self._server(200)
+        for bad in (f"http://127.0.0.1:{unused_port()}/v1", self._server(503)):
+            bot = DifyBot()
+            context = Context(ContextType.TEXT, "hi", kwargs=dict(dify_endpoints=[
+                {"api_base": bad, "api_key": "key"}, {"api_base": ok, "api_key": "key"}]))
+            session = DifySession("s1", "alice")
+            session.set_endpoint((bad, "key"))
+            response = self._send(bot, session, context)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(session.get_endpoint(), (ok, "key"))
+            stats = {s["api_base"]: s for s in bot.get_endpoint_stats()}
+            self.assertGreater(stats[bad]["error_rate"], 0)
+
+    def test_no_retry_on_client_error(self):
+        """测试4xx错误直接返回，不重试"""
+        bad, ok = self._server(400), self._server(200)
+        bot = DifyBot()
+        context = Context(ContextType.TEXT, "hi", kwargs=dict(dify_endpoints=[
+            {"api_base": bad, "api_key": "key"}, {"api_base": ok, "api_key": "key"}]))
+        session = DifySession("s1", "alice")
+        session.set_endpoint((bad, "key"))
+        self.assertEqual(self._send(bot, session, context).status_code, 400)
+        self.assertEqual(session.get_endpoint(), (bad, "key"))
+
+    def test_file_url_from_session_endpoint(self):
+        """测试相对路径的文件链接按会话所在节点补全，没有节点时使用应用的dify_api_base"""
+        bot = DifyBot()
+        context = Context(ContextType.TEXT, "hi", kwargs=dict(dify_api_base="http://app.local/v1"))
+        session = DifySession("s1", "alice")
+        self.assertEqual(bot._get_file_base_url(session, context), "http://app.local")
+        session.set_endpoint(("http://node-b.local/v1", "key"))
+        file_base = bot._get_file_base_url(session, context)
+        self.assertEqual(bot._fill_file_base_url("/files/a.png", file_base), "http://node-b.local/files/a.png")
+        self.assertEqual(bot._fill_file_base_url("https://cdn.local/a.png", file_base), "https://cdn.local/a.png")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import time
+import unittest
+
+from common.expired_dict import ExpiredDict
+
+
+class TestExpiredDict(unittest.TestCase):
+    def test_expire(self):
+        """测试过期的key不可读，并且在读写时被清理"""
+        d = ExpiredDict(0.05)
+        d["a"] = 1
+        self.assertEqual(d["a"], 1)
+        self.assertIn("a", d)
+        time.sleep(0.1)
+        self.assertNotIn("a", d)
+        self.assertIsNone(d.get("a"))
+        d["b"] = 2
+        time.sleep(0.1)
+        d["c"] = 3
+        self.assertEqual(len(d._data), 1)
+        self.assertEqual(d.keys(), ["c"])
+
+    def test_refresh_on_access(self):
+        """测试读取时刷新有效期，关闭刷新后按写入时间过期"""
+        refreshing = ExpiredDict(0.1)
+        fixed = ExpiredDict(0.1, refresh_on_access=False)
+        for d in (refreshing, fixed):
+            d["a"] = 1
+        for _ in range(3):
+            time.sleep(0.04)
+            refreshing.get("a")
+            fixed.get("a")
+        self.assertIn("a", refreshing)
+        self.assertNotIn("a", fixed)
+
+    def test_max_size_lru(self):
+        """测试超过max_size时淘汰最久未使用的key"""
+        d = ExpiredDict(60, max_size=2)
+        d["a"] = 1
+        d["b"] = 2
+        d["a"]
+        d["c"] = 3
+        self.assertEqual(sorted(d.keys()), ["a", "c"])
+
+    def test_mapping_interface(self):
+        """测试与原ExpiredDict一致的字典接口"""
+        d = ExpiredDict(60)
+        d["a"] = 1
+        d["b"] = 2
+        self.assertEqual(d.items(), [("a", 1), ("b", 2)])
+        self.assertEqual(list(d), ["a", "b"])
+        self.assertEqual(d.pop("a"), 1)
+        del d["b"]
+        self.assertEqual(len(d), 0)
+        d["c"] = 3
+        d.clear()
+        self.assertEqual(d.keys(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lib.gewechat import GewechatClient
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self.server.requests.append((self.client_address, self.path, self.headers.get("X-GEWE-TOKEN"), data))
+        body = json.dumps({"ret": 500 if data.get("content") == "fail" else 200, "msg": "", "data": {}}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestGewechatHttp(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = GewechatClient(f"http://127.0.0.1:{self.server.server_address[1]}/v2/api", "token")
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        """测试不同API的调用复用同一个连接并带上token"""
+        for i in range(3):
+            self.client.post_text("app", "wxid_a", f"hello {i}", "")
+        self.client.get_brief_info("app", ["wxid_a"])
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertEqual(len({address for address, _, _, _ in self.server.requests}), 1)
+        self.assertEqual(self.server.requests[0][1], "/v2/api/message/postText")
+        self.assertEqual(self.server.requests[0][2], "token")
+
+    def test_error_ret(self):
+        """测试接口返回的ret不为200时抛出RuntimeError"""
+        with self.assertRaises(RuntimeError):
+            self.client.post_text("app", "wxid_a", "fail", "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import Future
+
+from bot.dify.dify_bot import DifyBot
+from bridge.context import Context, ContextType
+from common import memory
+from config import conf
+
+
+class FakeMsg:
+    other_user_nickname = "alice"
+
+    def __init__(self, path, content):
+        self.path = path
+        self.content = content
+        self._prepared = False
+
+    def prepare(self):
+        if not self._prepared:
+            self._prepared = True
+            time.sleep(0.3)  # 模拟下载图片
+            with open(self.path, "wb") as f:
+                f.write(self.content)
+
+
+class TestImagePrefetch(unittest.TestCase):
+    KEYS = ("image_recognition", "channel_type")
+
+    def setUp(self):
+        self.saved = {k: conf()[k] for k in self.KEYS if k in conf()}
+        conf()["image_recognition"] = True
+        conf()["channel_type"] = "gewechat"
+        fd, self.path = tempfile.mkstemp(suffix=".png")
+        os.close(fd)
+        self.uploads = []
+        self.bot = DifyBot()
+        self.bot._upload_file = self._upload
+
+    def tearDown(self):
+        for k in self.KEYS:
+            if k in self.saved:
+                conf()[k] = self.saved[k]
+            else:
+                conf().pop(k, None)
+        os.remove(self.path)
+
+    def _upload(self, dify_client, path, user):
+        time.sleep(0.3)  # 模拟上传耗时
+        self.uploads.append((path, user))
+        return f"file-{dify_client.api_key}-{len(self.uploads)}"
+
+    def _image_context(self, session_id, **kwargs):
+        msg = FakeMsg(self.path, b"image-" + session_id.encode())
+        context = Context(ContextType.IMAGE, self.path, kwargs=dict(session_id=session_id, msg=msg, **kwargs))
+        memory.USER_IMAGE_CACHE[session_id] = {"path": self.path, "msg": msg}
+        return context, msg
+
+    def test_upload_started_on_receive(self):
+        """测试收到图片后立即在后台下载上传，提问时只等待已有结果"""
+        context, msg = self._image_context("s1")
+        self.bot.prefetch_image(context)
+        time.sleep(0.7)  # 用户打字的时间内已完成下载和上传
+        self.assertEqual(self.uploads, [(self.path, "alice")])
+        session = self.bot.sessions.get_session("s1", "alice")
+        start = time.monotonic()
+        files = self.bot._get_upload_files(session, Context(ContextType.TEXT, "这是什么", kwargs=dict()))
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertTrue(files[0]["upload_file_id"].endswith("-1"))
+        self.assertEqual(len(self.uploads), 1)
+        self.assertIsNone(memory.USER_IMAGE_CACHE.get("s1"))
+
+    def test_prefetch_failure_uploads_again(self):
+        """测试后台上传失败时提问时同步上传，内容相同的图片命中上传缓存"""
+        context, msg = self._image_context("s3")
+        self.bot.prefetch_image(context)
+        uploaded = memory.USER_IMAGE_CACHE["s3"]["upload_future"].result()
+        failed = Future()
+        failed.set_exception(ConnectionError("upload failed"))
+        memory.USER_IMAGE_CACHE["s3"]["upload_future"] = failed
+        session = self.bot.sessions.get_session("s3", "alice")
+        files = self.bot._get_upload_files(session, Context(ContextType.TEXT, "这是什么", kwargs=dict()))
+        self.assertEqual(files[0]["upload_file_id"], uploaded)
+
+    def test_other_app_uploads_again(self):
+        """测试提问时插件选择了其他dify应用，图片重新上传到该应用"""
+        context, msg = self._image_context("s2", dify_api_key="key-a")
+        self.bot.prefetch_image(context)
+        prefetch = memory.USER_IMAGE_CACHE["s2"]["upload_future"]
+        session = self.bot.sessions.get_session("s2", "alice")
+        start = time.monotonic()
+        files = self.bot._get_upload_files(session, Context(ContextType.TEXT, "这是什么", kwargs=dict(dify_api_key="key-b")))
+        self.assertLess(time.monotonic() - start, 0.5)  # 不等待上传到原应用的结果
+        self.assertTrue(files[0]["upload_file_id"].startswith("file-key-b-"))
+        prefetch.result()
+        self.assertEqual(len(self.uploads), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import time
+import unittest
+
+from bridge.context import Context, ContextType
+from channel.message_coalescer import MessageCoalescer
+
+
+class FakeMsg:
+    def __init__(self, user_id):
+        self.from_user_id = user_id
+        self.actual_user_id = user_id
+
+
+def new_context(ctype, content, session_id="s1", user_id="u1"):
+    context = Context(ctype, content, kwargs=dict())
+    context["session_id"] = session_id
+    context["msg"] = FakeMsg(user_id)
+    return context
+
+
+class TestMessageCoalescer(unittest.TestCase):
+    def setUp(self):
+        self.flushed = []
+        self.coalescer = MessageCoalescer(0.1, self.flushed.append)
+
+    def test_merge_burst(self):
+        """测试窗口内的连续文本消息合并为一条"""
+        for content in ["你好", "在吗", "问个问题"]:
+            self.assertTrue(self.coalescer.offer(new_context(ContextType.TEXT, content)))
+        self.assertEqual(self.flushed, [])
+        time.sleep(0.3)
+        self.assertEqual(len(self.flushed), 1)
+        self.assertEqual(self.flushed[0].content, "你好\n在吗\n问个问题")
+
+    def test_bypass_flushes_pending(self):
+        """测试管理命令和图片不参与合并，并先放行已缓存的消息"""
+        self.assertTrue(self.coalescer.offer(new_context(ContextType.TEXT, "你好")))
+        self.assertFalse(self.coalescer.offer(new_context(ContextType.TEXT, "#reset")))
+        self.assertEqual([c.content for c in self.flushed], ["你好"])
+        self.assertFalse(self.coalescer.offer(new_context(ContextType.IMAGE, "/tmp/a.png")))
+
+    def test_different_sender_not_merged(self):
+        """测试共享会话中不同用户的消息不合并"""
+        self.coalescer.offer(new_context(ContextType.TEXT, "a", user_id="u1"))
+        self.coalescer.offer(new_context(ContextType.TEXT, "b", user_id="u2"))
+        time.sleep(0.3)
+        self.assertEqual([c.content for c in self.flushed], ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import time
+import unittest
+
+from channel.message_prefilter import MessagePreFilter
+from config import conf
+
+
+class TestMessagePreFilter(unittest.TestCase):
+    def setUp(self):
+        self.white_list = conf().get("group_name_white_list")
+        self.keyword_white_list = conf().get("group_name_keyword_white_list")
+
+    def tearDown(self):
+        conf()["group_name_white_list"] = self.white_list
+        conf()["group_name_keyword_white_list"] = self.keyword_white_list
+
+    def test_group_white_list(self):
+        """测试群名白名单和关键词白名单，群名未知时无法判断"""
+        conf()["group_name_white_list"] = ["测试群"]
+        conf()["group_name_keyword_white_list"] = ["AI", "a.b"]
+        prefilter = MessagePreFilter("test")
+        self.assertTrue(prefilter.group_allowed("测试群"))
+        self.assertTrue(prefilter.group_allowed("我的AI群"))
+        self.assertTrue(prefilter.group_allowed("xa.by"))
+        self.assertFalse(prefilter.group_allowed("axby"))  # 关键词按字面匹配
+        self.assertFalse(prefilter.group_allowed("闲聊群"))
+        self.assertIsNone(prefilter.group_allowed(None))
+
+    def test_rules_reloaded(self):
+        """测试白名单修改后重新编译，ALL_GROUP放行所有群"""
+        conf()["group_name_white_list"] = []
+        conf()["group_name_keyword_white_list"] = []
+        prefilter = MessagePreFilter("test")
+        self.assertFalse(prefilter.group_allowed("闲聊群"))
+        conf()["group_name_white_list"] = ["ALL_GROUP"]
+        self.assertTrue(prefilter.group_allowed("闲聊群"))
+        self.assertTrue(prefilter.group_allowed(None))
+
+    def test_expired_and_stats(self):
+        """测试消息过期判断和丢弃计数"""
+        prefilter = MessagePreFilter("test")
+        self.assertTrue(prefilter.is_expired(int(time.time()) - 400, 300))
+        self.assertFalse(prefilter.is_expired(int(time.time()), 300))
+        self.assertFalse(prefilter.is_expired(None, 300))
+        prefilter.drop("expired")
+        prefilter.drop("expired")
+        self.assertEqual(prefilter.stats()["dropped"], {"expired": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
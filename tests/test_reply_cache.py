@@ -0,0 +1,143 @@
+import tempfile
+import time
+import unittest
+
+from bot.bot import Bot
+from bridge.bridge import Bridge
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from common import memory
+from common.reply_cache import ReplyCache
+from config import conf
+
+
+class FakeBot(Bot):
+    def __init__(self):
+        self.calls = 0
+        self.stateful = set()
+
+    def get_reply_cache_scope(self, context):
+        if context["session_id"] in self.stateful:
+            return None
+        return "app"
+
+    def reply(self, query, context=None):
+        self.calls += 1
+        if query == "出错":
+            context["reply_cache_bypass"] = True
+        # 与DifyBot一样，群聊中直接发送的文字消息前@提问者
+        prefix = "@" + context["msg"].actual_user_nickname + "\n" if context.get("isgroup", False) else ""
+        context["channel"].send(Reply(ReplyType.TEXT, prefix + "第一段"), context)
+        return Reply(ReplyType.TEXT, f"第二段{self.calls}")
+
+
+class FakeMsg:
+    def __init__(self, nickname):
+        self.actual_user_nickname = nickname
+
+
+class RecordingChannel:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reply, context):
+        self.sent.append(reply.content)
+
+
+class TestReplyCache(unittest.TestCase):
+    def test_normalize(self):
+        """测试忽略大小写、多余空白和句尾标点"""
+        self.assertEqual(ReplyCache.normalize("  How do I  reset PASSWORD？ "), "how do i reset password")
+        self.assertEqual(ReplyCache.normalize("如何重置密码。。"), ReplyCache.normalize("如何重置密码"))
+
+    def test_lru_and_ttl(self):
+        """测试超过容量淘汰最久未命中的条目，过期条目不再返回"""
+        cache = ReplyCache("test", ttl=0.2, max_size=2)
+        for key in ("a", "b"):
+            cache.put(key, [Reply(ReplyType.TEXT, key)])
+        cache.get("a")
+        cache.put("c", [Reply(ReplyType.TEXT, "c")])
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a")[0].content, "a")
+        time.sleep(0.25)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_file_reply_not_cached(self):
+        """测试包含本地文件的回复不缓存"""
+        cache = ReplyCache("test")
+        self.assertFalse(cache.put("k", [Reply(ReplyType.FILE, "/tmp/a.pdf"), Reply(ReplyType.TEXT, "见附件")]))
+        self.assertFalse(cache.put("k", [Reply(ReplyType.ERROR, "出错了")]))
+        self.assertIsNone(cache.get("k"))
+
+
+class TestBridgeReplyCache(unittest.TestCase):
+    KEYS = ("reply_cache_enabled", "appdata_dir")
+
+    def setUp(self):
+        self.saved = {k: conf()[k] for k in self.KEYS if k in conf()}
+        conf()["reply_cache_enabled"] = True
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        conf()["appdata_dir"] = self.tmp_dir.name
+        self.bridge = Bridge()
+        self.bridge.reply_cache.clear()
+        self.bot = FakeBot()
+        self.saved_bot = self.bridge.bots.get("chat")
+        self.bridge.bots["chat"] = self.bot
+
+    def tearDown(self):
+        for k in self.KEYS:
+            if k in self.saved:
+                conf()[k] = self.saved[k]
+            else:
+                conf().pop(k, None)
+        self.tmp_dir.cleanup()
+        self.bridge.bots["chat"] = self.saved_bot
+        self.bridge.reply_cache.clear()
+
+    def _ask(self, query, session_id, context_type=ContextType.TEXT, nickname=None):
+        channel = RecordingChannel()
+        kwargs = dict(session_id=session_id, channel=channel)
+        if nickname:
+            kwargs.update(isgroup=True, msg=FakeMsg(nickname))
+        context = Context(context_type, query, kwargs=kwargs)
+        reply = self.bridge.fetch_reply_content(query, context)
+        self.assertIs(context["channel"], channel)
+        return channel.sent + [reply.content]
+
+    def test_hit_replays_all_messages(self):
+        """测试不同群问相同问题时命中缓存，重放bot直接发送的消息"""
+        hits = self.bridge.reply_cache.stats()["hits"]
+        self.assertEqual(self._ask("如何重置密码？", "group-a"), ["第一段", "第二段1"])
+        self.assertEqual(self._ask("如何重置密码", "group-b"), ["第一段", "第二段1"])
+        self.assertEqual(self.bot.calls, 1)
+        self.assertEqual(self.bridge.reply_cache.stats()["hits"], hits + 1)
+
+    def test_group_hit_mentions_current_user(self):
+        """测试群聊命中其他用户的缓存时@当前提问者，私聊命中时不带@"""
+        self.assertEqual(self._ask("如何重置密码", "group-a", nickname="alice"), ["@alice\n第一段", "第二段1"])
+        self.assertEqual(self._ask("如何重置密码", "group-b", nickname="bob"), ["@bob\n第一段", "第二段1"])
+        self.assertEqual(self._ask("如何重置密码", "user-c"), ["第一段", "第二段1"])
+        self.assertEqual(self.bot.calls, 1)
+
+    def test_bypass(self):
+        """测试有状态的会话、待识别的图片和错误回复不使用缓存"""
+        self.bot.stateful.add("group-a")
+        self._ask("如何重置密码", "group-a")
+        self._ask("如何重置密码", "group-a")
+        self.assertEqual(self.bot.calls, 2)
+        memory.USER_IMAGE_CACHE["group-b"] = {"path": "a.png", "msg": None}
+        try:
+            self._ask("这是什么", "group-b")
+            self._ask("这是什么", "group-b")
+        finally:
+            memory.USER_IMAGE_CACHE["group-b"] = None
+        self.assertEqual(self.bot.calls, 4)
+        self._ask("出错", "group-c")
+        self._ask("出错", "group-c")
+        self.assertEqual(self.bot.calls, 6)
+        self.assertEqual(self.bridge.reply_cache.stats()["size"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
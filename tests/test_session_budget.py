@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from bot.session_manager import Session
+from common.expired_dict import ExpiredDict
+from common.session_budget import SessionBudget, TrackedSessionDict, estimate_size
+from common.session_store import PersistentSessionDict, SqliteSessionStore
+
+
+def make_session(session_id, turns):
+    session = Session(session_id, system_prompt="")
+    for i in range(turns):
+        session.add_query("问" * 100)
+        session.add_reply("答" * 100)
+    return session
+
+
+class TestSessionBudget(unittest.TestCase):
+    def test_evict_lru_across_managers(self):
+        """测试超过预算时跨会话管理器淘汰最久未使用的会话"""
+        size = estimate_size(make_session("x", 5))
+        budget = SessionBudget(max_bytes=size * 3)
+        chat = TrackedSessionDict("ChatGPTSession", dict(), budget)
+        dify = TrackedSessionDict("DifySession", ExpiredDict(3600), budget)
+        chat["a"] = make_session("a", 5)
+        dify["b"] = make_session("b", 5)
+        chat["c"] = make_session("c", 5)
+        chat["a"]  # a最近被访问过
+        dify["d"] = make_session("d", 5)
+        self.assertEqual(budget.enforce(), 1)
+        self.assertNotIn("b", dify)
+        self.assertEqual(set(chat), {"a", "c"})
+        stats = budget.stats()
+        self.assertEqual(stats["sessions"], 3)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertLessEqual(stats["usage_bytes"], size * 3)
+        self.assertEqual({m["name"]: m["sessions"] for m in stats["managers"]}, {"ChatGPTSession": 2, "DifySession": 1})
+
+    def test_grown_session_measured_again(self):
+        """测试会话被访问后增长的内容会计入占用，未设置预算时只统计不淘汰"""
+        budget = SessionBudget()
+        chat = TrackedSessionDict("ChatGPTSession", dict(), budget)
+        chat["a"] = make_session("a", 1)
+        budget.enforce()
+        before = budget.stats()["usage_bytes"]
+        chat["a"].add_query("问" * 1000)
+        budget.enforce()
+        self.assertGreater(budget.stats()["usage_bytes"], before + 1000)
+        del chat["a"]
+        budget.enforce()
+        self.assertEqual(budget.stats()["sessions"], 0)
+
+    def test_measure_error_retried(self):
+        """测试会话正在被修改导致估算失败时沿用上次的大小，不影响其他会话，下次统计时重试"""
+        budget = SessionBudget()
+        chat = TrackedSessionDict("ChatGPTSession", dict(), budget)
+        chat["a"] = make_session("a", 1)
+        chat["b"] = make_session("b", 1)
+        budget.enforce()
+        before = budget.stats()["usage_bytes"]
+        chat["a"].add_query("问" * 1000)
+        with mock.patch("common.session_budget.estimate_size", side_effect=RuntimeError("deque mutated during iteration")):
+            budget.enforce()
+        self.assertEqual(budget.stats()["usage_bytes"], before)
+        self.assertEqual(budget.stats()["sessions"], 2)
+        budget.enforce()
+        self.assertGreater(budget.stats()["usage_bytes"], before + 1000)
+
+    def test_persistent_sessions_reloaded(self):
+        """测试开启会话存储时被淘汰的会话只释放内存，再次访问时重新加载"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = SqliteSessionStore(os.path.join(tmp_dir, "sessions.db"))
+            budget = SessionBudget(max_bytes=1)
+            sessions = TrackedSessionDict("Session", PersistentSessionDict("Session", store), budget)
+            sessions["a"] = make_session("a", 2)
+            budget.enforce()
+            self.assertEqual(len(sessions), 0)
+            self.assertEqual(len(sessions["a"].messages), 4)
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
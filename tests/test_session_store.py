@@ -0,0 +1,107 @@
+import os
+import tempfile
+import time
+import unittest
+
+from bot.dify.dify_session import DifySession, DifySessionManager
+from common import session_store
+from common.session_store import PersistentSessionDict, SqliteSessionStore
+from config import conf
+
+
+class TestPersistentSessionDict(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "sessions.db")
+        self.store = SqliteSessionStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def _restart(self, sessions, **kwargs):
+        """模拟bot进程重启：写入未保存的会话，用新的存储连接创建会话字典"""
+        sessions.flush()
+        self.store.close()
+        self.store = SqliteSessionStore(self.path)
+        return PersistentSessionDict("DifySession", self.store, **kwargs)
+
+    def test_sessions_survive_restart(self):
+        """测试会话在原地修改后由后台写入，重启后从存储中加载"""
+        sessions = PersistentSessionDict("DifySession", self.store)
+        sessions["s1"] = DifySession("s1", "alice")
+        sessions["s1"].set_conversation_id("conv-1")
+        sessions = self._restart(sessions)
+        self.assertEqual(len(sessions), 0)  # 懒加载，启动时不读取全部会话
+        self.assertEqual(sessions["s1"].get_conversation_id(), "conv-1")
+        self.assertNotIn("s2", sessions)
+        other = PersistentSessionDict("CozeSession", self.store)
+        self.assertNotIn("s1", other)
+
+    def test_hot_tier_bounded(self):
+        """测试内存中只保留最近使用的会话，淘汰的会话访问时重新加载"""
+        sessions = PersistentSessionDict("DifySession", self.store, max_size=2)
+        for i in range(5):
+            sessions[f"s{i}"] = DifySession(f"s{i}", "alice")
+        self.assertEqual(len(sessions), 2)
+        sessions["s0"].set_conversation_id("conv-0")  # 尚未写入存储，从待写入列表中取回
+        sessions.flush()
+        for i in range(1, 5):
+            self.assertIn(f"s{i}", sessions)
+        self.assertEqual(sessions["s0"].get_conversation_id(), "conv-0")
+
+    def test_delete_and_clear(self):
+        """测试删除的会话在重启后不会恢复"""
+        sessions = PersistentSessionDict("DifySession", self.store)
+        sessions["s1"] = DifySession("s1", "alice")
+        sessions["s2"] = DifySession("s2", "bob")
+        sessions.flush()
+        del sessions["s1"]
+        self.assertNotIn("s1", sessions)
+        sessions = self._restart(sessions)
+        self.assertNotIn("s1", sessions)
+        self.assertIn("s2", sessions)
+        sessions.clear()
+        self.assertNotIn("s2", self._restart(sessions))
+
+    def test_expired_sessions(self):
+        """测试超过过期时间未访问的会话不再加载"""
+        sessions = PersistentSessionDict("DifySession", self.store, expires_in_seconds=0.2)
+        sessions["s1"] = DifySession("s1", "alice")
+        sessions.flush()
+        time.sleep(0.3)
+        self.assertNotIn("s1", sessions)
+        self.assertNotIn("s1", self._restart(sessions, expires_in_seconds=0.2))
+
+
+class TestSessionManagerStore(unittest.TestCase):
+    KEYS = ("session_store", "appdata_dir")
+
+    def setUp(self):
+        self.saved = {k: conf()[k] for k in self.KEYS if k in conf()}
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        conf()["session_store"] = "sqlite"
+        conf()["appdata_dir"] = self.tmp_dir.name
+        session_store._store = None
+
+    def tearDown(self):
+        for k in self.KEYS:
+            if k in self.saved:
+                conf()[k] = self.saved[k]
+            else:
+                conf().pop(k, None)
+        session_store._store.close()
+        session_store._store = None
+        self.tmp_dir.cleanup()
+
+    def test_dify_conversation_kept_after_restart(self):
+        """测试开启sqlite会话存储后，重启bot继续使用原来的dify会话"""
+        manager = DifySessionManager(DifySession)
+        manager.get_session("s1", "alice").set_conversation_id("conv-1")
+        session_store.flush_session_stores()
+        manager = DifySessionManager(DifySession)
+        self.assertEqual(manager.get_session("s1", "alice").get_conversation_id(), "conv-1")
+
+
+if __name__ == "__main__":
+    unittest.main()
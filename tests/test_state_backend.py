@@ -0,0 +1,229 @@
+import fnmatch
+import socket
+import socketserver
+import threading
+import time
+import unittest
+from unittest import mock
+
+from bot.session_manager import Session
+from common.session_store import PersistentSessionDict, StateSessionStore
+from common.state_backend import DedupeSet, MemoryStateBackend, RedisStateBackend, StateBackendError, _RespConnection
+from common.token_bucket import SharedTokenBucket
+
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """测试用的Redis协议服务，只实现状态存储用到的命令，所有命令在同一把锁内执行"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        super().__init__(("127.0.0.1", 0), FakeRedisHandler)
+        self.password = password
+        self.data = {}  # key -> (value, expiry_time)
+        self.lock = threading.Lock()
+        self.connections = set()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        auth = ":{}@".format(self.password) if self.password else ""
+        return "redis://{}127.0.0.1:{}/1".format(auth, self.server_address[1])
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.close_connections()
+
+    def close_connections(self):
+        for conn in list(self.connections):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def get(self, key):
+        item = self.data.get(key)
+        if item is None or (item[1] is not None and item[1] < time.monotonic()):
+            self.data.pop(key, None)
+            return None
+        return item[0]
+
+    def execute(self, args):
+        cmd = args[0].upper()
+        if cmd in (b"PING", b"SELECT"):
+            return "+OK"
+        if cmd == b"AUTH":
+            return "+OK" if args[1].decode() == self.password else "-ERR invalid password"
+        if cmd == b"GET":
+            return self.get(args[1])
+        if cmd == b"SET":
+            options = [arg.upper() for arg in args[3:]]
+            if b"NX" in options and self.get(args[1]) is not None:
+                return None
+            expiry_time = None
+            if b"PX" in options:
+                expiry_time = time.monotonic() + int(args[3 + options.index(b"PX") + 1]) / 1000
+            self.data[args[1]] = (args[2], expiry_time)
+            return "+OK"
+        if cmd == b"DEL":
+            return sum(self.data.pop(key, None) is not None for key in args[1:])
+        if cmd == b"INCR":
+            value = int(self.get(args[1]) or 0) + 1
+            self.data[args[1]] = (str(value).encode(), self.data.get(args[1], (None, None))[1])
+            return value
+        if cmd == b"PEXPIRE":
+            if self.get(args[1]) is None:
+                return 0
+            self.data[args[1]] = (self.data[args[1]][0], time.monotonic() + int(args[2]) / 1000)
+            return 1
+        if cmd == b"SCAN":
+            pattern = args[args.index(b"MATCH") + 1].decode()
+            return [b"0", [key for key in list(self.data) if self.get(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern)]]
+        return "-ERR unknown command"
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.server.connections.add(self.connection)
+
+    def finish(self):
+        self.server.connections.discard(self.connection)
+        super().finish()
+
+    def handle(self):
+        queued = None
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            cmd = args[0].upper()
+            if cmd == b"MULTI":
+                queued = []
+                self.write("+OK")
+            elif cmd == b"EXEC":
+                with self.server.lock:
+                    self.write([self.server.execute(queued_args) for queued_args in queued])
+                queued = None
+            elif queued is not None:
+                queued.append(args)
+                self.write("+QUEUED")
+            else:
+                with self.server.lock:
+                    self.write(self.server.execute(args))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def write(self, reply):
+        self.wfile.write(self.encode(reply))
+
+    def encode(self, reply):
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, str):
+            return reply.encode() + b"\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        return b"*%d\r\n" % len(reply) + b"".join(self.encode(item) for item in reply)
+
+
+class TestRedisStateBackend(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeRedisServer(password="secret")
+        self.addCleanup(self.server.stop)
+        # 两个副本各自连接同一个Redis
+        self.replicas = [RedisStateBackend(self.server.url, prefix="dow:") for _ in range(2)]
+
+    def test_dedupe_across_replicas(self):
+        """测试多个副本同时收到同一条消息时只有一个副本处理"""
+        accepted = []
+        barrier = threading.Barrier(8)
+
+        def receive(backend):
+            barrier.wait()
+            accepted.append(DedupeSet("wechatcom", 60, backend).add("msg-1"))
+
+        threads = [threading.Thread(target=receive, args=(self.replicas[i % 2],)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(accepted.count(True), 1)
+        self.assertTrue(all(key.startswith(b"dow:dedupe:wechatcom:") for key in self.server.data))
+
+    def test_rate_limit_across_replicas(self):
+        """测试多个副本共用调用频率限制，合计不超过每个窗口的上限"""
+        buckets = [SharedTokenBucket("chatgpt", 5, timeout=0, window=3600, backend=backend) for backend in self.replicas]
+        results = [buckets[i % 2].get_token() for i in range(9)]
+        self.assertEqual(results.count(True), 5)
+        self.assertFalse(buckets[0].get_token())
+
+    def test_session_continues_on_other_replica(self):
+        """测试一个副本写入的会话可以在另一个副本继续，重置会话后其他副本也不再使用旧会话"""
+        stores = [StateSessionStore(backend) for backend in self.replicas]
+        a = PersistentSessionDict("Session", stores[0], expires_in_seconds=3600)
+        b = PersistentSessionDict("Session", stores[1], expires_in_seconds=3600)
+        session = Session("u1", system_prompt="")
+        session.add_query("你好")
+        a["u1"] = session
+        a.flush()
+        b["u1"].add_reply("你好，有什么可以帮你")
+        b.flush()
+        self.assertEqual(len(a["u1"].messages), 2)
+        del a["u1"]
+        a.flush()
+        b.flush()
+        self.assertNotIn("u1", b)
+        stores[0].clear("Session")
+        self.assertEqual(self.server.data, {})
+
+    def test_reconnect_and_errors(self):
+        """测试连接断开后自动重连，Redis不可用时去重和限流不影响消息处理"""
+        backend = self.replicas[0]
+        self.assertEqual(backend.incr("n", ttl=60), 1)
+        self.server.close_connections()  # 如Redis重启，连接池中的连接失效
+        self.assertEqual(backend.incr("n", ttl=60), 2)
+        self.server.stop()
+        self.assertRaises(StateBackendError, backend.get, "n")
+        self.assertTrue(DedupeSet("test", 60, backend).add("m"))
+        self.assertTrue(SharedTokenBucket("test", 1, timeout=0, backend=backend).get_token())
+
+    def test_wrong_password(self):
+        """测试密码错误时抛出StateBackendError，并关闭认证失败的连接"""
+        backend = RedisStateBackend(self.server.url.replace("secret", "wrong"))
+        with mock.patch.object(_RespConnection, "close", autospec=True, side_effect=_RespConnection.close) as close:
+            for _ in range(3):
+                self.assertRaises(StateBackendError, backend.get, "n")
+        self.assertEqual(close.call_count, 3)
+
+
+class TestMemoryStateBackend(unittest.TestCase):
+    def test_atomic_operations(self):
+        """测试进程内实现的去重、计数和过期"""
+        backend = MemoryStateBackend()
+        dedupe = DedupeSet("test", 0.05, backend)
+        self.assertTrue(dedupe.add(1))
+        self.assertFalse(dedupe.add(1))
+        self.assertEqual([backend.incr("n", ttl=60) for _ in range(3)], [1, 2, 3])
+        time.sleep(0.1)
+        self.assertTrue(dedupe.add(1))
+        dedupe.discard(1)
+        self.assertTrue(dedupe.add(1))
+        backend.set_many({"session:a:1": b"x", "session:a:2": b"y", "session:b:1": b"z"})
+        self.assertEqual(sorted(backend.scan_keys("session:a:")), ["session:a:1", "session:a:2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
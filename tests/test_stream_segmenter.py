@@ -0,0 +1,95 @@
+import json
+import unittest
+
+from bot.dify.dify_bot import DifyBot
+from bot.dify.dify_session import DifySession
+from bridge.context import Context, ContextType
+from bridge.reply import ReplyType
+from common.stream_segmenter import StreamSegmenter
+from config import conf
+
+
+class FakeResponse:
+    def __init__(self, events):
+        self.lines = [("data: " + json.dumps(event)).encode("utf-8") for event in events]
+
+    def iter_lines(self):
+        for line in self.lines:
+            yield line
+            yield b""
+
+
+class RecordingChannel:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, reply, context):
+        self.sent.append(reply)
+
+
+class TestStreamSegmenter(unittest.TestCase):
+    def test_split_at_paragraph(self):
+        """测试达到最短长度后在段落处切分"""
+        segmenter = StreamSegmenter(min_length=10)
+        self.assertEqual(segmenter.feed("第一段很短\n\n"), [])
+        self.assertEqual(segmenter.feed("还是第一段的内容。\n\n第二段"), ["第一段很短\n\n还是第一段的内容。"])
+        self.assertEqual(segmenter.flush(), "第二段")
+
+    def test_split_at_sentence_when_too_long(self):
+        """测试没有段落时，积累过长后在最后一个句末切分"""
+        segmenter = StreamSegmenter(min_length=5, max_length=20)
+        self.assertEqual(segmenter.feed("一二三四五六。七八九十"), [])
+        self.assertEqual(segmenter.feed("一二三四五六七。八九十"), ["一二三四五六。七八九十一二三四五六七。"])
+        self.assertEqual(segmenter.flush(), "八九十")
+
+    def test_not_split_inside_link_or_code(self):
+        """测试不在markdown链接和代码块中间切分"""
+        segmenter = StreamSegmenter(min_length=3, max_length=6)
+        self.assertEqual(segmenter.feed("看文件[年度报告。最终"), [])
+        self.assertEqual(segmenter.feed("版](/f.pdf)"), [])
+        self.assertEqual(segmenter.feed("。后面"), ["看文件[年度报告。最终版](/f.pdf)。"])
+        segmenter = StreamSegmenter(min_length=5)
+        self.assertEqual(segmenter.feed("```\ncode\n\nmore\n```"), [])
+        self.assertEqual(segmenter.feed("\n\n结尾"), ["```\ncode\n\nmore\n```"])
+
+
+class TestDifyStreamReply(unittest.TestCase):
+    KEYS = ("dify_conversation_rollover",)
+
+    def setUp(self):
+        self.saved = {k: conf()[k] for k in self.KEYS if k in conf()}
+        conf()["dify_conversation_rollover"] = True
+
+    def tearDown(self):
+        for k in self.KEYS:
+            if k in self.saved:
+                conf()[k] = self.saved[k]
+            else:
+                conf().pop(k, None)
+
+    def test_stream_reply(self):
+        """测试流式回复逐段发送，群聊加@前缀，最后一段作为回复返回"""
+        bot = DifyBot()
+        channel = RecordingChannel()
+        msg = type("Msg", (), {"actual_user_nickname": "张三"})()
+        context = Context(ContextType.TEXT, "hi", kwargs=dict())
+        context["channel"] = channel
+        context["isgroup"] = True
+        context["msg"] = msg
+        context["dify_stream_segment_length"] = 5
+        session = DifySession("s1", "user")
+        answer = ["第一段内容", "。\n\n第二段", "内容。\n\n最后"]
+        events = [{"event": "message", "conversation_id": "c1", "answer": a} for a in answer]
+        events.append({"event": "message_end", "conversation_id": "c1", "metadata": {"usage": {}}})
+        reply, err = bot._handle_chatbot_stream(FakeResponse(events), session, context)
+        self.assertIsNone(err)
+        self.assertEqual([r.content for r in channel.sent], ["@张三\n第一段内容。", "@张三\n第二段内容。"])
+        self.assertEqual(reply.type, ReplyType.TEXT)
+        self.assertEqual(reply.content, "最后")
+        self.assertEqual(session.get_conversation_id(), "c1")
+        # 会话记录的是原始回答，不因分段丢失或增加换行
+        self.assertEqual(session._history[-1], ("assistant", "".join(answer)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from common.upload_cache import UploadCache
+
+
+class TestUploadCache(unittest.TestCase):
+    def setUp(self):
+        self.files = []
+
+    def tearDown(self):
+        for path in self.files:
+            os.remove(path)
+
+    def _write(self, content):
+        fd, path = tempfile.mkstemp(suffix=".png")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        self.files.append(path)
+        return path
+
+    def test_same_content_uploaded_once(self):
+        """测试内容相同的文件对同一目标只上传一次，不同目标分别上传"""
+        uploads = []
+
+        def upload(path):
+            uploads.append(path)
+            return f"file-{len(uploads)}"
+
+        cache = UploadCache("test", 60)
+        a, b = self._write(b"meme"), self._write(b"meme")
+        self.assertEqual(cache.get_or_upload(a, ("base", "key", "u1"), upload), "file-1")
+        self.assertEqual(cache.get_or_upload(b, ("base", "key", "u1"), upload), "file-1")
+        self.assertEqual(cache.get_or_upload(b, ("base", "key", "u2"), upload), "file-2")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 2, 2))
+
+    def test_failed_upload_not_cached(self):
+        """测试上传失败时不缓存，下次重新上传"""
+        results = [None, "file-1"]
+        cache = UploadCache("test", 60)
+        path = self._write(b"poster")
+        self.assertIsNone(cache.get_or_upload(path, "target", lambda p: results.pop(0)))
+        self.assertEqual(cache.get_or_upload(path, "target", lambda p: results.pop(0)), "file-1")
+
+
+if __name__ == "__main__":
+    unittest.main()